@@ -3,23 +3,39 @@ from flask_migrate import Migrate
 
 from env_vars import PG_DB_USERNAME, PG_DB_PASSWORD, PG_DB_NAME, PG_DB_HOSTNAME, FLAKS_APP_SECRET_KEY
 from persistance.models import db
-from routes.app_router import app_blueprint
-from routes.google_router import google_blueprint
-from routes.slack_router import slack_blueprint
-
-app = Flask(__name__)
-app.secret_key = FLAKS_APP_SECRET_KEY
-
-# Configure all the blueprints
-app.register_blueprint(app_blueprint, url_prefix='/app')
-app.register_blueprint(slack_blueprint, url_prefix='/slack')
-app.register_blueprint(google_blueprint, url_prefix='/google')
-
-# Configure postgres db
-app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://{PG_DB_USERNAME}:{PG_DB_PASSWORD}@{PG_DB_HOSTNAME}/{PG_DB_NAME}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-migrate = Migrate(app, db)
+from utils.metrics import instrument_flask_app
+
+migrate = Migrate()
+
+
+def create_app(config_overrides: dict = None):
+    # Blueprints are imported here, heavy clients (pandas, boto3, google and slack sdks) are only imported by the
+    # handlers that use them
+    from routes.app_router import app_blueprint
+    from routes.google_router import google_blueprint
+    from routes.slack_router import slack_blueprint
+
+    flask_app = Flask(__name__)
+    flask_app.secret_key = FLAKS_APP_SECRET_KEY
+
+    # Configure all the blueprints
+    flask_app.register_blueprint(app_blueprint, url_prefix='/app')
+    flask_app.register_blueprint(slack_blueprint, url_prefix='/slack')
+    flask_app.register_blueprint(google_blueprint, url_prefix='/google')
+
+    # Configure postgres db
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = \
+        f'postgresql://{PG_DB_USERNAME}:{PG_DB_PASSWORD}@{PG_DB_HOSTNAME}/{PG_DB_NAME}'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config_overrides:
+        flask_app.config.update(config_overrides)
+    db.init_app(flask_app)
+    migrate.init_app(flask_app, db)
+    instrument_flask_app(flask_app)
+    return flask_app
+
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=False)
@@ -0,0 +1,299 @@
+"""
+Local stand-ins for the Slack, Sentry and New Relic endpoints the scrapers page through, for the benchmarks.
+
+One threaded HTTP/1.1 server answers all three APIs. Each serves `total_rows` rows spread evenly over
+[oldest_epoch, latest_epoch), newest first for Slack and Sentry as the real APIs do, with their pagination:
+Slack cursors, Sentry `Link` headers with `results` and New Relic page numbers with `next` and `last` links.
+Pages are generated on request, so a million rows never sit in the server's memory. Every response can be delayed
+by `latency_seconds` and every `rate_limit_every`-th request answered with a 429 and a Retry-After header.
+
+    Slack       {base_url}/api/conversations.history, {base_url}/api/conversations.info
+    Sentry      {base_url}/api/0/projects/<organization>/<project>/events/
+    New Relic   {base_url}/v2/alerts_violations.json
+"""
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+SLACK_MAX_PAGE_SIZE = 1000
+SENTRY_PAGE_SIZE = 100
+NEW_RELIC_PAGE_SIZE = 200
+
+SLACK_TEAM_ID = 'T0BENCH01'
+SLACK_CHANNEL_NAME = 'benchmark'
+SENTRY_EVENTS_PATH = re.compile(r'^/api/0/projects/(?P<organization>[^/]+)/(?P<project>[^/]+)/events/$')
+
+
+def format_sentry_datetime(epoch: float):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_new_relic_date(value: str):
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class FakeApiServer:
+    def __init__(self, total_rows: int, oldest_epoch: float, latest_epoch: float, latency_seconds: float = 0.0,
+                 rate_limit_every: int = 0, retry_after_seconds: int = 0):
+        self.total_rows = total_rows
+        self.oldest_epoch = oldest_epoch
+        self.latest_epoch = latest_epoch
+        self.latency_seconds = latency_seconds
+        self.rate_limit_every = rate_limit_every
+        self.retry_after_seconds = retry_after_seconds
+        # Row i, 0 being the newest, sits at latest_epoch - (i + 1) * step
+        self.step_seconds = (latest_epoch - oldest_epoch) / (total_rows + 1)
+        self.requests = Counter()
+        self.rate_limited = Counter()
+        self.__request_number = 0
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), self.__get_handler_class())
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='fake-api-server', daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.__server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_stats(self):
+        with self.__lock:
+            return {'requests': dict(self.requests), 'rate_limited': dict(self.rate_limited)}
+
+    def get_row_epoch(self, index: int):
+        return self.latest_epoch - (index + 1) * self.step_seconds
+
+    def should_rate_limit(self, route: str):
+        with self.__lock:
+            self.requests[route] += 1
+            self.__request_number += 1
+            if self.rate_limit_every and self.__request_number % self.rate_limit_every == 0:
+                self.rate_limited[route] += 1
+                return True
+        return False
+
+    def get_slack_conversations_history(self, params: dict):
+        offset = int(params.get('cursor') or 0)
+        limit = min(int(params.get('limit') or 100), SLACK_MAX_PAGE_SIZE)
+        # Honour latest and oldest the way Slack does, both exclusive
+        latest = float(params.get('latest') or self.latest_epoch)
+        oldest = float(params.get('oldest') or 0)
+        first_index = max(offset, math.floor((self.latest_epoch - latest) / self.step_seconds))
+        while first_index < self.total_rows and self.get_row_epoch(first_index) >= latest:
+            first_index += 1
+        messages = []
+        index = first_index
+        while index < self.total_rows and len(messages) < limit:
+            ts = self.get_row_epoch(index)
+            if ts <= oldest:
+                break
+            messages.append(self.get_slack_message(index, ts))
+            index += 1
+        has_more = index < self.total_rows and self.get_row_epoch(index) > oldest
+        return {
+            'ok': True,
+            'messages': messages,
+            'has_more': has_more,
+            'pin_count': 0,
+            'response_metadata': {'next_cursor': str(index) if has_more else ''},
+        }
+
+    def get_slack_message(self, index: int, ts: float):
+        message = {
+            'type': 'message',
+            'user': f'U{index % 50:08d}',
+            'text': f'Deploy {index} of checkout-service finished, p95 latency back under 300ms <@U{index % 7:08d}>',
+            'ts': f'{ts:.6f}',
+            'team': SLACK_TEAM_ID,
+            'client_msg_id': f'{index:08x}-0000-4000-8000-{index:012x}',
+            'blocks': [{
+                'type': 'rich_text',
+                'block_id': f'b{index % 1000}',
+                'elements': [{'type': 'rich_text_section', 'elements': [
+                    {'type': 'text', 'text': f'Deploy {index} of checkout-service finished'}]}],
+            }],
+        }
+        if index % 10 == 0:
+            message['thread_ts'] = message['ts']
+            message['reply_count'] = index % 5
+        if index % 25 == 0:
+            message['subtype'] = 'bot_message'
+            message['bot_id'] = 'B0BENCH01'
+        return message
+
+    def get_slack_conversations_info(self, params: dict):
+        return {
+            'ok': True,
+            'channel': {
+                'id': params.get('channel'),
+                'name': SLACK_CHANNEL_NAME,
+                'is_channel': True,
+                'created': int(self.oldest_epoch),
+                'context_team_id': SLACK_TEAM_ID,
+            },
+        }
+
+    def get_sentry_events(self, path: str, params: dict):
+        """
+        The page of events and the Link header for it. Sentry cursors are `<value>:<offset>:<is_prev>`.
+        """
+        cursor = params.get('cursor', '0:0:0').split(':')
+        offset = int(cursor[1]) if len(cursor) > 1 else 0
+        match = SENTRY_EVENTS_PATH.match(path)
+        events = []
+        for index in range(offset, min(offset + SENTRY_PAGE_SIZE, self.total_rows)):
+            event_id = f'{index:032x}'
+            events.append({
+                'id': event_id,
+                'eventID': event_id,
+                'groupID': str(1000 + index % 200),
+                'projectID': '1',
+                'title': f'KeyError: order_{index % 200}',
+                'message': f'KeyError: order_{index % 200}',
+                'platform': 'python',
+                'dateCreated': format_sentry_datetime(self.get_row_epoch(index)),
+                'event.type': 'error',
+                'culprit': f'checkout.views in submit_order_{index % 200}',
+                'location': 'checkout/views.py',
+                'user': {'id': str(index % 5000), 'email': None, 'username': None, 'ip_address': '10.0.0.1'},
+                'tags': [{'key': 'environment', 'value': 'production'},
+                         {'key': 'release', 'value': f'checkout@1.{index % 40}.0'},
+                         {'key': 'level', 'value': 'error'}],
+            })
+        next_offset = offset + SENTRY_PAGE_SIZE
+        page_url = f"{self.base_url}{path}?{urlencode({k: v for k, v in params.items() if k != 'cursor'})}"
+        previous_link = (f'<{page_url}&cursor=0:{max(offset - SENTRY_PAGE_SIZE, 0)}:1>; rel="previous"; '
+                         f'results="{"true" if offset > 0 else "false"}"; cursor="0:{offset}:1"')
+        next_link = (f'<{page_url}&cursor=0:{next_offset}:0>; rel="next"; '
+                     f'results="{"true" if next_offset < self.total_rows else "false"}"; cursor="0:{next_offset}:0"')
+        return events, {'Link': f'{previous_link}, {next_link}', 'X-Sentry-Organization': match['organization']}
+
+    def get_new_relic_violations(self, path: str, params: dict):
+        """
+        The page of violations opened in [start_date, end_date) and its Link header, `last` is left out on the
+        last page like New Relic does. Pages past the last one are empty.
+        """
+        page = max(int(params.get('page') or 1), 1)
+        start_epoch = parse_new_relic_date(params['start_date']) if params.get('start_date') else self.oldest_epoch
+        end_epoch = parse_new_relic_date(params['end_date']) if params.get('end_date') else self.latest_epoch
+        # Indexes of the rows opened in the window, rows get older as the index grows
+        first_index = max(0, math.floor((self.latest_epoch - end_epoch) / self.step_seconds) - 1)
+        while first_index < self.total_rows and self.get_row_epoch(first_index) >= end_epoch:
+            first_index += 1
+        last_index = min(self.total_rows, max(first_index, math.ceil((self.latest_epoch - start_epoch) /
+                                                                     self.step_seconds) + 1))
+        while last_index > first_index and self.get_row_epoch(last_index - 1) < start_epoch:
+            last_index -= 1
+        last_page = max(1, math.ceil((last_index - first_index) / NEW_RELIC_PAGE_SIZE))
+        page_start = first_index + (page - 1) * NEW_RELIC_PAGE_SIZE
+        violations = []
+        for index in range(page_start, min(page_start + NEW_RELIC_PAGE_SIZE, last_index)):
+            opened_at = int(self.get_row_epoch(index) * 1000)
+            violations.append({
+                'id': index + 1,
+                'label': f'Error percentage > 5.0% for at least 5 minutes on checkout-service-{index % 20}',
+                'duration': 300 + index % 3600,
+                'policy_name': f'Checkout policy {index % 10}',
+                'condition_name': 'Error percentage (High)',
+                'priority': 'Critical' if index % 4 == 0 else 'Warning',
+                'opened_at': opened_at,
+                'closed_at': opened_at + (300 + index % 3600) * 1000,
+                'entity': {'product': 'Apm', 'type': 'Application', 'group_id': 1, 'id': 1000 + index % 20,
+                           'name': f'checkout-service-{index % 20}'},
+                'links': {'policy_id': 100 + index % 10, 'condition_id': 200 + index % 30},
+            })
+        headers = {}
+        if page < last_page:
+            page_url = f"{self.base_url}{path}?{urlencode({k: v for k, v in params.items() if k != 'page'})}"
+            headers['Link'] = f'<{page_url}&page={page + 1}>; rel="next", <{page_url}&page={last_page}>; rel="last"'
+        return {'violations': violations}, headers
+
+    def __get_handler_class(self):
+        fake_api_server = self
+
+        class FakeApiRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.handle_api_request()
+
+            def do_POST(self):
+                self.handle_api_request()
+
+            def handle_api_request(self):
+                url = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                content_length = int(self.headers.get('Content-Length') or 0)
+                if content_length:
+                    body = self.rfile.read(content_length).decode()
+                    if self.headers.get('Content-Type', '').startswith('application/json'):
+                        params.update(json.loads(body))
+                    else:
+                        params.update({key: values[-1] for key, values in parse_qs(body).items()})
+
+                if url.path == '/api/conversations.history':
+                    route = 'slack.conversations.history'
+                elif url.path == '/api/conversations.info':
+                    route = 'slack.conversations.info'
+                elif SENTRY_EVENTS_PATH.match(url.path):
+                    route = 'sentry.events'
+                elif url.path == '/v2/alerts_violations.json':
+                    route = 'new_relic.alerts_violations'
+                else:
+                    self.send_json(404, {'error': f'No fake for {url.path}'})
+                    return
+
+                if fake_api_server.latency_seconds:
+                    time.sleep(fake_api_server.latency_seconds)
+                if fake_api_server.should_rate_limit(route):
+                    payload = {'ok': False, 'error': 'ratelimited'} if route.startswith('slack') else \
+                        {'detail': 'You are attempting to use this endpoint too frequently.'}
+                    self.send_json(429, payload, {'Retry-After': str(fake_api_server.retry_after_seconds)})
+                    return
+
+                if route == 'slack.conversations.history':
+                    self.send_json(200, fake_api_server.get_slack_conversations_history(params))
+                elif route == 'slack.conversations.info':
+                    self.send_json(200, fake_api_server.get_slack_conversations_info(params))
+                elif route == 'sentry.events':
+                    self.send_json(200, *fake_api_server.get_sentry_events(url.path, params))
+                else:
+                    self.send_json(200, *fake_api_server.get_new_relic_violations(url.path, params))
+
+            def send_json(self, status: int, payload, headers: dict = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return FakeApiRequestHandler
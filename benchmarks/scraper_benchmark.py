@@ -0,0 +1,158 @@
+"""
+Offline throughput benchmark of the Slack, Sentry and New Relic scrapers against the local fake APIs of
+benchmarks.fake_servers.
+
+Each source and scale runs in a fresh interpreter, so the peak RSS reported is the scrape's own, while the fake API
+runs in this process and counts the requests it answered. S3, the message store, tracing and the metrics push are
+switched off, the CSV files the processors write are deleted after every run.
+
+    python -m benchmarks.scraper_benchmark
+    python -m benchmarks.scraper_benchmark --sources slack --scales 10k,100k --latency-ms 20 --rate-limit-every 50
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSORS_DIR = os.path.join(REPO_ROOT, 'processors')
+SOURCES = ['slack', 'sentry', 'new_relic']
+DEFAULT_SCALES = '10k,100k,1M'
+DEFAULT_NEW_RELIC_WORKERS = 32
+SCALE_SUFFIXES = {'k': 10 ** 3, 'm': 10 ** 6}
+
+OLDEST_DATE = '2024-01-01'
+LATEST_DATE = '2024-01-31'
+SLACK_CHANNEL_ID = 'C0BENCH01'
+
+
+def get_epoch(date: str):
+    return datetime.strptime(date, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp()
+
+
+def parse_scale(scale: str):
+    scale = scale.strip().lower()
+    if scale[-1] in SCALE_SUFFIXES:
+        return int(float(scale[:-1]) * SCALE_SUFFIXES[scale[-1]])
+    return int(scale)
+
+
+def get_peak_rss_bytes():
+    # ru_maxrss is in kilobytes on linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def run_one(source: str, base_url: str, new_relic_workers: int):
+    """
+    Scrapes the fake API at base_url with the processor of source, in this process. Returns the measurements.
+    """
+    import utils.metrics
+    import utils.tracing
+    from utils.retry_utils import RetryPolicy
+
+    utils.tracing.TRACING_ENABLED = False
+    # There is no redis to push metrics to offline
+    utils.metrics.REGISTRY.flush = lambda: None
+
+    if source == 'slack':
+        import processors.slack_webclient_apis as processor_module
+        processor_module.CONVERSATIONS_HISTORY_PAGE_INTERVAL_SECONDS = 0
+        processor = processor_module.SlackApiProcessor('xoxb-benchmark', base_url=f'{base_url}/api/')
+        fetch = lambda: processor.fetch_conversation_history(SLACK_CHANNEL_ID, str(get_epoch(LATEST_DATE)),
+                                                             str(get_epoch(OLDEST_DATE)))
+    elif source == 'sentry':
+        import processors.sentry_client_apis as processor_module
+        processor = processor_module.SentryApiProcessor('benchmark', 'benchmark-org', 'checkout',
+                                                        api_base_url=f'{base_url}/api/0')
+        fetch = lambda: processor.fetch_events(str(get_epoch(LATEST_DATE)), str(get_epoch(OLDEST_DATE)))
+    else:
+        import processors.new_relic_rest_client as processor_module
+        processor = processor_module.NewRelicRestApiProcessor('benchmark', '1000000',
+                                                              api_base_url=f'{base_url}/v2')
+        fetch = lambda: processor.fetch_alert_violations(OLDEST_DATE, LATEST_DATE, max_workers=new_relic_workers)
+    processor_module.PUSH_TO_S3 = False
+    processor_module.PUSH_TO_MESSAGE_STORE = False
+    # Injected 429s are retried right away instead of eating into a production sized budget
+    processor.retry_policy = RetryPolicy(max_consecutive_retries=20, retry_budget=10 ** 6, base_delay_seconds=0.001,
+                                         max_delay_seconds=0.05, source=source)
+
+    started_at = time.perf_counter()
+    success = fetch()
+    duration_seconds = time.perf_counter() - started_at
+    tracker = processor.progress_tracker
+    return {
+        'success': bool(success),
+        'duration_seconds': duration_seconds,
+        'rows': tracker.rows,
+        'pages': tracker.pages,
+        'bytes': tracker.bytes,
+        'peak_rss_bytes': get_peak_rss_bytes(),
+    }
+
+
+def benchmark(source: str, rows: int, args):
+    from benchmarks.fake_servers import FakeApiServer
+
+    csv_files_before = set(glob.glob(os.path.join(PROCESSORS_DIR, '*.csv')))
+    with FakeApiServer(rows, get_epoch(OLDEST_DATE), get_epoch(LATEST_DATE), latency_seconds=args.latency_ms / 1000,
+                       rate_limit_every=args.rate_limit_every, retry_after_seconds=args.retry_after) as server:
+        result = subprocess.run([sys.executable, '-m', 'benchmarks.scraper_benchmark', '--run-one', source,
+                                 '--base-url', server.base_url, '--new-relic-workers', str(args.new_relic_workers)],
+                                cwd=REPO_ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        server_stats = server.get_stats()
+    for file_path in set(glob.glob(os.path.join(PROCESSORS_DIR, '*.csv'))) - csv_files_before:
+        os.remove(file_path)
+    output_lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not output_lines:
+        return None
+    measurements = json.loads(output_lines[-1])
+    measurements['requests'] = sum(server_stats['requests'].values())
+    measurements['rate_limited'] = sum(server_stats['rate_limited'].values())
+    return measurements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sources', default=','.join(SOURCES), help=f'comma separated, defaults to all of {SOURCES}')
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help=f'rows per run, defaults to {DEFAULT_SCALES}')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='delay added to every fake API response')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='answer every Nth request with a 429')
+    parser.add_argument('--retry-after', type=int, default=0, help='Retry-After seconds sent with the 429s')
+    parser.add_argument('--new-relic-workers', type=int, default=DEFAULT_NEW_RELIC_WORKERS,
+                        help='max_workers of the New Relic fetch, each date range is capped at 250 pages')
+    parser.add_argument('--run-one', choices=SOURCES, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        measurements = run_one(args.run_one, args.base_url, args.new_relic_workers)
+        # Last line of stdout, the processors print as they go
+        print(json.dumps(measurements))
+        return
+
+    print(f"{'source':<10} {'rows':>9} {'seconds':>9} {'rows/s':>10} {'pages':>7} {'MB read':>9} "
+          f"{'peak RSS MB':>12} {'requests':>9} {'429s':>6}  status")
+    for source in args.sources.split(','):
+        for scale in args.scales.split(','):
+            rows = parse_scale(scale)
+            measurements = benchmark(source, rows, args)
+            if measurements is None:
+                print(f"{source:<10} {rows:>9} crashed")
+                continue
+            rows_per_second = measurements['rows'] / measurements['duration_seconds']
+            status = 'ok' if measurements['success'] and measurements['rows'] >= rows else \
+                f"incomplete ({measurements['rows']}/{rows} rows)"
+            print(f"{source:<10} {rows:>9} {measurements['duration_seconds']:>9.2f} {rows_per_second:>10.0f} "
+                  f"{measurements['pages']:>7} {measurements['bytes'] / 2 ** 20:>9.1f} "
+                  f"{measurements['peak_rss_bytes'] / 2 ** 20:>12.1f} {measurements['requests']:>9} "
+                  f"{measurements['rate_limited']:>6}  {status}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Cold start benchmark for the Flask app and the Celery worker entrypoints.
+
+Imports each module in fresh interpreters, reports the wall time of the import and, from one `-X importtime` run,
+the import time of the slowest top level packages, submodules included.
+
+    python -m benchmarks.startup_benchmark
+    python -m benchmarks.startup_benchmark --module app --runs 10 --top 25
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ['app', 'celery_app']
+DEFAULT_RUNS = 5
+DEFAULT_TOP = 15
+
+
+def time_import(module: str):
+    started_at = time.perf_counter()
+    subprocess.run([sys.executable, '-c', f'import {module}'], cwd=REPO_ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started_at
+
+
+def get_import_time_breakdown(module: str):
+    """
+    Microseconds spent importing each top level package and its submodules, as reported by -X importtime.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=REPO_ROOT,
+                            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    breakdown = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, _, name = line[len('import time:'):].split('|')
+        # Self times are summed per top level package, so numpy shows up once whoever imported it
+        breakdown[name.strip().split('.')[0]] += int(self_time)
+    return breakdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', action='append', dest='modules',
+                        help=f'module to import, repeatable, defaults to {DEFAULT_MODULES}')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP)
+    args = parser.parse_args()
+
+    for module in args.modules or DEFAULT_MODULES:
+        timings = [time_import(module) for _ in range(args.runs)]
+        print(f"import {module}: median {statistics.median(timings) * 1000:.0f} ms, "
+              f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms over {args.runs} runs")
+        breakdown = get_import_time_breakdown(module)
+        total = sum(breakdown.values())
+        for name, cumulative in sorted(breakdown.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"  {name:<32} {cumulative / 1000:>9.1f} ms  {cumulative * 100 / total:>5.1f}%")
+        print()
+
+
+if __name__ == '__main__':
+    main()
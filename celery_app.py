@@ -3,8 +3,9 @@ import sys
 from celery import Celery
 from flask import Flask
 
-from env_vars import PG_DB_USERNAME, PG_DB_PASSWORD, PG_DB_NAME, PG_DB_HOSTNAME
+from env_vars import PG_DB_USERNAME, PG_DB_PASSWORD, PG_DB_NAME, PG_DB_HOSTNAME, REDIS_URL, JOB_RESULT_EXPIRY_SECONDS
 from persistance.models import db
+from utils.metrics import instrument_celery
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.absolute()))
@@ -17,10 +18,15 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
 # Celery configuration
-app.config['CELERY_BROKER_URL'] = 'redis://localhost:6379/0'
+app.config['CELERY_BROKER_URL'] = REDIS_URL
+app.config['CELERY_RESULT_BACKEND'] = REDIS_URL
 celery = Celery(
     app.name,  # Replace with your Flask app name
     broker=app.config['CELERY_BROKER_URL'],  # Use Redis as the message broker
+    backend=app.config['CELERY_RESULT_BACKEND'],  # Job states and progress are polled from redis
     include=['jobs.tasks']
 )
 celery.conf.update(app.config)
+# Results only keep the state and progress of a job, not its args, which carry the credentials of some sources
+celery.conf.update(result_expires=JOB_RESULT_EXPIRY_SECONDS)
+instrument_celery()
@@ -1,11 +1,21 @@
 from celery import Celery
 from celery.schedules import crontab
 
-app = Celery('beat_schedule', broker='redis://localhost:6379/0')
+from env_vars import REDIS_URL
+
+app = Celery('beat_schedule', broker=REDIS_URL)
 
 app.conf.beat_schedule = {
     'fetch-every-1-day': {
         'task': 'jobs.tasks.periodic_data_fetch_job',
         'schedule': crontab(minute='0', hour='0'),
     },
+    'prune-scrap-schedules-every-1-day': {
+        'task': 'jobs.tasks.prune_slack_channel_scrap_schedules_job',
+        'schedule': crontab(minute='30', hour='0'),
+    },
+    'fetch-google-chat-every-1-day': {
+        'task': 'jobs.tasks.periodic_google_chat_fetch_job',
+        'schedule': crontab(minute='0', hour='1'),
+    },
 }
@@ -6,6 +6,8 @@ SLACK_APP_ID = 'your_app_id'
 SLACK_CLIENT_ID = 'your_client_id'
 SLACK_CLIENT_SECRET = 'your_client_secret'
 SLACK_REDIRECT_URI = 'your_redirect_uri'
+# Used to verify that /slack/events requests were sent by Slack
+SLACK_SIGNING_SECRET = 'your_signing_secret'
 
 # AWS S3 Credentials
 PUSH_TO_S3 = True
@@ -16,6 +18,10 @@ RAW_DATA_S3_BUCKET_NAME = 'your_raw_data_s3_bucket_name'
 NEW_RELIC_RAW_DATA_S3_BUCKET_NAME = 'your_new_relic_raw_data_s3_bucket_name'
 SENTRY_RAW_DATA_S3_BUCKET_NAME = 'your_sentry_raw_data_s3_bucket_name'
 
+# Postgres Message Store, scraped rows are also bulk loaded into the partitioned message store tables. Turn it on
+# once the message store migration (9b2e4d61a7c3) is applied with `flask db upgrade`
+PUSH_TO_MESSAGE_STORE = False
+
 # Slack Configurations
 PUSH_TO_SLACK = True
 SLACK_URL = 'your_slack_webhook_url'
@@ -25,6 +31,23 @@ PG_DB_HOSTNAME = 'localhost'
 PG_DB_USERNAME = ''
 PG_DB_PASSWORD = ''
 PG_DB_NAME = 'data_scrapper_db'
+# Slack channel scrap schedules older than this are pruned, the latest schedule of every channel is always kept
+SCRAP_SCHEDULE_RETENTION_DAYS = 90
+
+# Tracing, spans of every scrape run are appended as JSON lines to files in TRACE_EXPORT_DIR. Off by default, the
+# files are neither rotated nor pruned, turn it on to investigate a scraper and clear the directory afterwards
+TRACING_ENABLED = False
+TRACE_EXPORT_DIR = 'downloads/traces'
+
+# Profiling, runs started with profile=true or every run when PROFILING_ENABLED write a folded CPU profile and a
+# memory summary to PROFILE_EXPORT_DIR
+PROFILING_ENABLED = False
+PROFILE_EXPORT_DIR = 'downloads/profiles'
+
+# Redis Configurations, used as celery broker and for state shared across workers
+REDIS_URL = 'redis://localhost:6379/0'
+# On-demand scrape job states and progress are kept in the celery result backend for this long
+JOB_RESULT_EXPIRY_SECONDS = 24 * 60 * 60
 
 # G-chat App Configurations
 GOOGLE_OAUTH_REDIRECT_URI = 'your_redirect_uri'
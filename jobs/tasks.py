@@ -5,39 +5,73 @@ from celery_app import celery, app
 def periodic_data_fetch_job():
     with app.app_context():
         from utils.time_utils import get_current_time
-        from persistance.db_utils import get_slack_bot_configs_by, get_last_slack_channel_scrap_schedule_for, \
+        from persistance.db_utils import get_slack_bot_configs_by, get_latest_slack_channel_scrap_schedules, \
             create_slack_channel_scrap_schedule
+        from utils.circuit_breaker import CircuitState, get_slack_workspace_circuit_breaker, \
+            record_slack_workspace_auth_failure
+        from processors.slack_webclient_apis import SlackApiProcessor
         from datetime import datetime
+        from utils.retry_utils import is_auth_error
+        from utils.tracing import start_span, get_trace_context
 
-        current_time = get_current_time()
+        with start_span('periodic_data_fetch_job'):
+            current_time = get_current_time()
 
-        slack_bot_configs = get_slack_bot_configs_by(is_active=True)
-        if not slack_bot_configs:
-            print(f"No active slack bot configs found")
-            return
-        for slack_bot_config in slack_bot_configs:
-            latest_timestamp = current_time
-            oldest_timestamp = None
-            slack_channel_config_id = slack_bot_config.id
-            channel_id = slack_bot_config.channel_id
-            latest_schedule = get_last_slack_channel_scrap_schedule_for(slack_channel_config_id)
-            if latest_schedule:
-                oldest_timestamp = str(latest_schedule.data_extraction_to.timestamp())
-            bot_auth_token = slack_bot_config.slack_workspace.bot_auth_token
-            print(f"Scheduling Data Fetch Job for channel_id: {channel_id} at epoch: {current_time}")
-            data_fetch_job.delay(bot_auth_token, channel_id, latest_timestamp, oldest_timestamp)
-            data_extraction_to = datetime.fromtimestamp(float(latest_timestamp))
-            data_extraction_from = None
-            if oldest_timestamp:
-                data_extraction_from = datetime.fromtimestamp(float(oldest_timestamp))
-            create_slack_channel_scrap_schedule(slack_channel_config_id, data_extraction_from, data_extraction_to)
+            slack_bot_configs = get_slack_bot_configs_by(is_active=True)
+            if not slack_bot_configs:
+                print(f"No active slack bot configs found")
+                return
+            latest_schedules = get_latest_slack_channel_scrap_schedules()
+            workspace_allowed = {}
+            for slack_bot_config in slack_bot_configs:
+                latest_timestamp = current_time
+                oldest_timestamp = None
+                slack_channel_config_id = slack_bot_config.id
+                channel_id = slack_bot_config.channel_id
+                slack_workspace = slack_bot_config.slack_workspace
+                if slack_workspace.id not in workspace_allowed:
+                    circuit_state = get_slack_workspace_circuit_breaker(slack_workspace.id).get_state()
+                    if circuit_state == CircuitState.HALF_OPEN:
+                        # Probe the token once with a cheap auth.test before scheduling any of its channels again
+                        slack_api_processor = SlackApiProcessor(slack_workspace.bot_auth_token)
+                        if slack_api_processor.test_auth():
+                            get_slack_workspace_circuit_breaker(slack_workspace.id).record_success()
+                            circuit_state = CircuitState.CLOSED
+                        elif is_auth_error(slack_api_processor.retry_policy.fatal_error):
+                            record_slack_workspace_auth_failure(slack_workspace.id)
+                        else:
+                            # Timeouts, 5xx and rate limits say nothing about the token, probe again next run
+                            get_slack_workspace_circuit_breaker(slack_workspace.id).release_probe()
+                    workspace_allowed[slack_workspace.id] = circuit_state == CircuitState.CLOSED
+                if not workspace_allowed[slack_workspace.id]:
+                    print(f"Skipping Data Fetch Job for channel_id: {channel_id}: circuit open for slack workspace: "
+                          f"{slack_workspace.id}")
+                    continue
+                latest_schedule = latest_schedules.get(slack_channel_config_id)
+                if latest_schedule:
+                    oldest_timestamp = str(latest_schedule.data_extraction_to.timestamp())
+                bot_auth_token = slack_workspace.bot_auth_token
+                print(f"Scheduling Data Fetch Job for channel_id: {channel_id} at epoch: {current_time}")
+                data_fetch_job.delay(bot_auth_token, channel_id, latest_timestamp, oldest_timestamp, slack_workspace.id,
+                                     trace_context=get_trace_context())
+                data_extraction_to = datetime.fromtimestamp(float(latest_timestamp))
+                data_extraction_from = None
+                if oldest_timestamp:
+                    data_extraction_from = datetime.fromtimestamp(float(oldest_timestamp))
+                create_slack_channel_scrap_schedule(slack_channel_config_id, data_extraction_from, data_extraction_to)
 
 
 @celery.task
-def data_fetch_job(bot_auth_token: str, channel_id: str, latest_timestamp: str, oldest_timestamp: str):
+def data_fetch_job(bot_auth_token: str, channel_id: str, latest_timestamp: str, oldest_timestamp: str,
+                   slack_workspace_id: int = None, trace_context: dict = None, profile: bool = False):
     with app.app_context():
+        from env_vars import RAW_DATA_S3_BUCKET_NAME
         from processors.slack_webclient_apis import SlackApiProcessor
+        from utils.circuit_breaker import get_slack_workspace_circuit_breaker, record_slack_workspace_auth_failure
+        from utils.retry_utils import is_auth_error
         from utils.time_utils import get_current_time
+        from utils.profiling import profile_run
+        from utils.tracing import start_span
 
         current_time = get_current_time()
 
@@ -56,4 +90,204 @@ def data_fetch_job(bot_auth_token: str, channel_id: str, latest_timestamp: str,
         print(f"Initiating Data Fetch Job for channel_id: {channel_id} at epoch: {current_time} with "
               f"latest_timestamp: {latest_timestamp}, oldest_timestamp: {oldest_timestamp}")
         slack_api_processor = SlackApiProcessor(bot_auth_token)
-        slack_api_processor.fetch_conversation_history(channel_id, latest_timestamp, oldest_timestamp)
+        # Continues the trace of the periodic_data_fetch_job run that scheduled this channel
+        with profile_run(f'data_fetch_job-{channel_id}', profile, RAW_DATA_S3_BUCKET_NAME), \
+                start_span('data_fetch_job', trace_context=trace_context, channel_id=channel_id):
+            slack_api_processor.fetch_conversation_history(channel_id, latest_timestamp, oldest_timestamp)
+        slack_api_processor.progress_tracker.finish()
+        if slack_workspace_id:
+            fatal_error = slack_api_processor.retry_policy.fatal_error
+            if is_auth_error(fatal_error):
+                record_slack_workspace_auth_failure(slack_workspace_id)
+            elif fatal_error is None:
+                get_slack_workspace_circuit_breaker(slack_workspace_id).record_success()
+
+
+@celery.task
+def prune_slack_channel_scrap_schedules_job():
+    with app.app_context():
+        from datetime import datetime, timedelta
+        from env_vars import SCRAP_SCHEDULE_RETENTION_DAYS
+        from persistance.db_utils import delete_slack_channel_scrap_schedules_before
+
+        cutoff_datetime = datetime.utcnow() - timedelta(days=SCRAP_SCHEDULE_RETENTION_DAYS)
+        deleted_count = delete_slack_channel_scrap_schedules_before(cutoff_datetime)
+        print(f"Pruned {deleted_count} slack channel scrap schedules triggered before {cutoff_datetime}")
+
+
+@celery.task
+def handle_slack_event_job(data: dict):
+    with app.app_context():
+        from route_handlers.slack_route_handler import handle_event_callback
+
+        event_type = data.get('event', {}).get('type', None)
+        print(f"Handling slack event: {event_type} for workspace: {data.get('team_id', None)}")
+        if not handle_event_callback(data):
+            print(f"Failed to handle slack event: {event_type} for workspace: {data.get('team_id', None)}")
+
+
+@celery.task(bind=True)
+def slack_start_data_fetch_job(self, bot_auth_token: str, channel_id: str, latest_timestamp: str,
+                               oldest_timestamp: str, slack_bot_config_id: int, profile: bool = False):
+    with app.app_context():
+        from datetime import datetime
+        from env_vars import RAW_DATA_S3_BUCKET_NAME
+        from persistance.db_utils import create_slack_channel_scrap_schedule
+        from processors.slack_webclient_apis import SlackApiProcessor
+        from utils.profiling import profile_run
+
+        slack_api_processor = SlackApiProcessor(bot_auth_token)
+        slack_api_processor.progress_tracker.bind(self)
+        with profile_run(f'slack_start_data_fetch_job-{channel_id}', profile, RAW_DATA_S3_BUCKET_NAME):
+            data_fetch_success = slack_api_processor.fetch_conversation_history(channel_id, latest_timestamp,
+                                                                                oldest_timestamp)
+
+        data_extraction_to = datetime.fromtimestamp(float(latest_timestamp))
+        data_extraction_from = None
+        if oldest_timestamp:
+            data_extraction_from = datetime.fromtimestamp(float(oldest_timestamp))
+        create_slack_channel_scrap_schedule(slack_bot_config_id, data_extraction_from, data_extraction_to)
+        return {'success': bool(data_fetch_success), 'progress': slack_api_processor.progress_tracker.finish()}
+
+
+@celery.task(bind=True)
+def sentry_start_data_fetch_job(self, source_token_id: int, project_slug: str, latest_timestamp: str,
+                                oldest_timestamp: str, mode: str = None, stats_period: str = None,
+                                events_sample_size: int = 0, profile: bool = False):
+    with app.app_context():
+        from env_vars import SENTRY_RAW_DATA_S3_BUCKET_NAME
+        from persistance.db_utils import get_source_token_config_by_id
+        from processors.sentry_client_apis import SentryApiProcessor
+        from utils.circuit_breaker import get_source_token_circuit_breaker, record_source_token_auth_failure
+        from utils.profiling import profile_run
+        from utils.retry_utils import is_auth_error
+
+        source_token = get_source_token_config_by_id(source_token_id)
+        if not source_token:
+            return {'success': False, 'message': f'Source token config not found: {source_token_id}'}
+
+        sentry_api_processor = SentryApiProcessor(source_token.token_config['bearer_token'],
+                                                  source_token.token_config['organization_slug'], project_slug)
+        sentry_api_processor.progress_tracker.bind(self)
+        with profile_run(f'sentry_start_data_fetch_job-{project_slug}', profile, SENTRY_RAW_DATA_S3_BUCKET_NAME):
+            if mode == 'summary':
+                data_fetch_success = sentry_api_processor.fetch_issue_summaries(latest_timestamp, oldest_timestamp,
+                                                                                stats_period, events_sample_size)
+            else:
+                data_fetch_success = sentry_api_processor.fetch_events(latest_timestamp, oldest_timestamp)
+        fatal_error = sentry_api_processor.retry_policy.fatal_error
+        if is_auth_error(fatal_error):
+            record_source_token_auth_failure(source_token.id)
+        elif fatal_error is None:
+            get_source_token_circuit_breaker(source_token.id).record_success()
+        return {'success': bool(data_fetch_success), 'progress': sentry_api_processor.progress_tracker.finish()}
+
+
+@celery.task(bind=True)
+def new_relic_fetch_alert_violations_job(self, nr_api_key: str, nr_account_id: str, nr_query_key: str,
+                                         start_date: str, end_date: str, max_workers: int = None,
+                                         profile: bool = False):
+    with app.app_context():
+        from env_vars import NEW_RELIC_RAW_DATA_S3_BUCKET_NAME
+        from processors.new_relic_rest_client import NewRelicRestApiProcessor
+        from utils.profiling import profile_run
+
+        new_relic_rest_api_processor = NewRelicRestApiProcessor(nr_api_key, nr_account_id, nr_query_key)
+        new_relic_rest_api_processor.progress_tracker.bind(self)
+        with profile_run(f'new_relic_fetch_alert_violations_job-{nr_account_id}', profile,
+                         NEW_RELIC_RAW_DATA_S3_BUCKET_NAME):
+            data_fetch_success = new_relic_rest_api_processor.fetch_alert_violations(start_date, end_date,
+                                                                                     max_workers)
+        return {'success': bool(data_fetch_success),
+                'progress': new_relic_rest_api_processor.progress_tracker.finish()}
+
+
+@celery.task(bind=True)
+def new_relic_fetch_alert_policies_nrql_conditions_job(self, nr_api_key: str, nr_account_id: str,
+                                                       nr_query_key: str, policy_ids: list, max_workers: int = None,
+                                                       backend: str = None, profile: bool = False):
+    with app.app_context():
+        from env_vars import NEW_RELIC_RAW_DATA_S3_BUCKET_NAME
+        from processors.new_relic_nerdgraph_client import NewRelicNerdGraphApiProcessor
+        from processors.new_relic_rest_client import NewRelicRestApiProcessor, DEFAULT_MAX_WORKERS
+        from utils.profiling import profile_run
+
+        if not max_workers:
+            max_workers = DEFAULT_MAX_WORKERS
+
+        if backend == 'nerdgraph':
+            new_relic_api_processor = NewRelicNerdGraphApiProcessor(nr_api_key, nr_account_id, nr_query_key)
+        else:
+            new_relic_api_processor = NewRelicRestApiProcessor(nr_api_key, nr_account_id, nr_query_key)
+        new_relic_api_processor.progress_tracker.bind(self)
+        with profile_run(f'new_relic_fetch_alert_policies_nrql_conditions_job-{nr_account_id}', profile,
+                         NEW_RELIC_RAW_DATA_S3_BUCKET_NAME):
+            all_policies_nrql_conditions = new_relic_api_processor.fetch_alert_policies_nrql_conditions(policy_ids,
+                                                                                                        max_workers)
+        return {'success': bool(all_policies_nrql_conditions),
+                'progress': new_relic_api_processor.progress_tracker.finish()}
+
+
+@celery.task
+def periodic_google_chat_fetch_job():
+    with app.app_context():
+        from persistance.db_utils import get_source_token_config_by
+        from utils.circuit_breaker import CircuitState, get_source_token_circuit_breaker
+
+        source_tokens = get_source_token_config_by(source='GOOGLE_CHAT', is_active=True)
+        if not source_tokens:
+            print(f"No active google chat source token configs found")
+            return
+        for source_token in source_tokens:
+            if get_source_token_circuit_breaker(source_token.id).get_state() == CircuitState.OPEN:
+                print(f"Skipping Google Chat Fetch Job: circuit open for source token: {source_token.id}")
+                continue
+            print(f"Scheduling Google Chat Fetch Job for source token: {source_token.id}")
+            google_chat_fetch_spaces_job.delay(source_token.id)
+
+
+@celery.task(bind=True)
+def google_chat_fetch_spaces_job(self, source_token_id: int, space_names: list = None, max_workers: int = None,
+                                 profile: bool = False):
+    with app.app_context():
+        from env_vars import RAW_DATA_S3_BUCKET_NAME
+        from persistance.db_utils import get_source_token_config_by_id, get_google_chat_space_watermarks, \
+            upsert_google_chat_space_watermarks, update_source_token_config
+        from processors.google_chat_apis import GoogleChatApiProcessor, DEFAULT_MAX_WORKERS
+        from utils.circuit_breaker import get_source_token_circuit_breaker, record_source_token_auth_failure
+        from utils.profiling import profile_run
+
+        source_token = get_source_token_config_by_id(source_token_id)
+        if not source_token:
+            return {'success': False, 'message': f'Source token config not found: {source_token_id}'}
+        if not max_workers:
+            max_workers = DEFAULT_MAX_WORKERS
+
+        google_chat_api_processor = GoogleChatApiProcessor(source_token.token_config)
+        google_chat_api_processor.progress_tracker.bind(self)
+        with profile_run(f'google_chat_fetch_spaces_job-{source_token_id}', profile, RAW_DATA_S3_BUCKET_NAME):
+            if not space_names:
+                space_names = source_token.token_config.get('space_names')
+            if not space_names and google_chat_api_processor.refresh_credentials():
+                space_names = google_chat_api_processor.fetch_spaces()
+            results = {}
+            if space_names:
+                watermarks = get_google_chat_space_watermarks(source_token_id, space_names)
+                space_watermarks = {space_name: watermarks[space_name].last_message_create_time
+                                    if space_name in watermarks else None for space_name in space_names}
+                results = google_chat_api_processor.fetch_spaces_messages(space_watermarks, max_workers)
+        # Only spaces scraped through move their watermark, a failed space is retried from where it was next run
+        upsert_google_chat_space_watermarks(source_token_id, {
+            space_name: result['last_message_create_time'] for space_name, result in results.items()
+            if result['success']})
+        refreshed_token_config = google_chat_api_processor.get_refreshed_credentials_config()
+        if refreshed_token_config:
+            update_source_token_config(source_token, token_config=refreshed_token_config)
+        success = bool(results) and all(result['success'] for result in results.values())
+        if google_chat_api_processor.auth_error:
+            record_source_token_auth_failure(source_token_id)
+        elif success:
+            get_source_token_circuit_breaker(source_token_id).record_success()
+        return {'success': success,
+                'spaces': {space_name: result['messages'] for space_name, result in results.items()},
+                'progress': google_chat_api_processor.progress_tracker.finish()}
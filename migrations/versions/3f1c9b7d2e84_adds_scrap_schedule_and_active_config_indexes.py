@@ -0,0 +1,39 @@
+"""adds scrap schedule and active config indexes
+
+Revision ID: 3f1c9b7d2e84
+Revises: 6e941f89fc2a
+Create Date: 2026-10-19 10:12:41.317502
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9b7d2e84'
+down_revision = '6e941f89fc2a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_slack_channel_data_scraping_schedule_channel_triggered_at',
+                    'slack_channel_data_scraping_schedule', ['slack_channel_id', sa.text('triggered_at DESC')],
+                    unique=False)
+    op.create_index('ix_slack_bot_config_active_channel_id', 'slack_bot_config', ['channel_id'], unique=False,
+                    postgresql_where=sa.text('is_active'))
+    op.create_index('ix_slack_bot_config_active_slack_workspace_id', 'slack_bot_config', ['slack_workspace_id'],
+                    unique=False, postgresql_where=sa.text('is_active'))
+    op.create_index('ix_slack_workspace_config_active_team_id', 'slack_workspace_config', ['team_id'], unique=False,
+                    postgresql_where=sa.text('is_active'))
+    op.create_index('ix_source_token_repository_active_source', 'source_token_repository', ['source'],
+                    unique=False, postgresql_where=sa.text('is_active'))
+
+
+def downgrade():
+    op.drop_index('ix_source_token_repository_active_source', table_name='source_token_repository')
+    op.drop_index('ix_slack_workspace_config_active_team_id', table_name='slack_workspace_config')
+    op.drop_index('ix_slack_bot_config_active_slack_workspace_id', table_name='slack_bot_config')
+    op.drop_index('ix_slack_bot_config_active_channel_id', table_name='slack_bot_config')
+    op.drop_index('ix_slack_channel_data_scraping_schedule_channel_triggered_at',
+                  table_name='slack_channel_data_scraping_schedule')
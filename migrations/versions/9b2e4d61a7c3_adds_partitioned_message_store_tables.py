@@ -0,0 +1,80 @@
+"""adds partitioned message store tables
+
+Revision ID: 9b2e4d61a7c3
+Revises: 3f1c9b7d2e84
+Create Date: 2026-10-19 14:03:27.840116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2e4d61a7c3'
+down_revision = '3f1c9b7d2e84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Monthly partitions are created on demand by persistance.message_store
+    op.create_table('slack_message',
+    sa.Column('team_id', sa.String(length=255), nullable=True),
+    sa.Column('channel_id', sa.String(length=255), nullable=False),
+    sa.Column('ts', sa.String(length=255), nullable=False),
+    sa.Column('message_at', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.String(length=255), nullable=True),
+    sa.Column('bot_id', sa.String(length=255), nullable=True),
+    sa.Column('subtype', sa.String(length=255), nullable=True),
+    sa.Column('thread_ts', sa.String(length=255), nullable=True),
+    sa.Column('text', sa.Text(), nullable=True),
+    sa.Column('message', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('channel_id', 'ts', 'message_at'),
+    postgresql_partition_by='RANGE (message_at)'
+    )
+    op.create_index('ix_slack_message_bot_id_message_at', 'slack_message', ['bot_id', 'message_at'], unique=False)
+    op.create_table('sentry_event',
+    sa.Column('organization_slug', sa.String(length=255), nullable=False),
+    sa.Column('project_slug', sa.String(length=255), nullable=False),
+    sa.Column('event_id', sa.String(length=255), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=False),
+    sa.Column('issue_id', sa.String(length=255), nullable=True),
+    sa.Column('event_type', sa.String(length=255), nullable=True),
+    sa.Column('platform', sa.String(length=255), nullable=True),
+    sa.Column('title', sa.Text(), nullable=True),
+    sa.Column('message', sa.Text(), nullable=True),
+    sa.Column('event', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('project_slug', 'event_id', 'date_created'),
+    postgresql_partition_by='RANGE (date_created)'
+    )
+    op.create_index('ix_sentry_event_issue_id_date_created', 'sentry_event', ['issue_id', 'date_created'],
+                    unique=False)
+    op.create_table('new_relic_violation',
+    sa.Column('account_id', sa.String(length=255), nullable=False),
+    sa.Column('violation_id', sa.BigInteger(), nullable=False),
+    sa.Column('opened_at', sa.DateTime(), nullable=False),
+    sa.Column('closed_at', sa.DateTime(), nullable=True),
+    sa.Column('label', sa.Text(), nullable=True),
+    sa.Column('priority', sa.String(length=255), nullable=True),
+    sa.Column('policy_name', sa.String(length=255), nullable=True),
+    sa.Column('condition_name', sa.String(length=255), nullable=True),
+    sa.Column('duration', sa.BigInteger(), nullable=True),
+    sa.Column('violation', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('account_id', 'violation_id', 'opened_at'),
+    postgresql_partition_by='RANGE (opened_at)'
+    )
+    op.create_index('ix_new_relic_violation_policy_name_opened_at', 'new_relic_violation',
+                    ['policy_name', 'opened_at'], unique=False)
+
+
+def downgrade():
+    # Dropping a partitioned table drops all of its partitions
+    op.drop_index('ix_new_relic_violation_policy_name_opened_at', table_name='new_relic_violation')
+    op.drop_table('new_relic_violation')
+    op.drop_index('ix_sentry_event_issue_id_date_created', table_name='sentry_event')
+    op.drop_table('sentry_event')
+    op.drop_index('ix_slack_message_bot_id_message_at', table_name='slack_message')
+    op.drop_table('slack_message')
@@ -1,12 +1,21 @@
 import hashlib
 import json
 import logging
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 
 from persistance.models import db, SlackWorkspaceConfig, SlackBotConfig, SlackChannelDataScrapingSchedule, \
-    SourceTokenRepository
+    SourceTokenRepository, GoogleChatSpaceWatermark
+from utils.redis_client import get_redis_client
 
 logger = logging.getLogger(__name__)
 
+ACTIVE_SLACK_WORKSPACES_CACHE_KEY = 'active_slack_workspaces:{team_id}'
+ACTIVE_SLACK_WORKSPACES_CACHE_TTL_SECONDS = 10 * 60
+
 
 def get_slack_workspace_config_by(team_id: str, bot_user_id: str = None, bot_auth_token: str = None,
                                   team_name: str = None, is_active: bool = None):
@@ -27,34 +36,93 @@ def get_slack_workspace_config_by(team_id: str, bot_user_id: str = None, bot_aut
     return SlackWorkspaceConfig.query.filter_by(**filters).all()
 
 
+def get_active_slack_workspaces_cached(team_id: str):
+    """
+    Read-through redis cache of the active SlackWorkspaceConfig rows of a team, shared by every worker. Returns
+    read-only snapshots carrying id, team_id, team_name and bot_user_id, not model instances. The bot_auth_token is
+    left out of redis, callers that use it load the row with get_slack_workspace_config_by_id. Workspaces without an
+    active config are cached too, so events from uninstalled workspaces skip the database.
+    """
+    cache_key = ACTIVE_SLACK_WORKSPACES_CACHE_KEY.format(team_id=team_id)
+    try:
+        cached_workspaces = get_redis_client().get(cache_key)
+        if cached_workspaces is not None:
+            return [SimpleNamespace(**workspace) for workspace in json.loads(cached_workspaces)]
+    except Exception as e:
+        logger.error(f"Error while reading active slack workspaces cache for {team_id} with error: {e}")
+
+    active_workspaces = [{'id': workspace.id, 'team_id': workspace.team_id, 'team_name': workspace.team_name,
+                          'bot_user_id': workspace.bot_user_id}
+                         for workspace in get_slack_workspace_config_by(team_id=team_id, is_active=True)]
+    try:
+        get_redis_client().set(cache_key, json.dumps(active_workspaces), ex=ACTIVE_SLACK_WORKSPACES_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.error(f"Error while writing active slack workspaces cache for {team_id} with error: {e}")
+    return [SimpleNamespace(**workspace) for workspace in active_workspaces]
+
+
+def invalidate_active_slack_workspaces_cache(team_ids: []):
+    try:
+        cache_keys = [ACTIVE_SLACK_WORKSPACES_CACHE_KEY.format(team_id=team_id) for team_id in set(team_ids)]
+        if cache_keys:
+            get_redis_client().delete(*cache_keys)
+    except Exception as e:
+        logger.error(f"Error while invalidating active slack workspaces cache for {team_ids} with error: {e}")
+
+
+def get_slack_workspace_config_by_id(slack_workspace_id):
+    return SlackWorkspaceConfig.query.get(slack_workspace_id)
+
+
 def create_slack_workspace_config(team_id: str, bot_user_id: str, bot_auth_token: str, team_name: str = None,
                                   should_update=True):
+    """
+    Upsert a SlackWorkspaceConfig on (team_id, bot_user_id, bot_auth_token) in a single statement.
+    """
     try:
+        upserted = upsert_slack_workspace_configs([{'team_id': team_id, 'bot_user_id': bot_user_id,
+                                                    'bot_auth_token': bot_auth_token, 'team_name': team_name}],
+                                                  should_update)
+        if upserted:
+            return upserted[0], True
         slack_workspace_configs = get_slack_workspace_config_by(team_id=team_id, bot_user_id=bot_user_id,
                                                                 bot_auth_token=bot_auth_token)
         if slack_workspace_configs:
-            slack_workspace_config = slack_workspace_configs[0]
-            if not should_update:
-                return slack_workspace_config, False
-            else:
-                updated_slack_workspace_config = update_slack_workspace_config(slack_workspace_config,
-                                                                               team_name,
-                                                                               True)
-                if updated_slack_workspace_config:
-                    return updated_slack_workspace_config, True
-                else:
-                    return None, False
-        new_slack_workspace_config = SlackWorkspaceConfig(team_id=team_id,
-                                                          team_name=team_name,
-                                                          bot_user_id=bot_user_id,
-                                                          bot_auth_token=bot_auth_token)
-        db.session.add(new_slack_workspace_config)
-        db.session.commit()
-        return new_slack_workspace_config, True
+            return slack_workspace_configs[0], False
+        return None, False
     except Exception as e:
         logger.error(f"Error while saving SlackWorkspaceConfig: {team_id}:{team_name} with error: {e}")
         db.session.rollback()
-        return None
+        return None, False
+
+
+def upsert_slack_workspace_configs(slack_workspace_configs: [], should_update=True):
+    """
+    Bulk upsert SlackWorkspaceConfig rows, given as dicts of team_id, bot_user_id, bot_auth_token and team_name, with
+    one INSERT ... ON CONFLICT ... RETURNING. Existing rows are re-activated and take the new team_name when
+    should_update is set, otherwise they are left untouched and not returned.
+    """
+    rows = dedupe_rows(slack_workspace_configs, ('team_id', 'bot_user_id', 'bot_auth_token'))
+    if not rows:
+        return []
+    current_datetime = datetime.utcnow()
+    for row in rows:
+        row.setdefault('is_active', True)
+        row.setdefault('created_at', current_datetime)
+        row.setdefault('updated_at', current_datetime)
+    statement = insert(SlackWorkspaceConfig).values(rows)
+    conflict_columns = ['team_id', 'bot_user_id', 'bot_auth_token']
+    if should_update:
+        statement = statement.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={'team_name': func.coalesce(statement.excluded.team_name, SlackWorkspaceConfig.team_name),
+                  'is_active': True,
+                  'updated_at': current_datetime})
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=conflict_columns)
+    upserted_slack_workspace_configs = execute_upsert(statement.returning(SlackWorkspaceConfig))
+    invalidate_active_slack_workspaces_cache([row['team_id'] for row in rows])
+    return upserted_slack_workspace_configs
 
 
 def update_slack_workspace_config(slack_workspace_config: SlackWorkspaceConfig, team_name: str = None,
@@ -71,6 +139,7 @@ def update_slack_workspace_config(slack_workspace_config: SlackWorkspaceConfig,
         if is_active is not None:
             slack_workspace_config.is_active = is_active
         db.session.commit()
+        invalidate_active_slack_workspaces_cache([slack_workspace_config.team_id])
         return slack_workspace_config
     except Exception as e:
         logger.error(f"Error while updating SlackWorkspaceConfig {slack_workspace_config.team_id} with error: {e}")
@@ -95,37 +164,46 @@ def get_slack_bot_configs_by(slack_workspace_id: str = None, channel_id: str = N
 
 def create_slack_bot_config(slack_workspace_id, channel_id, event_ts, channel_name=None):
     """
-    Create a new SlackBotConfig instance and add it to the database.
+    Upsert a SlackBotConfig on (slack_workspace_id, channel_id) in a single statement. An inactive config is
+    re-activated, is_created is only False when an active config already existed.
     """
     try:
+        upserted = upsert_slack_bot_configs([{'slack_workspace_id': slack_workspace_id, 'channel_id': channel_id,
+                                              'event_ts': event_ts, 'channel_name': channel_name}])
+        if upserted:
+            return upserted[0], True
         slack_bot_configs = get_slack_bot_configs_by(slack_workspace_id, channel_id)
         if slack_bot_configs:
-            slack_bot_config = slack_bot_configs[0]
-            if slack_bot_config and not slack_bot_config.is_active:
-                updated_slack_bot_config = update_slack_bot_config(slack_bot_config, is_active=True)
-                if updated_slack_bot_config:
-                    return updated_slack_bot_config, True
-                else:
-                    return None, False
-            return slack_bot_config, False
-
-        new_slack_bot_config = SlackBotConfig(
-            slack_workspace_id=slack_workspace_id,
-            channel_id=channel_id,
-            channel_name=channel_name,
-            event_ts=event_ts,
-            is_active=True
-        )
-
-        db.session.add(new_slack_bot_config)
-        db.session.commit()
-        return new_slack_bot_config, True
+            return slack_bot_configs[0], False
+        return None, False
     except Exception as e:
         logger.error(f"Error while saving SlackBotConfig: {slack_workspace_id}:{channel_id} with error: {e}")
         db.session.rollback()
         return None, False
 
 
+def upsert_slack_bot_configs(slack_bot_configs: []):
+    """
+    Bulk upsert SlackBotConfig rows, given as dicts of slack_workspace_id, channel_id, event_ts and channel_name, with
+    one INSERT ... ON CONFLICT ... RETURNING. Returns the inserted and re-activated rows, configs that were already
+    active are not returned.
+    """
+    rows = dedupe_rows(slack_bot_configs, ('slack_workspace_id', 'channel_id'))
+    if not rows:
+        return []
+    current_datetime = datetime.utcnow()
+    for row in rows:
+        row.setdefault('is_active', True)
+        row.setdefault('created_at', current_datetime)
+        row.setdefault('updated_at', current_datetime)
+    statement = insert(SlackBotConfig).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['slack_workspace_id', 'channel_id'],
+        set_={'is_active': True, 'updated_at': current_datetime},
+        where=SlackBotConfig.is_active.isnot(True))
+    return execute_upsert(statement.returning(SlackBotConfig))
+
+
 def update_slack_bot_config(slack_bot_config: SlackBotConfig, event_ts: str = None, channel_name: str = None,
                             is_active: bool = None):
     """
@@ -182,6 +260,41 @@ def get_last_slack_channel_scrap_schedule_for(slack_channel_id):
         SlackChannelDataScrapingSchedule.triggered_at.desc()).first()
 
 
+def get_latest_slack_channel_scrap_schedules(slack_channel_ids: [] = None):
+    """
+    Fetch the latest SlackChannelDataScrapingSchedule of every channel in one DISTINCT ON query, keyed by
+    slack_channel_id.
+    """
+    query = SlackChannelDataScrapingSchedule.query
+    if slack_channel_ids:
+        query = query.filter(SlackChannelDataScrapingSchedule.slack_channel_id.in_(slack_channel_ids))
+    latest_schedules = query.distinct(SlackChannelDataScrapingSchedule.slack_channel_id).order_by(
+        SlackChannelDataScrapingSchedule.slack_channel_id, SlackChannelDataScrapingSchedule.triggered_at.desc()).all()
+    return {schedule.slack_channel_id: schedule for schedule in latest_schedules}
+
+
+def delete_slack_channel_scrap_schedules_before(cutoff_datetime):
+    """
+    Delete SlackChannelDataScrapingSchedule rows triggered before cutoff_datetime, always keeping the latest row of
+    every channel since it holds the channel's watermark.
+    """
+    try:
+        latest_schedule_ids = db.session.query(SlackChannelDataScrapingSchedule.id).distinct(
+            SlackChannelDataScrapingSchedule.slack_channel_id).order_by(
+            SlackChannelDataScrapingSchedule.slack_channel_id,
+            SlackChannelDataScrapingSchedule.triggered_at.desc()).subquery()
+        deleted_count = SlackChannelDataScrapingSchedule.query.filter(
+            SlackChannelDataScrapingSchedule.triggered_at < cutoff_datetime,
+            SlackChannelDataScrapingSchedule.id.not_in(db.select(latest_schedule_ids.c.id))).delete(
+            synchronize_session=False)
+        db.session.commit()
+        return deleted_count
+    except Exception as e:
+        logger.error(f"Error while deleting SlackChannelDataScrapSchedule before: {cutoff_datetime} with error: {e}")
+        db.session.rollback()
+        return 0
+
+
 def get_source_token_config_by(user_email: str = None, source: str = None, token_config_md5: str = None,
                                is_active: bool = None):
     """
@@ -200,7 +313,12 @@ def get_source_token_config_by(user_email: str = None, source: str = None, token
     return SourceTokenRepository.query.filter_by(**filters).all()
 
 
-def update_source_token_config(source_token_config: SourceTokenRepository, is_active: bool = None):
+def get_source_token_config_by_id(source_token_id):
+    return SourceTokenRepository.query.get(source_token_id)
+
+
+def update_source_token_config(source_token_config: SourceTokenRepository, is_active: bool = None,
+                               token_config: dict = None):
     """
     Update an existing SourceTokenRepository instance in the database.
     """
@@ -210,6 +328,9 @@ def update_source_token_config(source_token_config: SourceTokenRepository, is_ac
             return None
         if is_active is not None:
             source_token_config.is_active = is_active
+        if token_config is not None:
+            source_token_config.token_config = token_config
+            source_token_config.token_config_md5 = get_token_config_md5(token_config)
         db.session.commit()
         return source_token_config
     except Exception as e:
@@ -220,34 +341,146 @@ def update_source_token_config(source_token_config: SourceTokenRepository, is_ac
 
 def create_token_config(user_email, source, token_config):
     """
-        Create a new SourceTokenRepository instance and add it to the database.
+        Upsert a SourceTokenRepository on (user_email, source, token_config_md5) in a single statement. An inactive
+        config is re-activated, is_created is only False when an active config already existed.
     """
     try:
-        token_config_md5 = hashlib.md5(json.dumps(token_config).encode('utf-8')).hexdigest()
+        upserted = upsert_token_configs([{'user_email': user_email, 'source': source, 'token_config': token_config}])
+        if upserted:
+            return upserted[0], True
         source_token_configs = get_source_token_config_by(user_email=user_email, source=source,
-                                                          token_config_md5=token_config_md5)
+                                                          token_config_md5=get_token_config_md5(token_config))
         if source_token_configs:
-            source_token_config = source_token_configs[0]
-            if source_token_config and not source_token_config.is_active:
-                updated_source_token_config = update_source_token_config(source_token_config, is_active=True)
-                if updated_source_token_config:
-                    return updated_source_token_config, True
-                else:
-                    return None, False
-            else:
-                return source_token_config, False
-
-        new_source_token = SourceTokenRepository(
-            user_email=user_email,
-            source=source,
-            token_config=token_config,
-            token_config_md5=token_config_md5
-        )
-        db.session.add(new_source_token)
-        db.session.commit()
-        return new_source_token, True
+            return source_token_configs[0], False
+        return None, False
     except Exception as e:
         logger.error(
             f"Error while saving Source Token: :{user_email}:{source} with error: {e}")
         db.session.rollback()
         return None, False
+
+
+def register_google_chat_token_config(user_email, token_config):
+    """
+    GOOGLE_CHAT rows are identified by (user_email, client_id), not by the md5 of their config that changes with
+    every access token. A re-authorization updates and re-activates the existing row in place, so that its space
+    watermarks carry over, and deactivates any other row of the same identity. is_created is only True for a new
+    identity.
+    """
+    try:
+        source_token_configs = [source_token_config for source_token_config in
+                                get_source_token_config_by(user_email=user_email, source='GOOGLE_CHAT')
+                                if source_token_config.token_config.get('client_id') == token_config.get('client_id')]
+        if not source_token_configs:
+            if not token_config.get('refresh_token'):
+                logger.error(f"Error while registering google chat Source Token: {user_email}: refresh_token not found")
+                return None, False
+            return create_token_config(user_email, 'GOOGLE_CHAT', token_config)
+        # The active row registered last is kept, its watermarks are the most recent ones
+        source_token_configs.sort(key=lambda source_token_config: (bool(source_token_config.is_active),
+                                                                   source_token_config.id), reverse=True)
+        source_token_config = source_token_configs[0]
+        if not token_config.get('refresh_token'):
+            # Google only sends a refresh token on the first consent of a user, the stored one stays valid
+            token_config = {**token_config, 'refresh_token': source_token_config.token_config.get('refresh_token')}
+        source_token_config.token_config = token_config
+        source_token_config.token_config_md5 = get_token_config_md5(token_config)
+        source_token_config.is_active = True
+        for duplicate_source_token_config in source_token_configs[1:]:
+            duplicate_source_token_config.is_active = False
+        db.session.commit()
+        return source_token_config, False
+    except Exception as e:
+        logger.error(f"Error while registering google chat Source Token: {user_email} with error: {e}")
+        db.session.rollback()
+        return None, False
+
+
+def upsert_token_configs(token_configs: []):
+    """
+    Bulk upsert SourceTokenRepository rows, given as dicts of user_email, source and token_config, with one
+    INSERT ... ON CONFLICT ... RETURNING. Returns the inserted and re-activated rows, configs that were already
+    active are not returned.
+    """
+    current_datetime = datetime.utcnow()
+    rows = []
+    for token_config in token_configs:
+        rows.append({'user_email': token_config['user_email'],
+                     'source': token_config['source'],
+                     'token_config': token_config['token_config'],
+                     'token_config_md5': get_token_config_md5(token_config['token_config']),
+                     'is_active': True,
+                     'created_at': current_datetime,
+                     'updated_at': current_datetime})
+    rows = dedupe_rows(rows, ('user_email', 'source', 'token_config_md5'))
+    if not rows:
+        return []
+    statement = insert(SourceTokenRepository).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_email', 'source', 'token_config_md5'],
+        set_={'is_active': True, 'updated_at': current_datetime},
+        where=SourceTokenRepository.is_active.isnot(True))
+    return execute_upsert(statement.returning(SourceTokenRepository))
+
+
+def get_google_chat_space_watermarks(source_token_id, space_names: [] = None):
+    """
+    Fetch the GoogleChatSpaceWatermark rows of a source token, keyed by space_name.
+    """
+    query = GoogleChatSpaceWatermark.query.filter_by(source_token_id=source_token_id)
+    if space_names:
+        query = query.filter(GoogleChatSpaceWatermark.space_name.in_(space_names))
+    return {watermark.space_name: watermark for watermark in query.all()}
+
+
+def upsert_google_chat_space_watermarks(source_token_id, space_watermarks: dict):
+    """
+    Bulk upsert the GoogleChatSpaceWatermark of every space in space_watermarks, space_name to the createTime of the
+    newest message scraped. A None createTime, no new message, keeps the stored watermark and only bumps
+    last_scraped_at.
+    """
+    if not space_watermarks:
+        return []
+    current_datetime = datetime.utcnow()
+    rows = [{'source_token_id': source_token_id,
+             'space_name': space_name,
+             'last_message_create_time': last_message_create_time,
+             'last_scraped_at': current_datetime,
+             'created_at': current_datetime,
+             'updated_at': current_datetime} for space_name, last_message_create_time in space_watermarks.items()]
+    statement = insert(GoogleChatSpaceWatermark).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['source_token_id', 'space_name'],
+        set_={'last_message_create_time': func.coalesce(statement.excluded.last_message_create_time,
+                                                        GoogleChatSpaceWatermark.last_message_create_time),
+              'last_scraped_at': current_datetime,
+              'updated_at': current_datetime})
+    return execute_upsert(statement.returning(GoogleChatSpaceWatermark))
+
+
+def get_token_config_md5(token_config):
+    return hashlib.md5(json.dumps(token_config).encode('utf-8')).hexdigest()
+
+
+def dedupe_rows(rows: [], key_columns: tuple):
+    """
+    ON CONFLICT DO UPDATE cannot affect the same row twice in one statement, keep the last row of every key.
+    """
+    deduped_rows = {}
+    for row in rows:
+        deduped_rows[tuple(row[column] for column in key_columns)] = dict(row)
+    return list(deduped_rows.values())
+
+
+def execute_upsert(statement):
+    """
+    Execute an ORM enabled upsert with RETURNING of its model and commit, returning the refreshed model instances.
+    """
+    try:
+        upserted_rows = db.session.scalars(statement, execution_options={'populate_existing': True}).all()
+        db.session.commit()
+        return upserted_rows
+    except Exception as e:
+        logger.error(f"Error while executing upsert with error: {e}")
+        db.session.rollback()
+        raise
@@ -0,0 +1,221 @@
+import csv
+import io
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+
+from persistance.models import db
+from utils.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_STORE_BATCH_SIZE = 10000
+
+SLACK_MESSAGE_COLUMNS = ('team_id', 'channel_id', 'ts', 'message_at', 'user_id', 'bot_id', 'subtype', 'thread_ts',
+                         'text', 'message')
+SENTRY_EVENT_COLUMNS = ('organization_slug', 'project_slug', 'event_id', 'date_created', 'issue_id', 'event_type',
+                        'platform', 'title', 'message', 'event')
+NEW_RELIC_VIOLATION_COLUMNS = ('account_id', 'violation_id', 'opened_at', 'closed_at', 'label', 'priority',
+                               'policy_name', 'condition_name', 'duration', 'violation')
+
+# Monthly partitions known to exist, per process
+_ensured_partitions = set()
+_ensured_partitions_lock = threading.Lock()
+
+
+class RowStream(io.TextIOBase):
+    """
+    Read-only text stream rendering an iterator of rows as CSV on demand, so COPY FROM STDIN consumes the rows
+    without the whole batch ever being rendered in memory.
+    """
+
+    def __init__(self, rows):
+        super().__init__()
+        self.__rows = iter(rows)
+        self.__buffer = io.StringIO()
+        self.__writer = csv.writer(self.__buffer)
+        self.__pending = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.__pending) < size:
+            row = next(self.__rows, None)
+            if row is None:
+                break
+            self.__writer.writerow(row)
+            self.__pending += self.__buffer.getvalue()
+            self.__buffer.seek(0)
+            self.__buffer.truncate(0)
+        if size < 0:
+            size = len(self.__pending)
+        chunk, self.__pending = self.__pending[:size], self.__pending[size:]
+        return chunk
+
+
+def get_partition_name(table_name: str, month_start: datetime):
+    return f'{table_name}_y{month_start.year:04d}m{month_start.month:02d}'
+
+
+def ensure_monthly_partitions(cursor, table_name: str, month_starts: set):
+    """
+    Creates the missing monthly partitions of table_name in the cursor's transaction and returns their names, to be
+    remembered once the transaction commits.
+    """
+    partition_names = []
+    for month_start in sorted(month_starts):
+        partition_name = get_partition_name(table_name, month_start)
+        with _ensured_partitions_lock:
+            if partition_name in _ensured_partitions:
+                continue
+        if month_start.month == 12:
+            month_end = month_start.replace(year=month_start.year + 1, month=1)
+        else:
+            month_end = month_start.replace(month=month_start.month + 1)
+        # Serialise concurrent loaders racing to create the same partition
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (partition_name,))
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF {table_name} "
+                       f"FOR VALUES FROM ('{month_start.isoformat()}') TO ('{month_end.isoformat()}')")
+        partition_names.append(partition_name)
+    return partition_names
+
+
+def copy_rows(table_name: str, columns: tuple, rows: list, partition_column: str):
+    """
+    Bulk loads rows, tuples ordered as columns, into table_name: rows are streamed with COPY FROM STDIN into a
+    temporary staging table and moved over with INSERT ... SELECT ... ON CONFLICT DO NOTHING, which de-duplicates
+    against rows already stored and within the batch. Returns the number of new rows.
+    """
+    if not rows:
+        return 0
+    partition_index = columns.index(partition_column)
+    month_starts = {row[partition_index].replace(day=1, hour=0, minute=0, second=0, microsecond=0) for row in rows}
+    column_names = ', '.join(columns)
+    staging_table_name = f'{table_name}_staging'
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        partition_names = ensure_monthly_partitions(cursor, table_name, month_starts)
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging_table_name} "
+                       f"(LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        cursor.copy_expert(f"COPY {staging_table_name} ({column_names}) FROM STDIN WITH (FORMAT csv)",
+                           RowStream(rows))
+        cursor.execute(f"INSERT INTO {table_name} ({column_names}) SELECT {column_names} FROM {staging_table_name} "
+                       f"ON CONFLICT DO NOTHING")
+        inserted_count = cursor.rowcount
+        connection.commit()
+        with _ensured_partitions_lock:
+            _ensured_partitions.update(partition_names)
+        return inserted_count
+    except Exception as e:
+        connection.rollback()
+        raise e
+    finally:
+        connection.close()
+
+
+class MessageStoreWriter:
+    """
+    Buffers rows of one message store table while a fetch streams pages in and loads them with copy_rows every
+    batch_size rows and on close. Load errors are logged and never fail the fetch.
+    """
+
+    def __init__(self, table_name: str, columns: tuple, partition_column: str,
+                 batch_size: int = MESSAGE_STORE_BATCH_SIZE):
+        self.table_name = table_name
+        self.columns = columns
+        self.partition_column = partition_column
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.__rows = []
+
+    def write(self, rows):
+        self.__rows.extend(rows)
+        if len(self.__rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        rows, self.__rows = self.__rows, []
+        if not rows:
+            return
+        try:
+            with start_span('message_store_load', table=self.table_name, rows=len(rows)):
+                self.rows_written += copy_rows(self.table_name, self.columns, rows, self.partition_column)
+        except Exception as e:
+            logger.error(f"Error while loading {len(rows)} rows into {self.table_name} with error: {e}")
+
+    def close(self):
+        self.flush()
+        logger.info(f"Loaded {self.rows_written} new rows into {self.table_name}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_slack_message_writer():
+    return MessageStoreWriter('slack_message', SLACK_MESSAGE_COLUMNS, 'message_at')
+
+
+def get_sentry_event_writer():
+    return MessageStoreWriter('sentry_event', SENTRY_EVENT_COLUMNS, 'date_created')
+
+
+def get_new_relic_violation_writer():
+    return MessageStoreWriter('new_relic_violation', NEW_RELIC_VIOLATION_COLUMNS, 'opened_at')
+
+
+def parse_iso_datetime(value: str):
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def epoch_millis_to_datetime(value):
+    if value is None:
+        return None
+    return datetime.utcfromtimestamp(value / 1000)
+
+
+def to_slack_message_rows(team_id: str, channel_id: str, messages: list):
+    rows = []
+    for message in messages:
+        ts = message.get('ts')
+        if not ts:
+            continue
+        rows.append((team_id, channel_id, ts, datetime.utcfromtimestamp(float(ts)), message.get('user'),
+                     message.get('bot_id'), message.get('subtype'), message.get('thread_ts'), message.get('text'),
+                     json.dumps(message)))
+    return rows
+
+
+def to_sentry_event_rows(organization_slug: str, project_slug: str, events: list):
+    rows = []
+    for event in events:
+        date_created = parse_iso_datetime(event.get('dateCreated'))
+        event_id = event.get('eventID') or event.get('id')
+        if not date_created or not event_id:
+            continue
+        rows.append((organization_slug, project_slug, event_id, date_created, event.get('groupID'),
+                     event.get('event.type') or event.get('type'), event.get('platform'), event.get('title'),
+                     event.get('message'), json.dumps(event)))
+    return rows
+
+
+def to_new_relic_violation_rows(account_id: str, violations: list):
+    rows = []
+    for violation in violations:
+        opened_at = epoch_millis_to_datetime(violation.get('opened_at'))
+        if not opened_at or violation.get('id') is None:
+            continue
+        rows.append((str(account_id), violation['id'], opened_at, epoch_millis_to_datetime(violation.get('closed_at')),
+                     violation.get('label'), violation.get('priority'), violation.get('policy_name'),
+                     violation.get('condition_name'), violation.get('duration'), json.dumps(violation)))
+    return rows
@@ -16,7 +16,9 @@ class SlackWorkspaceConfig(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
 
-    __table_args__ = (db.UniqueConstraint('team_id', 'bot_user_id', 'bot_auth_token'),)
+    __table_args__ = (db.UniqueConstraint('team_id', 'bot_user_id', 'bot_auth_token'),
+                      db.Index('ix_slack_workspace_config_active_team_id', 'team_id',
+                               postgresql_where=db.text('is_active')),)
 
     def to_dict(self):
         return {'id': self.id, 'name': self.team_name, 'team_id': self.team_id, 'bot_user_id': self.bot_user_id,
@@ -41,7 +43,11 @@ class SlackBotConfig(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
 
-    __table_args__ = (db.UniqueConstraint('slack_workspace_id', 'channel_id'),)
+    __table_args__ = (db.UniqueConstraint('slack_workspace_id', 'channel_id'),
+                      db.Index('ix_slack_bot_config_active_channel_id', 'channel_id',
+                               postgresql_where=db.text('is_active')),
+                      db.Index('ix_slack_bot_config_active_slack_workspace_id', 'slack_workspace_id',
+                               postgresql_where=db.text('is_active')),)
 
     def to_dict(self):
         if self.channel_name:
@@ -68,7 +74,9 @@ class SlackChannelDataScrapingSchedule(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
 
     __table_args__ = (
-        db.UniqueConstraint('slack_channel_id', 'data_extraction_from', 'data_extraction_to'),)
+        db.UniqueConstraint('slack_channel_id', 'data_extraction_from', 'data_extraction_to'),
+        db.Index('ix_slack_channel_data_scraping_schedule_channel_triggered_at', 'slack_channel_id',
+                 db.text('triggered_at DESC')),)
 
     def __repr__(self):
         return f'<Schedule: {self.slack_channel_id}:{self.data_extraction_from}:{self.data_extraction_to}>'
@@ -85,7 +93,9 @@ class SourceTokenRepository(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
 
-    __table_args__ = (db.UniqueConstraint('user_email', 'source', 'token_config_md5'),)
+    __table_args__ = (db.UniqueConstraint('user_email', 'source', 'token_config_md5'),
+                      db.Index('ix_source_token_repository_active_source', 'source',
+                               postgresql_where=db.text('is_active')),)
 
     def to_dict(self):
         return {'id': self.id, 'user_email': self.user_email, 'source': self.source,
@@ -93,3 +103,97 @@ class SourceTokenRepository(db.Model):
 
     def __repr__(self):
         return f'<Token Config {self.id}:{self.user_email}:{self.source}:>'
+
+
+class GoogleChatSpaceWatermark(db.Model):
+    """
+    createTime of the newest message scraped from a google chat space with a source token, the next scrape of the
+    space only asks for messages created after it. Kept as the RFC 3339 string the API returns, nanoseconds included.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    source_token_id = db.Column(db.Integer, db.ForeignKey('source_token_repository.id'), nullable=False)
+    source_token = db.relationship('SourceTokenRepository', backref='google_chat_space_watermarks')
+    space_name = db.Column(db.String(255), nullable=False)
+    last_message_create_time = db.Column(db.String(64), nullable=True)
+    last_scraped_at = db.Column(db.DateTime, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
+
+    __table_args__ = (db.UniqueConstraint('source_token_id', 'space_name'),)
+
+    def __repr__(self):
+        return f'<Google Chat Space Watermark {self.source_token_id}:{self.space_name}:{self.last_message_create_time}>'
+
+
+class SlackMessage(db.Model):
+    """
+    Scraped slack messages, range partitioned by month of message_at. Partitions are created by the message store
+    loader as months show up, see persistance.message_store.
+    """
+    team_id = db.Column(db.String(255), nullable=True)
+    channel_id = db.Column(db.String(255), primary_key=True)
+    ts = db.Column(db.String(255), primary_key=True)
+    message_at = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.String(255), nullable=True)
+    bot_id = db.Column(db.String(255), nullable=True)
+    subtype = db.Column(db.String(255), nullable=True)
+    thread_ts = db.Column(db.String(255), nullable=True)
+    text = db.Column(db.Text, nullable=True)
+    message = db.Column(db.JSON, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now(), nullable=True)
+
+    __table_args__ = (db.Index('ix_slack_message_bot_id_message_at', 'bot_id', 'message_at'),
+                      {'postgresql_partition_by': 'RANGE (message_at)'},)
+
+    def __repr__(self):
+        return f'<Slack Message {self.channel_id}:{self.ts}>'
+
+
+class SentryEvent(db.Model):
+    """
+    Scraped sentry events, range partitioned by month of date_created.
+    """
+    organization_slug = db.Column(db.String(255), nullable=False)
+    project_slug = db.Column(db.String(255), primary_key=True)
+    event_id = db.Column(db.String(255), primary_key=True)
+    date_created = db.Column(db.DateTime, primary_key=True)
+    issue_id = db.Column(db.String(255), nullable=True)
+    event_type = db.Column(db.String(255), nullable=True)
+    platform = db.Column(db.String(255), nullable=True)
+    title = db.Column(db.Text, nullable=True)
+    message = db.Column(db.Text, nullable=True)
+    event = db.Column(db.JSON, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now(), nullable=True)
+
+    __table_args__ = (db.Index('ix_sentry_event_issue_id_date_created', 'issue_id', 'date_created'),
+                      {'postgresql_partition_by': 'RANGE (date_created)'},)
+
+    def __repr__(self):
+        return f'<Sentry Event {self.project_slug}:{self.event_id}>'
+
+
+class NewRelicViolation(db.Model):
+    """
+    Scraped new relic alert violations, range partitioned by month of opened_at.
+    """
+    account_id = db.Column(db.String(255), primary_key=True)
+    violation_id = db.Column(db.BigInteger, primary_key=True)
+    opened_at = db.Column(db.DateTime, primary_key=True)
+    closed_at = db.Column(db.DateTime, nullable=True)
+    label = db.Column(db.Text, nullable=True)
+    priority = db.Column(db.String(255), nullable=True)
+    policy_name = db.Column(db.String(255), nullable=True)
+    condition_name = db.Column(db.String(255), nullable=True)
+    duration = db.Column(db.BigInteger, nullable=True)
+    violation = db.Column(db.JSON, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now(), nullable=True)
+
+    __table_args__ = (db.Index('ix_new_relic_violation_policy_name_opened_at', 'policy_name', 'opened_at'),
+                      {'postgresql_partition_by': 'RANGE (opened_at)'},)
+
+    def __repr__(self):
+        return f'<New Relic Violation {self.account_id}:{self.violation_id}>'
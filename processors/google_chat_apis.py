@@ -0,0 +1,251 @@
+import csv
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from env_vars import RAW_DATA_S3_BUCKET_NAME, PUSH_TO_S3
+from utils.job_progress import JobProgressTracker
+from utils.paginator import Paginator, PageTokenStrategy
+from utils.publishsing_client import publish_object_file_to_s3
+from utils.time_utils import get_current_datetime
+from utils.tracing import start_span, traced, bind_current_span
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CHAT_API_SERVICE_NAME = 'chat'
+GOOGLE_CHAT_API_VERSION = 'v1'
+GOOGLE_CHAT_PAGE_SIZE = 1000
+# googleapiclient retries 429s, 5xx and connection errors this many times with its own exponential backoff
+GOOGLE_API_NUM_RETRIES = 5
+DEFAULT_MAX_WORKERS = 4
+# Access tokens live an hour, refreshing this long before they expire keeps a scrape from running into the expiry
+GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS = 300
+GOOGLE_CREDENTIAL_KEYS = ('token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes')
+
+# Credentials are shared by every processor of the same credential in the process, a token refreshed by one scrape
+# is reused by the next one instead of being refreshed again
+_credentials_cache = {}
+_credentials_cache_lock = threading.Lock()
+# The chat discovery document shipped with googleapiclient, parsed once per process
+_discovery_document = None
+_discovery_document_lock = threading.Lock()
+# googleapiclient services are not thread safe, every thread keeps its own chat service per credential
+_thread_local = threading.local()
+
+
+def credentials_to_dict(credentials):
+    return {'token': credentials.token,
+            'refresh_token': credentials.refresh_token,
+            'token_uri': credentials.token_uri,
+            'client_id': credentials.client_id,
+            'client_secret': credentials.client_secret,
+            'scopes': credentials.scopes,
+            'expiry': credentials.expiry.isoformat() if credentials.expiry else None}
+
+
+def get_chat_discovery_document():
+    global _discovery_document
+    with _discovery_document_lock:
+        if _discovery_document is None:
+            import googleapiclient.discovery_cache
+
+            _discovery_document = json.loads(
+                googleapiclient.discovery_cache.get_static_doc(GOOGLE_CHAT_API_SERVICE_NAME, GOOGLE_CHAT_API_VERSION))
+        return _discovery_document
+
+
+def write_csv_with_header(rows_file_path: str, file_path: str, columns: list):
+    """
+    Writes the header row of columns, then the rows of the headerless CSV at rows_file_path padded to every column.
+    Rows are streamed, the file is never loaded in memory.
+    """
+    with open(rows_file_path, newline='') as rows_file, open(file_path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(columns)
+        for row in csv.reader(rows_file):
+            writer.writerow(row + [''] * (len(columns) - len(row)))
+
+
+class GoogleChatApiProcessor:
+    def __init__(self, credentials_config: dict):
+        self.__credentials_config = credentials_config
+        self.__credentials_key = (credentials_config.get('client_id'), credentials_config.get('refresh_token'))
+        self.credentials = None
+        self.auth_error = None
+        self.progress_tracker = JobProgressTracker(source='google_chat')
+
+    def get_credentials(self):
+        if self.credentials is None:
+            self.credentials, _ = self.__get_cached_credentials()
+        return self.credentials
+
+    def __get_cached_credentials(self):
+        import google.oauth2.credentials
+
+        with _credentials_cache_lock:
+            cached_credentials = _credentials_cache.get(self.__credentials_key)
+            if cached_credentials is None:
+                credentials = google.oauth2.credentials.Credentials(
+                    **{key: self.__credentials_config[key] for key in GOOGLE_CREDENTIAL_KEYS
+                       if key in self.__credentials_config})
+                if self.__credentials_config.get('expiry'):
+                    # google-auth compares expiry to naive utc datetimes
+                    credentials.expiry = datetime.fromisoformat(self.__credentials_config['expiry']).replace(
+                        tzinfo=None)
+                cached_credentials = (credentials, threading.Lock())
+                _credentials_cache[self.__credentials_key] = cached_credentials
+            return cached_credentials
+
+    def refresh_credentials(self):
+        """
+        Refreshes the access token up front when it expires within GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS, so that
+        concurrent workers do not all refresh it at once, nor a scrape run into the expiry. Returns False, and keeps
+        the error in auth_error, when the refresh token is no longer accepted.
+        """
+        import google.auth.exceptions
+        import google.auth.transport.requests
+
+        credentials, refresh_lock = self.__get_cached_credentials()
+        self.credentials = credentials
+        with refresh_lock:
+            refresh_before = datetime.utcnow() + timedelta(seconds=GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS)
+            if credentials.token and (credentials.expiry is None or credentials.expiry > refresh_before):
+                return True
+            if not credentials.refresh_token:
+                return credentials.valid
+            try:
+                credentials.refresh(google.auth.transport.requests.Request())
+                return True
+            except google.auth.exceptions.RefreshError as e:
+                logger.error(f"Error while refreshing google chat credentials with error: {e}")
+                self.auth_error = e
+                return False
+            except google.auth.exceptions.TransportError as e:
+                # The token endpoint could not be reached, the credentials themselves may still be fine
+                logger.error(f"Transport error while refreshing google chat credentials with error: {e}")
+                return False
+
+    def get_refreshed_credentials_config(self):
+        """
+        The credentials config the processor was created with, carrying the access token and expiry it was
+        refreshed to, None when the token did not change. Callers persist it so the next run reuses the new token.
+        """
+        credentials = self.get_credentials()
+        if credentials.token == self.__credentials_config.get('token'):
+            return None
+        return {**self.__credentials_config, 'token': credentials.token,
+                'expiry': credentials.expiry.isoformat() if credentials.expiry else None}
+
+    def get_chat_service(self):
+        chat_services = getattr(_thread_local, 'chat_services', None)
+        if chat_services is None:
+            chat_services = _thread_local.chat_services = {}
+        chat_service = chat_services.get(self.__credentials_key)
+        if chat_service is None:
+            import googleapiclient.discovery
+
+            # Built from the static discovery document, without fetching it from googleapis.com
+            chat_service = googleapiclient.discovery.build_from_document(get_chat_discovery_document(),
+                                                                         credentials=self.get_credentials())
+            chat_services[self.__credentials_key] = chat_service
+        return chat_service
+
+    @traced('google_chat.fetch_spaces')
+    def fetch_spaces(self):
+        """
+        Names of every space the credentials' user is a member of, None when they could not be listed.
+        """
+        chat_service = self.get_chat_service()
+
+        def fetch_spaces_page(page_token):
+            with start_span('page_fetch', source='google_chat'):
+                return chat_service.spaces().list(pageSize=GOOGLE_CHAT_PAGE_SIZE, pageToken=page_token).execute(
+                    num_retries=GOOGLE_API_NUM_RETRIES)
+
+        try:
+            return [space['name'] for response in Paginator(fetch_spaces_page, PageTokenStrategy())
+                    for space in response.get('spaces', [])]
+        except Exception as e:
+            logger.error(f"Exception occurred while listing google chat spaces with error: {e}")
+            return None
+
+    @traced('google_chat.fetch_space_messages')
+    def fetch_space_messages(self, space_name: str, after_create_time: str = None):
+        """
+        Streams the messages of space_name created after after_create_time, the whole history when None, page by
+        page into a CSV exported to S3. Returns success, the number of messages and the createTime of the newest
+        one, the space's next watermark, None when there was no new message.
+        """
+        chat_service = self.get_chat_service()
+        message_filter = f'createTime > "{after_create_time}"' if after_create_time else None
+
+        def fetch_messages_page(page_token):
+            with start_span('page_fetch', source='google_chat', space_name=space_name):
+                return chat_service.spaces().messages().list(parent=space_name, pageSize=GOOGLE_CHAT_PAGE_SIZE,
+                                                             pageToken=page_token, filter=message_filter).execute(
+                    num_retries=GOOGLE_API_NUM_RETRIES)
+
+        csv_file_name = f"{space_name.split('/')[-1]}-{get_current_datetime()}-raw_data.csv"
+        file_path = os.path.join(os.getcwd(), 'downloads', 'data', csv_file_name)
+        rows_file_path = f'{file_path}.rows'
+        # One column per message field in first seen order, the layout of pd.DataFrame(messages).to_csv. The header
+        # is only known once every page was read, rows are streamed to a headerless file until then
+        columns = {}
+        message_count = 0
+        last_message_create_time = None
+        try:
+            with open(rows_file_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                for response in Paginator(fetch_messages_page, PageTokenStrategy()):
+                    messages = response.get('messages', [])
+                    with start_span('serialize', rows=len(messages)):
+                        for message in messages:
+                            for key in message:
+                                columns.setdefault(key)
+                            writer.writerow([message.get(column) for column in columns])
+                    if messages:
+                        # Messages are listed oldest first
+                        last_message_create_time = messages[-1]['createTime']
+                    message_count += len(messages)
+                    self.progress_tracker.record_page(len(messages))
+            if message_count > 0:
+                write_csv_with_header(rows_file_path, file_path, list(columns))
+                if PUSH_TO_S3:
+                    publish_object_file_to_s3(file_path, RAW_DATA_S3_BUCKET_NAME, csv_file_name)
+                logger.info(f"Successfully extracted {message_count} messages for space: {space_name}")
+            success = True
+        except Exception as e:
+            logger.error(f"Exception occurred while fetching messages for space: {space_name} with error: {e}")
+            success = False
+        remove_file_paths = [rows_file_path]
+        if not success or PUSH_TO_S3:
+            remove_file_paths.append(file_path)
+        for remove_file_path in remove_file_paths:
+            try:
+                if os.path.exists(remove_file_path):
+                    os.remove(remove_file_path)
+            except OSError as e:
+                logger.error(f"Error while deleting file '{remove_file_path}' with error: {e}")
+        return {'success': success, 'messages': message_count,
+                'last_message_create_time': last_message_create_time if success else None}
+
+    def fetch_spaces_messages(self, space_watermarks: dict, max_workers: int = DEFAULT_MAX_WORKERS):
+        """
+        Scrapes every space of space_watermarks, space_name to the createTime to resume after, over max_workers
+        threads sharing the credentials. Returns the result of fetch_space_messages of every space, keyed by
+        space_name, empty when the credentials could not be refreshed.
+        """
+        if not space_watermarks or not self.refresh_credentials():
+            return {}
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='google-chat') as executor:
+            fetch_space_messages = bind_current_span(self.fetch_space_messages)
+            futures = {executor.submit(fetch_space_messages, space_name, after_create_time): space_name
+                       for space_name, after_create_time in space_watermarks.items()}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                self.progress_tracker.set_fraction_done(len(results) / len(futures))
+        return results
@@ -0,0 +1,277 @@
+import hashlib
+import logging
+import os
+import threading
+
+import pandas as pd
+from cachetools import TTLCache
+
+from env_vars import NEW_RELIC_RAW_DATA_S3_BUCKET_NAME, PUSH_TO_S3
+from utils.http_client import get_http_session
+from utils.job_progress import JobProgressTracker, get_response_size
+from utils.publishsing_client import publish_object_file_to_s3
+from utils.retry_utils import RetryPolicy, request_with_retry
+from utils.tracing import start_span, traced
+
+logger = logging.getLogger(__name__)
+
+NERDGRAPH_MAX_REQUESTS = 250
+ALERT_POLICIES_CACHE_TTL_SECONDS = 15 * 60
+
+# Same TTL and key as the REST client's policy cache, so the two processors behave alike for repeated runs
+_alert_policies_cache = TTLCache(maxsize=256, ttl=ALERT_POLICIES_CACHE_TTL_SECONDS)
+_alert_policies_cache_lock = threading.Lock()
+
+# Policies and NRQL conditions are searched in the same document, each with its own cursor, so the first request
+# returns a page of both and later requests only carry the search that still has a next cursor.
+ALERTS_CONFIGURATION_QUERY = """
+query($accountId: Int!, $policiesCursor: String, $conditionsCursor: String, $withPolicies: Boolean!,
+      $withConditions: Boolean!, $conditionsCriteria: AlertsNrqlConditionsSearchCriteriaInput) {
+  actor {
+    account(id: $accountId) {
+      alerts {
+        policiesSearch(cursor: $policiesCursor) @include(if: $withPolicies) {
+          nextCursor
+          policies {
+            id
+            name
+            incidentPreference
+          }
+        }
+        nrqlConditionsSearch(cursor: $conditionsCursor, searchCriteria: $conditionsCriteria)
+        @include(if: $withConditions) {
+          nextCursor
+          nrqlConditions {
+            id
+            name
+            type
+            enabled
+            policyId
+            runbookUrl
+            violationTimeLimitSeconds
+            nrql {
+              query
+              evaluationOffset
+            }
+            terms {
+              operator
+              priority
+              threshold
+              thresholdDuration
+              thresholdOccurrences
+            }
+            signal {
+              aggregationWindow
+              aggregationMethod
+              aggregationDelay
+              evaluationOffset
+              fillOption
+              fillValue
+            }
+            expiration {
+              expirationDuration
+              openViolationOnExpiration
+              closeViolationsOnExpiration
+            }
+            ... on AlertsNrqlStaticCondition {
+              valueFunction
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class NewRelicNerdGraphApiProcessor:
+    """
+    Drop-in alternative to NewRelicRestApiProcessor for alert configuration. Pulls an account's policies and NRQL
+    conditions through cursor paginated NerdGraph searches and exports them in the REST v2 CSV schema.
+    """
+    client = None
+
+    def __init__(self, new_relic_api_key, account_id, new_relic_query_key=None):
+        self.__new_relic_key = new_relic_api_key
+        self.__account_id = account_id
+        self.__new_relic_query_key = new_relic_query_key
+        self.graphql_url = f'https://api.newrelic.com/graphql'
+        self.retry_policy = RetryPolicy(source='new_relic')
+        self.progress_tracker = JobProgressTracker(source='new_relic')
+
+    def get_session(self):
+        return get_http_session(self.graphql_url, self.__new_relic_key, {
+            'API-Key': self.__new_relic_key,
+            'Content-Type': 'application/json'
+        })
+
+    @traced('new_relic.fetch_alert_configuration')
+    def fetch_alert_configuration(self, with_policies: bool = True, with_conditions: bool = True,
+                                  policy_id=None):
+        all_policies = []
+        all_nrql_conditions = []
+        policies_cursor = None
+        conditions_cursor = None
+        conditions_criteria = {'policyId': str(policy_id)} if policy_id else None
+        session = self.get_session()
+        print(f"Fetching alert configuration from NerdGraph for account_id: {self.__account_id}")
+        for i in range(0, NERDGRAPH_MAX_REQUESTS):
+            if not with_policies and not with_conditions:
+                break
+            variables = {
+                'accountId': int(self.__account_id),
+                'policiesCursor': policies_cursor,
+                'conditionsCursor': conditions_cursor,
+                'withPolicies': with_policies,
+                'withConditions': with_conditions,
+                'conditionsCriteria': conditions_criteria,
+            }
+            response = request_with_retry(session, 'POST', self.graphql_url, self.retry_policy,
+                                          json={'query': ALERTS_CONFIGURATION_QUERY, 'variables': variables})
+            if response is None:
+                return None, None
+            data = response.json()
+            if data.get('errors'):
+                print(f"Error: {data['errors']}")
+                return None, None
+            alerts = data['data']['actor']['account']['alerts']
+            self.progress_tracker.record_page(
+                len((alerts.get('policiesSearch') or {}).get('policies') or []) +
+                len((alerts.get('nrqlConditionsSearch') or {}).get('nrqlConditions') or []),
+                get_response_size(response))
+            if with_policies:
+                policies_search = alerts['policiesSearch']
+                all_policies.extend(policies_search['policies'])
+                policies_cursor = policies_search['nextCursor']
+                with_policies = policies_cursor is not None
+            if with_conditions:
+                conditions_search = alerts['nrqlConditionsSearch']
+                all_nrql_conditions.extend(conditions_search['nrqlConditions'])
+                conditions_cursor = conditions_search['nextCursor']
+                with_conditions = conditions_cursor is not None
+            print(f"Found {len(all_policies)} policies and {len(all_nrql_conditions)} nrql conditions "
+                  f"after {i + 1} requests")
+        return [to_rest_policy(policy) for policy in all_policies], \
+            [to_rest_nrql_condition(condition) for condition in all_nrql_conditions]
+
+    def fetch_alert_policies(self, export: bool = True, use_cache: bool = True):
+        cache_key = (self.__account_id, hashlib.md5(self.__new_relic_key.encode('utf-8')).hexdigest())
+        all_policies = None
+        if use_cache:
+            with _alert_policies_cache_lock:
+                all_policies = _alert_policies_cache.get(cache_key)
+            if all_policies is not None:
+                print(f"Using cached alert policies for account_id: {self.__account_id}")
+        if all_policies is None:
+            all_policies, _ = self.fetch_alert_configuration(with_policies=True, with_conditions=False)
+            if not all_policies:
+                logger.error(f"No alert policies found for account: {self.__account_id}")
+                return None
+            with _alert_policies_cache_lock:
+                _alert_policies_cache[cache_key] = all_policies
+        if export:
+            self.__publish_dataframe(pd.DataFrame(all_policies), f"{self.__account_id}-all_policies_data.csv")
+            print(f"Successfully extracted {len(all_policies)} alert policies for account: {self.__account_id}")
+        return all_policies
+
+    def fetch_alert_policies_nrql_conditions(self, policy_ids: [] = None, max_workers: int = None):
+        policy_id_filter = set()
+        for policy in policy_ids or []:
+            policy_id = policy.get('id', None) if isinstance(policy, dict) else policy
+            if policy_id:
+                policy_id_filter.add(int(policy_id))
+        single_policy_id = next(iter(policy_id_filter)) if len(policy_id_filter) == 1 else None
+        _, all_policies_nrql_conditions = self.fetch_alert_configuration(with_policies=False, with_conditions=True,
+                                                                         policy_id=single_policy_id)
+        if all_policies_nrql_conditions and policy_id_filter:
+            all_policies_nrql_conditions = [condition for condition in all_policies_nrql_conditions
+                                            if condition['policy_id'] in policy_id_filter]
+        if not all_policies_nrql_conditions:
+            logger.error(f"No alert policy nrql conditions found for account: {self.__account_id}")
+            return None
+        self.__publish_dataframe(pd.DataFrame(all_policies_nrql_conditions),
+                                 f"{self.__account_id}-all_policies_nrql_conditions_data.csv")
+        print(f"Successfully extracted {len(all_policies_nrql_conditions)} "
+              f"policies nrql conditions for account: {self.__account_id}")
+        return all_policies_nrql_conditions
+
+    def __publish_dataframe(self, raw_data: pd.DataFrame, csv_file_name: str):
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        file_path = os.path.join(base_dir, csv_file_name)
+        with start_span('serialize', rows=raw_data.shape[0]):
+            raw_data.to_csv(file_path, index=False)
+        if PUSH_TO_S3:
+            publish_object_file_to_s3(file_path, NEW_RELIC_RAW_DATA_S3_BUCKET_NAME, csv_file_name)
+            try:
+                os.remove(file_path)
+                logger.error(f"File '{file_path}' deleted successfully.")
+            except FileNotFoundError:
+                logger.error(f"File '{file_path}' not found.")
+            except PermissionError:
+                logger.error(f"Permission error. You may not have the necessary permissions to delete the file.")
+            except Exception as e:
+                logger.error(f"An error occurred: {e}")
+
+
+def lower_enum(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def optional_str(value):
+    return str(value) if value is not None else None
+
+
+def to_rest_policy(policy: dict):
+    return {
+        'id': int(policy['id']),
+        'incident_preference': policy.get('incidentPreference'),
+        'name': policy.get('name'),
+    }
+
+
+def to_rest_nrql_condition(condition: dict):
+    """
+    Maps a NerdGraph NRQL condition onto the alerts_nrql_conditions.json v2 shape.
+    """
+    nrql = condition.get('nrql') or {}
+    signal = condition.get('signal') or {}
+    expiration = condition.get('expiration') or {}
+    terms = []
+    for term in condition.get('terms') or []:
+        threshold_duration = term.get('thresholdDuration')
+        terms.append({
+            'duration': str(threshold_duration // 60) if threshold_duration is not None else None,
+            'operator': lower_enum(term.get('operator')),
+            'priority': lower_enum(term.get('priority')),
+            'threshold': optional_str(term.get('threshold')),
+            'time_function': 'all' if term.get('thresholdOccurrences') == 'ALL' else 'any',
+        })
+    return {
+        'type': lower_enum(condition.get('type')),
+        'id': int(condition['id']),
+        'name': condition.get('name'),
+        'runbook_url': condition.get('runbookUrl'),
+        'enabled': condition.get('enabled'),
+        'value_function': lower_enum(condition.get('valueFunction')),
+        'violation_time_limit_seconds': condition.get('violationTimeLimitSeconds'),
+        'terms': terms,
+        'nrql': {
+            'query': nrql.get('query'),
+            'since_value': optional_str(nrql.get('evaluationOffset')),
+        },
+        'signal': {
+            'aggregation_window': optional_str(signal.get('aggregationWindow')),
+            'aggregation_method': lower_enum(signal.get('aggregationMethod')),
+            'aggregation_delay': optional_str(signal.get('aggregationDelay')),
+            'evaluation_offset': optional_str(signal.get('evaluationOffset')),
+            'fill_option': lower_enum(signal.get('fillOption')),
+            'fill_value': optional_str(signal.get('fillValue')),
+        },
+        'expiration': {
+            'expiration_duration': optional_str(expiration.get('expirationDuration')),
+            'open_violation_on_expiration': expiration.get('openViolationOnExpiration'),
+            'close_violations_on_expiration': expiration.get('closeViolationsOnExpiration'),
+        },
+        'policy_id': int(condition['policyId']),
+    }
@@ -1,25 +1,58 @@
+import functools
+import hashlib
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
 
 import pandas as pd
 from datetime import datetime
 
 import requests
+from cachetools import TTLCache
 
-from env_vars import NEW_RELIC_RAW_DATA_S3_BUCKET_NAME, PUSH_TO_S3
+from env_vars import NEW_RELIC_RAW_DATA_S3_BUCKET_NAME, PUSH_TO_S3, PUSH_TO_MESSAGE_STORE
+from persistance.message_store import get_new_relic_violation_writer, to_new_relic_violation_rows
+from utils.http_client import get_http_session
+from utils.job_progress import JobProgressTracker, get_response_size
+from utils.paginator import Paginator, PageNumberStrategy
 from utils.publishsing_client import publish_object_file_to_s3
+from utils.retry_utils import RetryPolicy, request_with_retry
+from utils.tracing import start_span, traced, bind_current_span
 
 logger = logging.getLogger(__name__)
 
+NEW_RELIC_MAX_PAGES = 250
+DEFAULT_MAX_WORKERS = 8
+ALERT_POLICIES_CACHE_TTL_SECONDS = 15 * 60
+# NRQL caps TIMESERIES at 366 buckets per query, longer windows are split into several queries
+NRQL_MAX_TIMESERIES_BUCKETS = 366
+NRQL_ROLLUP_BUCKETS = {'1 hour': 60 * 60, '1 day': 24 * 60 * 60}
+NEW_RELIC_API_BASE_URL = 'https://api.newrelic.com/v2'
+
+# Alert policies keyed by (account_id, md5 of api key), shared by every processor in the process
+_alert_policies_cache = TTLCache(maxsize=256, ttl=ALERT_POLICIES_CACHE_TTL_SECONDS)
+_alert_policies_cache_lock = threading.Lock()
+
 
 class NewRelicRestApiProcessor:
     client = None
 
-    def __init__(self, new_relic_api_key, account_id, new_relic_query_key=None):
+    def __init__(self, new_relic_api_key, account_id, new_relic_query_key=None, api_base_url=NEW_RELIC_API_BASE_URL):
         self.__new_relic_key = new_relic_api_key
         self.__account_id = account_id
         self.__new_relic_query_key = new_relic_query_key
-        self.base_url = f'https://api.newrelic.com/v2'
+        self.base_url = api_base_url
+        self.insights_url = f'https://insights-api.newrelic.com/v1/accounts/{self.__account_id}/query'
+        self.retry_policy = RetryPolicy(source='new_relic')
+        self.progress_tracker = JobProgressTracker(source='new_relic')
+
+    def get_session(self):
+        return get_http_session(self.base_url, self.__new_relic_key, {
+            'Api-Key': self.__new_relic_key,
+            'Content-Type': 'application/json'
+        })
 
     def fetch_services(self, account_id):
         services_url = f'{self.base_url}/applications.json'
@@ -37,10 +70,11 @@ class NewRelicRestApiProcessor:
 
         try:
             # Make the API request to get the list of services
-            response = requests.get(services_url, headers=headers, params=params)
+            response = request_with_retry(self.get_session(), 'GET', services_url, self.retry_policy,
+                                          headers=headers, params=params)
 
-            # Check if the request was successful (status code 200)
-            if response.status_code == 200:
+            # Check if the request was successful
+            if response is not None:
                 # Parse the JSON response
                 services_data = response.json()
 
@@ -49,55 +83,29 @@ class NewRelicRestApiProcessor:
                 for service in services:
                     print(f"Service Name: {service['name']}, Service ID: {service['id']}")
                 return services
-            else:
-                print(f"Error: {response.status_code}, {response.text}")
         except Exception as e:
             print(f"An error occurred: {e}")
         return None
 
-    def fetch_alert_violations(self, start_date: str = None, end_date: str = None):
-        alerts_violations_url = f'{self.base_url}/alerts_violations.json'
-
-        # Set up the headers with the API key
-        headers = {
-            'Api-Key': self.__new_relic_key,
-            'Content-Type': 'application/json'
-        }
-
+    @traced('new_relic.fetch_alert_violations')
+    def fetch_alert_violations(self, start_date: str = None, end_date: str = None, max_workers: int = None):
         if end_date is None or end_date == '':
             end_date = datetime.now().strftime('%Y-%m-%d')
 
         if start_date is None or start_date == '':
             start_date = (datetime.now() - pd.DateOffset(years=1)).strftime('%Y-%m-%d')
 
-        all_violations = []
-        try:
-            # Make the API request to get the list of services
-            print(f"Fetching violations from {start_date} to {end_date} for account_id: {self.__account_id}")
-            for i in range(0, 250):
-                params = {
-                    'page': i,
-                    'start_date': start_date,
-                    'end_date': end_date
-                }
-                response = requests.get(alerts_violations_url, headers=headers, params=params)
-
-                # Check if the request was successful (status code 200)
-                if response.status_code == 200:
-                    # Parse the JSON response
-                    alerts_data = response.json()
-
-                    # Extract and print the list of services
-                    violations = alerts_data['violations']
-                    all_violations.extend(violations)
-                    print(f"Found {len(violations)} violations on page {i}")
-                    if len(violations) <= 0:
-                        break
-                else:
-                    print(f"Error: {response.status_code}, {response.text}")
-                    continue
-        except Exception as e:
-            print(f"An error occurred: {e}")
+        if max_workers and max_workers > 1:
+            all_violations = self.fetch_alert_violations_concurrently(start_date, end_date, max_workers)
+        else:
+            all_violations = self.__fetch_alert_violations_serially(start_date, end_date)
+        if all_violations is None:
+            logger.error(f"Failed to fetch alert violations for account: {self.__account_id}")
+            return False
+
+        if PUSH_TO_MESSAGE_STORE and all_violations:
+            with get_new_relic_violation_writer() as message_store_writer:
+                message_store_writer.write(to_new_relic_violation_rows(self.__account_id, all_violations))
 
         try:
             raw_data = pd.DataFrame(all_violations)
@@ -106,7 +114,8 @@ class NewRelicRestApiProcessor:
                 base_dir = os.path.dirname(os.path.abspath(__file__))
                 csv_file_name = f"{self.__account_id}-{end_date}-all_violations_data.csv"
                 file_path = os.path.join(base_dir, csv_file_name)
-                raw_data.to_csv(file_path, index=False)
+                with start_span('serialize', rows=raw_data.shape[0]):
+                    raw_data.to_csv(file_path, index=False)
                 if PUSH_TO_S3:
                     publish_object_file_to_s3(file_path, NEW_RELIC_RAW_DATA_S3_BUCKET_NAME, csv_file_name)
                     print(f"Successfully extracted {len(all_violations)} alerts for account: {self.__account_id}")
@@ -128,41 +137,112 @@ class NewRelicRestApiProcessor:
             return False
         return True
 
-    def fetch_alert_policies(self):
-        alert_policies_url = f'{self.base_url}/alerts_policies.json'
-
-        # Set up the headers with the API key
-        headers = {
-            'Api-Key': self.__new_relic_key,
-            'Content-Type': 'application/json'
+    def __fetch_alert_violations_serially(self, start_date: str, end_date: str):
+        print(f"Fetching violations from {start_date} to {end_date} for account_id: {self.__account_id}")
+        fetch_violations_page = functools.partial(self.__fetch_violations_page, self.get_session(), start_date,
+                                                  end_date)
+        # Pages are walked from 0 until an empty page, a failed page stops the paginator with failed set
+        paginator = Paginator(fetch_violations_page,
+                              PageNumberStrategy(lambda page: page[0], NEW_RELIC_MAX_PAGES, start_page=0))
+        all_violations = []
+        for violations, _ in paginator:
+            all_violations.extend(violations)
+        if paginator.failed:
+            logger.error(f"Failed to fetch a page of violations for account_id: {self.__account_id}")
+            return None
+        return all_violations
+
+    def fetch_alert_violations_concurrently(self, start_date: str, end_date: str,
+                                            max_workers: int = DEFAULT_MAX_WORKERS, date_range_splits: int = None):
+        """
+        Splits [start_date, end_date] into sub-ranges, learns the page count of each sub-range from the `last` Link
+        header of its first page and fetches the remaining pages over a bounded pool of workers sharing one pooled
+        session. Results are merged in sub-range and page order and de-duplicated on violation id. Returns None when
+        any page could not be fetched, rather than violations missing a sub-range.
+        """
+        if not date_range_splits:
+            date_range_splits = max_workers
+        sub_ranges = split_date_range(start_date, end_date, date_range_splits)
+        session = self.get_session()
+        print(f"Fetching violations from {start_date} to {end_date} for account_id: {self.__account_id} over "
+              f"{len(sub_ranges)} date ranges with {max_workers} workers")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fetch_violations_page = bind_current_span(self.__fetch_violations_page)
+            first_pages = list(executor.map(lambda r: fetch_violations_page(session, r[0], r[1], 1), sub_ranges))
+            if any(first_page is None for first_page in first_pages):
+                logger.error(f"Failed to fetch the first page of a date range for account_id: {self.__account_id}")
+                return None
+            self.progress_tracker.set_total_pages(
+                sum(max(1, min(last_page, NEW_RELIC_MAX_PAGES)) for _, last_page in first_pages))
+            page_futures = []
+            for sub_range, (_, last_page) in zip(sub_ranges, first_pages):
+                futures = [executor.submit(fetch_violations_page, session, sub_range[0], sub_range[1], page)
+                           for page in range(2, min(last_page, NEW_RELIC_MAX_PAGES) + 1)]
+                page_futures.append(futures)
+
+            all_violations = []
+            seen_violation_ids = set()
+            for first_page, futures in zip(first_pages, page_futures):
+                sub_range_pages = [first_page] + [future.result() for future in futures]
+                if any(page is None for page in sub_range_pages):
+                    logger.error(f"Failed to fetch a page of violations for account_id: {self.__account_id}")
+                    for sub_range_futures in page_futures:
+                        for sub_range_future in sub_range_futures:
+                            sub_range_future.cancel()
+                    return None
+                for page_violations, _ in sub_range_pages:
+                    for violation in page_violations:
+                        violation_id = violation.get('id')
+                        if violation_id in seen_violation_ids:
+                            continue
+                        seen_violation_ids.add(violation_id)
+                        all_violations.append(violation)
+        print(f"Found {len(all_violations)} violations for account_id: {self.__account_id}")
+        return all_violations
+
+    def __fetch_violations_page(self, session: requests.Session, start_date: str, end_date: str, page: int):
+        """
+        The violations of a page and the number of the last page, None when the page could not be fetched.
+        """
+        params = {
+            'page': page,
+            'start_date': start_date,
+            'end_date': end_date
         }
-
-        all_policies = []
         try:
-            # Make the API request to get the list of services
-            print(f"Fetching alert policies for account_id: {self.__account_id}")
-            for i in range(0, 250):
-                params = {
-                    'page': i,
-                }
-                response = requests.get(alert_policies_url, headers=headers, params=params)
-
-                # Check if the request was successful (status code 200)
-                if response.status_code == 200:
-                    # Parse the JSON response
-                    alert_policy_data = response.json()
-
-                    # Extract and print the list of services
-                    policies = alert_policy_data['policies']
-                    all_policies.extend(policies)
-                    print(f"Found {len(policies)} policies on page {i}")
-                    if len(policies) <= 0:
-                        break
-                else:
-                    print(f"Error: {response.status_code}, {response.text}")
-                    continue
+            response = request_with_retry(session, 'GET', f'{self.base_url}/alerts_violations.json',
+                                          self.retry_policy, params=params)
+            if response is None:
+                return None
+            violations = response.json().get('violations', [])
+            self.progress_tracker.record_page(len(violations), get_response_size(response))
+            print(f"Found {len(violations)} violations on page {page} for {start_date} - {end_date}")
+            return violations, get_last_page(response, page)
         except Exception as e:
             print(f"An error occurred: {e}")
+        return None
+
+    @traced('new_relic.fetch_alert_policies')
+    def fetch_alert_policies(self, export: bool = True, use_cache: bool = True):
+        cache_key = (self.__account_id, hashlib.md5(self.__new_relic_key.encode('utf-8')).hexdigest())
+        all_policies = None
+        if use_cache:
+            with _alert_policies_cache_lock:
+                all_policies = _alert_policies_cache.get(cache_key)
+            if all_policies is not None:
+                print(f"Using cached alert policies for account_id: {self.__account_id}")
+        if all_policies is None:
+            all_policies = self.__fetch_alert_policies_list()
+            if all_policies is None:
+                logger.error(f"Failed to fetch alert policies for account: {self.__account_id}")
+                return None
+            # Only a complete walk is cached, a partial list would hide the missing policies for the whole TTL
+            if all_policies:
+                with _alert_policies_cache_lock:
+                    _alert_policies_cache[cache_key] = all_policies
+        if not export:
+            return all_policies
 
         try:
             raw_data = pd.DataFrame(all_policies)
@@ -171,7 +251,8 @@ class NewRelicRestApiProcessor:
                 base_dir = os.path.dirname(os.path.abspath(__file__))
                 csv_file_name = f"{self.__account_id}-all_policies_data.csv"
                 file_path = os.path.join(base_dir, csv_file_name)
-                raw_data.to_csv(file_path, index=False)
+                with start_span('serialize', rows=raw_data.shape[0]):
+                    raw_data.to_csv(file_path, index=False)
                 if PUSH_TO_S3:
                     publish_object_file_to_s3(file_path, NEW_RELIC_RAW_DATA_S3_BUCKET_NAME, csv_file_name)
                     print(f"Successfully extracted {len(all_policies)} alert policies for account: {self.__account_id}")
@@ -193,8 +274,11 @@ class NewRelicRestApiProcessor:
             return None
         return all_policies
 
-    def fetch_alert_policies_nrql_conditions(self, policy_ids: [] = None):
-        alert_policies_nrql_url = f'{self.base_url}/alerts_nrql_conditions.json'
+    def __fetch_alert_policies_list(self):
+        """
+        Every alert policy of the account, None when a page could not be fetched.
+        """
+        alert_policies_url = f'{self.base_url}/alerts_policies.json'
 
         # Set up the headers with the API key
         headers = {
@@ -202,43 +286,62 @@ class NewRelicRestApiProcessor:
             'Content-Type': 'application/json'
         }
 
-        all_policies_nrql_conditions = []
+        all_policies = []
+        try:
+            # Make the API request to get the list of services
+            print(f"Fetching alert policies for account_id: {self.__account_id}")
+            for i in range(0, NEW_RELIC_MAX_PAGES):
+                params = {
+                    'page': i,
+                }
+                response = request_with_retry(self.get_session(), 'GET', alert_policies_url, self.retry_policy,
+                                              headers=headers, params=params)
+
+                # Abort the walk on fatal errors or once the retries are exhausted
+                if response is None:
+                    return None
+                # Parse the JSON response
+                alert_policy_data = response.json()
+
+                # Extract and print the list of services
+                policies = alert_policy_data['policies']
+                all_policies.extend(policies)
+                print(f"Found {len(policies)} policies on page {i}")
+                if len(policies) <= 0:
+                    break
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+        return all_policies
+
+    @traced('new_relic.fetch_alert_policies_nrql_conditions')
+    def fetch_alert_policies_nrql_conditions(self, policy_ids: [] = None, max_workers: int = DEFAULT_MAX_WORKERS):
         if policy_ids is None or len(policy_ids) <= 0:
-            policy_ids = self.fetch_alert_policies()
+            policy_ids = self.fetch_alert_policies(export=False)
+        if not policy_ids:
+            logger.error(f"No alert policies found for account: {self.__account_id}")
+            return None
 
+        valid_policy_ids = []
         for policy in policy_ids:
-            try:
-                # Make the API request to get the list of services
-                policy_id = policy.get('id', None)
-                if not policy_id:
-                    print(f"Skipping fetching nrql condition: policy_id not found")
-                    continue
-                print(f"Fetching alert policies nrql condition for policy_id: {policy_id}")
-                for i in range(0, 250):
-                    params = {
-                        'page': i,
-                        'policy_id': policy_id
-                    }
-                    response = requests.get(alert_policies_nrql_url, headers=headers, params=params)
-
-                    # Check if the request was successful (status code 200)
-                    if response.status_code == 200:
-                        # Parse the JSON response
-                        alert_policy_data = response.json()
-
-                        # Extract and print the list of services
-                        nrql_conditions = alert_policy_data['nrql_conditions']
-                        for nrql_condition in nrql_conditions:
-                            nrql_condition['policy_id'] = policy_id
-                        all_policies_nrql_conditions.extend(nrql_conditions)
-                        print(f"Found {len(nrql_conditions)} nrql conditions for policy {policy_id} on page {i}")
-                        if len(nrql_conditions) <= 0:
-                            break
-                    else:
-                        print(f"Error: {response.status_code}, {response.text}")
-                        continue
-            except Exception as e:
-                print(f"An error occurred: {e}")
+            policy_id = policy.get('id', None) if isinstance(policy, dict) else policy
+            if not policy_id:
+                print(f"Skipping fetching nrql condition: policy_id not found")
+                continue
+            valid_policy_ids.append(policy_id)
+
+        session = self.get_session()
+        all_policies_nrql_conditions = []
+        fetch_policy_nrql_conditions = bind_current_span(self.__fetch_policy_nrql_conditions)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for i, nrql_conditions in enumerate(executor.map(
+                    lambda pid: fetch_policy_nrql_conditions(session, pid), valid_policy_ids)):
+                if nrql_conditions is None:
+                    logger.error(f"Failed to fetch nrql conditions of policy: {valid_policy_ids[i]} for account: "
+                                 f"{self.__account_id}")
+                    return None
+                all_policies_nrql_conditions.extend(nrql_conditions)
+                self.progress_tracker.set_fraction_done((i + 1) / len(valid_policy_ids))
 
         try:
             raw_data = pd.DataFrame(all_policies_nrql_conditions)
@@ -247,7 +350,8 @@ class NewRelicRestApiProcessor:
                 base_dir = os.path.dirname(os.path.abspath(__file__))
                 csv_file_name = f"{self.__account_id}-all_policies_nrql_conditions_data.csv"
                 file_path = os.path.join(base_dir, csv_file_name)
-                raw_data.to_csv(file_path, index=False)
+                with start_span('serialize', rows=raw_data.shape[0]):
+                    raw_data.to_csv(file_path, index=False)
                 if PUSH_TO_S3:
                     publish_object_file_to_s3(file_path, NEW_RELIC_RAW_DATA_S3_BUCKET_NAME, csv_file_name)
                     print(f"Successfully extracted {len(all_policies_nrql_conditions)} "
@@ -269,3 +373,143 @@ class NewRelicRestApiProcessor:
             logger.error(f"An error occurred while fetching alert policy nrql conditions: {e}")
             return None
         return all_policies_nrql_conditions
+
+    def __fetch_policy_nrql_conditions(self, session: requests.Session, policy_id):
+        """
+        Every nrql condition of the policy, None when a page could not be fetched.
+        """
+        alert_policies_nrql_url = f'{self.base_url}/alerts_nrql_conditions.json'
+        policy_nrql_conditions = []
+        try:
+            print(f"Fetching alert policies nrql condition for policy_id: {policy_id}")
+            for i in range(0, NEW_RELIC_MAX_PAGES):
+                params = {
+                    'page': i,
+                    'policy_id': policy_id
+                }
+                response = request_with_retry(session, 'GET', alert_policies_nrql_url, self.retry_policy,
+                                              params=params)
+
+                # Abort the walk on fatal errors or once the retries are exhausted
+                if response is None:
+                    return None
+                nrql_conditions = response.json()['nrql_conditions']
+                for nrql_condition in nrql_conditions:
+                    nrql_condition['policy_id'] = policy_id
+                policy_nrql_conditions.extend(nrql_conditions)
+                self.progress_tracker.record_page(len(nrql_conditions), get_response_size(response))
+                print(f"Found {len(nrql_conditions)} nrql conditions for policy {policy_id} on page {i}")
+                if len(nrql_conditions) <= 0:
+                    break
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+        return policy_nrql_conditions
+
+    @traced('new_relic.fetch_incident_rollups')
+    def fetch_incident_rollups(self, start_date: str = None, end_date: str = None, facet: str = 'policyName',
+                               bucket: str = '1 hour'):
+        """
+        Counts opened incidents per `facet` per `bucket` server side with a `FACET ... TIMESERIES` NRQL query over
+        the Insights query API and exports the compact rollup instead of the raw violations.
+        """
+        if not self.__new_relic_query_key:
+            logger.error(f"Query key is required to fetch incident rollups for account: {self.__account_id}")
+            return False
+        if bucket not in NRQL_ROLLUP_BUCKETS:
+            logger.error(f"Invalid rollup bucket: {bucket} for account: {self.__account_id}")
+            return False
+
+        if end_date is None or end_date == '':
+            end_date = datetime.now().strftime('%Y-%m-%d')
+
+        if start_date is None or start_date == '':
+            start_date = (datetime.now() - pd.DateOffset(years=1)).strftime('%Y-%m-%d')
+
+        headers = {
+            'X-Query-Key': self.__new_relic_query_key,
+            'Accept': 'application/json'
+        }
+        window_seconds = NRQL_ROLLUP_BUCKETS[bucket] * NRQL_MAX_TIMESERIES_BUCKETS
+        windows = split_date_range(start_date, end_date, max(1, int(
+            (pd.Timestamp(end_date) - pd.Timestamp(start_date)).total_seconds() // window_seconds) + 1))
+        all_rollups = []
+        try:
+            print(f"Fetching incident rollups from {start_date} to {end_date} for account_id: {self.__account_id}")
+            for window_start, window_end in windows:
+                nrql = f"SELECT count(*) AS incident_count FROM NrAiIncident WHERE event = 'open' " \
+                       f"FACET {facet} TIMESERIES {bucket} SINCE '{pd.Timestamp(window_start):%Y-%m-%d %H:%M:%S}' " \
+                       f"UNTIL '{pd.Timestamp(window_end):%Y-%m-%d %H:%M:%S}' LIMIT MAX"
+                response = request_with_retry(get_http_session(self.insights_url, self.__new_relic_query_key, headers),
+                                              'GET', self.insights_url, self.retry_policy, params={'nrql': nrql})
+                if response is None:
+                    return False
+                for facet_data in response.json().get('facets', []):
+                    for time_series in facet_data.get('timeSeries', []):
+                        # Depending on the API version the aliased count comes back under its alias or as `count`
+                        result = time_series['results'][0] if time_series['results'] else {}
+                        incident_count = result.get('incident_count', result.get('count', 0))
+                        if not incident_count:
+                            continue
+                        all_rollups.append({
+                            facet: facet_data.get('name'),
+                            'begin_time': datetime.utcfromtimestamp(time_series['beginTimeSeconds']),
+                            'end_time': datetime.utcfromtimestamp(time_series['endTimeSeconds']),
+                            'incident_count': incident_count,
+                        })
+                print(f"Found {len(all_rollups)} rollup rows till {window_end}")
+        except Exception as e:
+            logger.error(f"An error occurred while fetching incident rollups: {e}")
+            return False
+
+        try:
+            raw_data = pd.DataFrame(all_rollups)
+            if raw_data.shape[0] > 0:
+                base_dir = os.path.dirname(os.path.abspath(__file__))
+                csv_file_name = f"{self.__account_id}-{end_date}-incident_rollups_data.csv"
+                file_path = os.path.join(base_dir, csv_file_name)
+                with start_span('serialize', rows=raw_data.shape[0]):
+                    raw_data.to_csv(file_path, index=False)
+                if PUSH_TO_S3:
+                    publish_object_file_to_s3(file_path, NEW_RELIC_RAW_DATA_S3_BUCKET_NAME, csv_file_name)
+                    print(f"Successfully extracted {len(all_rollups)} incident rollups for account: "
+                          f"{self.__account_id}")
+                    try:
+                        os.remove(file_path)
+                        logger.error(f"File '{file_path}' deleted successfully.")
+                    except FileNotFoundError:
+                        logger.error(f"File '{file_path}' not found.")
+                    except PermissionError:
+                        logger.error(
+                            f"Permission error. You may not have the necessary permissions to delete the file.")
+                    except Exception as e:
+                        logger.error(f"An error occurred: {e}")
+            else:
+                logger.error(f"No incidents found for account: {self.__account_id}")
+                return False
+        except Exception as e:
+            logger.error(f"An error occurred while exporting incident rollups: {e}")
+            return False
+        return True
+
+
+def get_last_page(response: requests.Response, current_page: int):
+    """
+    Reads the page count off the `last` Link header New Relic sets on paginated responses. Absent on the last page.
+    """
+    last_link = response.links.get('last', {}).get('url') if response.links else None
+    if not last_link:
+        return current_page
+    pages = parse_qs(urlparse(last_link).query).get('page')
+    if not pages:
+        return current_page
+    return int(pages[0])
+
+
+def split_date_range(start_date: str, end_date: str, splits: int):
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    if splits <= 1 or end <= start:
+        return [(start_date, end_date)]
+    boundaries = pd.date_range(start, end, periods=splits + 1)
+    return [(boundaries[i].isoformat(), boundaries[i + 1].isoformat()) for i in range(splits)]
@@ -4,23 +4,40 @@ import os
 import pandas as pd
 from datetime import datetime, timezone
 
-import requests
 
-from env_vars import SENTRY_RAW_DATA_S3_BUCKET_NAME, PUSH_TO_S3
+from env_vars import SENTRY_RAW_DATA_S3_BUCKET_NAME, PUSH_TO_S3, PUSH_TO_MESSAGE_STORE
+from persistance.message_store import get_sentry_event_writer, to_sentry_event_rows
+from utils.http_client import get_http_session
+from utils.job_progress import JobProgressTracker, get_response_size
+from utils.paginator import Paginator, LinkHeaderStrategy
 from utils.publishsing_client import publish_object_file_to_s3
+from utils.retry_utils import RetryPolicy, request_with_retry
+from utils.tracing import start_span, traced
 
 logger = logging.getLogger(__name__)
 
+# Sentry issue stats periods mapped to the bucket resolution they are served in
+ISSUE_STATS_PERIODS = {'24h': '1h', '14d': '1d'}
+SUMMARY_DEFAULT_LOOKBACK_SECONDS = 14 * 24 * 60 * 60
+SENTRY_API_BASE_URL = 'https://sentry.io/api/0'
+
 
 class SentryApiProcessor:
     client = None
 
-    def __init__(self, bearer_token, organization_slug, project_slug):
+    def __init__(self, bearer_token, organization_slug, project_slug, api_base_url=SENTRY_API_BASE_URL):
         self.__auth_token = f"Bearer {bearer_token}"
         self.__organization_slug = organization_slug
         self.__project_slug = project_slug
-        self.base_url = f'https://sentry.io/api/0/projects/{self.__organization_slug}'
+        self.base_url = f'{api_base_url}/projects/{self.__organization_slug}'
+        self.issues_base_url = f'{api_base_url}/issues'
+        self.retry_policy = RetryPolicy(source='sentry')
+        self.progress_tracker = JobProgressTracker(source='sentry')
+
+    def get_session(self):
+        return get_http_session(self.base_url, self.__auth_token, {"Authorization": self.__auth_token})
 
+    @traced('sentry.fetch_events')
     def fetch_events(self, latest_timestamp: str, oldest_timestamp: str):
         if not latest_timestamp or oldest_timestamp is None:
             logger.error(f"Invalid arguments provided for fetch_events")
@@ -40,52 +57,67 @@ class SentryApiProcessor:
         message_counter = 0
         should_continue = True
         all_events = []
+        message_store_writer = get_sentry_event_writer() if PUSH_TO_MESSAGE_STORE else None
+        paginator = Paginator(lambda page_url: request_with_retry(self.get_session(), 'GET', page_url,
+                                                                  self.retry_policy, headers=headers),
+                              LinkHeaderStrategy(url))
         try:
-            while url and should_continue:
-                response = requests.get(url, headers=headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    all_events.extend(data)
-                    call_counter += 1
-                    message_counter += len(data)
-                    print(f"Call Counter : {call_counter}, Message Counter : {message_counter}, Events : {len(data)}")
-                    # Check if there's a next page
-
-                    for event in data:
-                        if event['dateCreated'] > str(latest_datetime):
-                            should_continue = False
-                            break
-                        if event['dateCreated'] < str(oldest_datetime):
-                            should_continue = False
-                            break
-                    if response.links and response.links.get("next", None):
-                        url = response.links["next"]["url"]
-                    else:
+            for response in paginator:
+                data = response.json()
+                all_events.extend(data)
+                if message_store_writer:
+                    message_store_writer.write(to_sentry_event_rows(self.__organization_slug,
+                                                                    self.__project_slug, data))
+                call_counter += 1
+                message_counter += len(data)
+                fraction_done = None
+                if data and float(latest_timestamp) > float(oldest_timestamp):
+                    last_event_epoch = datetime.fromisoformat(
+                        data[-1]['dateCreated'].replace('Z', '+00:00')).timestamp()
+                    fraction_done = (float(latest_timestamp) - last_event_epoch) / \
+                                    (float(latest_timestamp) - float(oldest_timestamp))
+                self.progress_tracker.record_page(len(data), get_response_size(response), fraction_done)
+                print(f"Call Counter : {call_counter}, Message Counter : {message_counter}, Events : {len(data)}")
+                for event in data:
+                    if event['dateCreated'] > str(latest_datetime):
+                        should_continue = False
                         break
-                else:
-                    # Handle errors
-                    print(f"Error: {response.status_code}")
-                    print(response.text)
+                    if event['dateCreated'] < str(oldest_datetime):
+                        should_continue = False
+                        break
+                if not should_continue:
                     break
         except Exception as e:
             logger.error(
                 f"Exception occurred while fetching events for project_slug: {self.__project_slug} with error: {e}")
             return False
-        raw_data = pd.DataFrame(all_events)
+        finally:
+            if message_store_writer:
+                message_store_writer.close()
+        if paginator.failed:
+            logger.error(f"Failed to fetch a page of events for project_slug: {self.__project_slug}, the partial "
+                         f"{message_counter} events are not exported")
+            return False
+        with start_span('transform', rows=len(all_events)):
+            raw_data = pd.DataFrame(all_events)
         if raw_data.shape[0] > 0:
-            raw_data = raw_data.reset_index(drop=True)
-            raw_data = raw_data.sort_values(by=['uuid'])
-            raw_data = raw_data.reset_index(drop=True)
-            duplicates = raw_data[raw_data.duplicated(subset='uuid', keep=False)]
-            if duplicates.shape[0] > 0:
-                logger.info(f"Handling {duplicates.shape[0]} duplicate messages for channel_id: {channel_id}")
-                raw_data = raw_data.drop_duplicates(subset='uuid', keep='last')
+            # The events endpoint identifies events by eventID
+            event_id_column = 'uuid' if 'uuid' in raw_data.columns else 'eventID'
+            with start_span('transform', rows=raw_data.shape[0]):
+                raw_data = raw_data.reset_index(drop=True)
+                raw_data = raw_data.sort_values(by=[event_id_column])
+                raw_data = raw_data.reset_index(drop=True)
+                duplicates = raw_data[raw_data.duplicated(subset=event_id_column, keep=False)]
+                if duplicates.shape[0] > 0:
+                    logger.info(f"Handling {duplicates.shape[0]} duplicate events for project: {self.__project_slug}")
+                    raw_data = raw_data.drop_duplicates(subset=event_id_column, keep='last')
 
             base_dir = os.path.dirname(os.path.abspath(__file__))
             latest_datetime = datetime.fromtimestamp(float(latest_timestamp))
             csv_file_name = f"{self.__organization_slug}-{self.__project_slug}-{latest_datetime}-raw_events_data.csv"
             file_path = os.path.join(base_dir, csv_file_name)
-            raw_data.to_csv(file_path, index=False)
+            with start_span('serialize', rows=raw_data.shape[0]):
+                raw_data.to_csv(file_path, index=False)
             if PUSH_TO_S3:
                 publish_object_file_to_s3(file_path, SENTRY_RAW_DATA_S3_BUCKET_NAME, csv_file_name)
                 logger.info(f"Successfully extracted {message_counter} messages for project: {self.__project_slug}")
@@ -102,3 +134,151 @@ class SentryApiProcessor:
             logger.error(f"No events found for project_slug: {self.__project_slug}")
             return False
         return True
+
+    @traced('sentry.fetch_issue_summaries')
+    def fetch_issue_summaries(self, latest_timestamp: str, oldest_timestamp: str, stats_period: str = None,
+                              events_sample_size: int = 0):
+        """
+        Summary mode for fetch_events: exports one row per issue, the bucketed event counts of every issue and the
+        project level received stats instead of every raw event. Raw events are only fetched for the first
+        `events_sample_size` events of each issue.
+        """
+        if not latest_timestamp or oldest_timestamp is None:
+            logger.error(f"Invalid arguments provided for fetch_issue_summaries")
+            return False
+
+        headers = {
+            "Authorization": self.__auth_token,
+        }
+
+        latest_epoch = float(latest_timestamp)
+        if oldest_timestamp == '':
+            oldest_epoch = latest_epoch - SUMMARY_DEFAULT_LOOKBACK_SECONDS
+        else:
+            oldest_epoch = float(oldest_timestamp)
+        oldest_datetime = datetime.utcfromtimestamp(oldest_epoch).replace(tzinfo=timezone.utc).strftime(
+            '%Y-%m-%dT%H:%M:%SZ')
+        latest_datetime = datetime.utcfromtimestamp(latest_epoch).replace(tzinfo=timezone.utc).strftime(
+            '%Y-%m-%dT%H:%M:%SZ')
+        if not stats_period:
+            # Sentry only serves hourly buckets for the last 24h, daily buckets otherwise
+            stats_period = '24h' if latest_epoch - oldest_epoch <= 24 * 60 * 60 else '14d'
+        if stats_period not in ISSUE_STATS_PERIODS:
+            logger.error(f"Invalid stats_period: {stats_period} provided for fetch_issue_summaries")
+            return False
+
+        all_issues = []
+        all_issue_stats = []
+        all_sampled_events = []
+        call_counter = 0
+        url = f"{self.base_url}/{self.__project_slug}/issues/"
+        params = {
+            'query': f"lastSeen:>={oldest_datetime} lastSeen:<={latest_datetime}",
+            'statsPeriod': stats_period,
+        }
+
+        def fetch_issues_page(page_url):
+            # Next links carry the query of the first page
+            return request_with_retry(self.get_session(), 'GET', page_url, self.retry_policy, headers=headers,
+                                      params=params if page_url == url else None)
+
+        issues_paginator = Paginator(fetch_issues_page, LinkHeaderStrategy(url))
+        try:
+            for response in issues_paginator:
+                call_counter += 1
+                issues = response.json()
+                self.progress_tracker.record_page(len(issues), get_response_size(response))
+                for issue in issues:
+                    issue_id = issue.get('id')
+                    all_issues.append({
+                        'issue_id': issue_id,
+                        'short_id': issue.get('shortId'),
+                        'title': issue.get('title'),
+                        'culprit': issue.get('culprit'),
+                        'level': issue.get('level'),
+                        'status': issue.get('status'),
+                        'count': issue.get('count'),
+                        'user_count': issue.get('userCount'),
+                        'first_seen': issue.get('firstSeen'),
+                        'last_seen': issue.get('lastSeen'),
+                        'permalink': issue.get('permalink'),
+                    })
+                    for bucket_ts, bucket_count in issue.get('stats', {}).get(stats_period, []):
+                        if oldest_epoch <= bucket_ts <= latest_epoch:
+                            all_issue_stats.append({'issue_id': issue_id, 'bucket_ts': bucket_ts,
+                                                    'count': bucket_count})
+                print(f"Call Counter : {call_counter}, Issue Counter : {len(all_issues)}, Issues : {len(issues)}")
+            if issues_paginator.failed:
+                logger.error(f"Failed to fetch a page of issues for project_slug: {self.__project_slug}")
+                return False
+
+            if events_sample_size and events_sample_size > 0:
+                for issue in all_issues:
+                    response = request_with_retry(self.get_session(), 'GET',
+                                                  f"{self.issues_base_url}/{issue['issue_id']}/events/",
+                                                  self.retry_policy, headers=headers)
+                    call_counter += 1
+                    if response is None:
+                        if self.retry_policy.aborted:
+                            break
+                        continue
+                    for event in response.json()[:events_sample_size]:
+                        event['issue_id'] = issue['issue_id']
+                        all_sampled_events.append(event)
+
+            project_stats = self.fetch_project_stats(latest_epoch, oldest_epoch, stats_period)
+            call_counter += 1
+        except Exception as e:
+            logger.error(
+                f"Exception occurred while fetching issues for project_slug: {self.__project_slug} with error: {e}")
+            return False
+
+        if len(all_issues) <= 0:
+            logger.error(f"No issues found for project_slug: {self.__project_slug}")
+            return False
+
+        latest_datetime = datetime.fromtimestamp(latest_epoch)
+        file_prefix = f"{self.__organization_slug}-{self.__project_slug}-{latest_datetime}"
+        self.__publish_dataframe(pd.DataFrame(all_issues), f"{file_prefix}-issues_summary_data.csv")
+        if len(all_issue_stats) > 0:
+            self.__publish_dataframe(pd.DataFrame(all_issue_stats), f"{file_prefix}-issues_stats_data.csv")
+        if project_stats:
+            self.__publish_dataframe(pd.DataFrame(project_stats), f"{file_prefix}-project_stats_data.csv")
+        if len(all_sampled_events) > 0:
+            self.__publish_dataframe(pd.DataFrame(all_sampled_events), f"{file_prefix}-sampled_events_data.csv")
+        logger.info(f"Successfully summarised {len(all_issues)} issues with {call_counter} calls for project: "
+                    f"{self.__project_slug}")
+        return True
+
+    def fetch_project_stats(self, latest_epoch: float, oldest_epoch: float, stats_period: str = '24h'):
+        headers = {
+            "Authorization": self.__auth_token,
+        }
+        params = {
+            'stat': 'received',
+            'since': int(oldest_epoch),
+            'until': int(latest_epoch),
+            'resolution': ISSUE_STATS_PERIODS[stats_period],
+        }
+        response = request_with_retry(self.get_session(), 'GET', f"{self.base_url}/{self.__project_slug}/stats/",
+                                      self.retry_policy, headers=headers, params=params)
+        if response is None:
+            return None
+        return [{'bucket_ts': bucket_ts, 'received': received} for bucket_ts, received in response.json()]
+
+    def __publish_dataframe(self, raw_data: pd.DataFrame, csv_file_name: str):
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        file_path = os.path.join(base_dir, csv_file_name)
+        with start_span('serialize', rows=raw_data.shape[0]):
+            raw_data.to_csv(file_path, index=False)
+        if PUSH_TO_S3:
+            publish_object_file_to_s3(file_path, SENTRY_RAW_DATA_S3_BUCKET_NAME, csv_file_name)
+            try:
+                os.remove(file_path)
+                logger.error(f"File '{file_path}' deleted successfully.")
+            except FileNotFoundError:
+                logger.error(f"File '{file_path}' not found.")
+            except PermissionError:
+                logger.error(f"Permission error. You may not have the necessary permissions to delete the file.")
+            except Exception as e:
+                logger.error(f"An error occurred: {e}")
@@ -1,25 +1,52 @@
+import functools
 import logging
 import os
 import time
-from http.client import IncompleteRead
 
 import pandas as pd
 from datetime import datetime
 
-from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
 
-from env_vars import RAW_DATA_S3_BUCKET_NAME, PUSH_TO_S3
+from env_vars import RAW_DATA_S3_BUCKET_NAME, PUSH_TO_S3, PUSH_TO_MESSAGE_STORE
+from persistance.message_store import get_slack_message_writer, to_slack_message_rows
+from utils.http_client import get_slack_web_client
+from utils.job_progress import JobProgressTracker, get_response_size
+from utils.metrics import record_api_request
+from utils.paginator import Paginator, CursorStrategy
 from utils.publishsing_client import publish_object_file_to_s3
+from utils.retry_utils import RetryPolicy, ErrorClass, classify_exception, get_retry_after
+from utils.tracing import start_span, traced
 
 logger = logging.getLogger(__name__)
 
+# Pause between conversations.history pages, to stay under Slack's tier 3 rate limit
+CONVERSATIONS_HISTORY_PAGE_INTERVAL_SECONDS = 0.5
+
+
+def get_next_cursor(response):
+    # Slack sends an empty next_cursor on the last page
+    return (response.get('response_metadata') or {}).get('next_cursor')
+
 
 class SlackApiProcessor:
     client = None
 
-    def __init__(self, bot_auth_token):
+    def __init__(self, bot_auth_token, base_url=None):
         self.__bot_auth_token = bot_auth_token
-        self.client = WebClient(token=self.__bot_auth_token)
+        self.client = get_slack_web_client(self.__bot_auth_token, base_url)
+        self.retry_policy = RetryPolicy(source='slack')
+        self.progress_tracker = JobProgressTracker(source='slack')
+
+    def test_auth(self):
+        try:
+            response = self.client.auth_test()
+            return bool(response and response.get('ok'))
+        except Exception as e:
+            logger.error(f"Exception occurred while testing bot auth token with error: {e}")
+            if classify_exception(e) == ErrorClass.FATAL:
+                self.retry_policy.abort(e)
+        return False
 
     def fetch_channel_info(self, channel_id):
         try:
@@ -30,38 +57,65 @@ class SlackApiProcessor:
                     return channel_info
         except Exception as e:
             logger.error(f"Exception occurred while fetching channel info for channel_id: {channel_id} with error: {e}")
+            if classify_exception(e) == ErrorClass.FATAL:
+                self.retry_policy.abort(e)
         return None
 
+    def __fetch_conversation_history_page(self, channel_id: str, latest_timestamp: str, oldest_timestamp: str,
+                                          cursor: str):
+        """
+        One page of conversations.history under the retry policy, None on fatal errors or once retries are exhausted.
+        """
+        if cursor:
+            time.sleep(CONVERSATIONS_HISTORY_PAGE_INTERVAL_SECONDS)
+        attempt = 0
+        while True:
+            started_at = time.perf_counter()
+            try:
+                with start_span('page_fetch', channel_id=channel_id, attempt=attempt):
+                    if oldest_timestamp is not None and oldest_timestamp != '':
+                        response = self.client.conversations_history(channel=channel_id, cursor=cursor,
+                                                                     latest=latest_timestamp,
+                                                                     oldest=oldest_timestamp, limit=100, timeout=300)
+                    else:
+                        response = self.client.conversations_history(channel=channel_id, cursor=cursor,
+                                                                     latest=latest_timestamp, limit=100, timeout=300)
+            except Exception as e:
+                status = e.response.status_code if isinstance(e, SlackApiError) else 'error'
+                record_api_request(self.retry_policy.source, status, time.perf_counter() - started_at)
+                logger.error(f"Exception occurred while fetching conversation history for channel_id: {channel_id} "
+                             f"with error: {e}")
+                if classify_exception(e) == ErrorClass.FATAL:
+                    self.retry_policy.abort(e)
+                    return None
+                retry_after = get_retry_after(e.response.headers) if isinstance(e, SlackApiError) else None
+                if not self.retry_policy.backoff(attempt, retry_after):
+                    logger.error(f"Retries exhausted while fetching conversation history for channel_id: {channel_id}")
+                    return None
+                attempt += 1
+                continue
+            record_api_request(self.retry_policy.source, response.status_code, time.perf_counter() - started_at)
+            return response
+
+    @traced('slack.fetch_conversation_history')
     def fetch_conversation_history(self, channel_id: str, latest_timestamp: str, oldest_timestamp: str):
         if not channel_id or not latest_timestamp or oldest_timestamp is None:
             logger.error(f"Invalid arguments provided for fetch_conversation_history")
             return False
         channel_info = self.fetch_channel_info(channel_id)
-        raw_data = pd.DataFrame(columns=["uuid", "full_message"])
+        if self.retry_policy.aborted:
+            # The token or channel failed fatally already, paging the history would fail the same way
+            logger.error(f"Skipping conversation history of channel_id: {channel_id} after a fatal error: "
+                         f"{self.retry_policy.fatal_error}")
+            return False
+        team_id = channel_info.get('context_team_id') if channel_info else None
+        message_store_writer = get_slack_message_writer() if PUSH_TO_MESSAGE_STORE else None
+        raw_rows = []
         message_counter = 0
-        visit_next_cursor = True
-        next_cursor = None
+        paginator = Paginator(functools.partial(self.__fetch_conversation_history_page, channel_id, latest_timestamp,
+                                                oldest_timestamp), CursorStrategy(get_next_cursor))
         try:
-            while visit_next_cursor:
-                try:
-                    if oldest_timestamp is not None and oldest_timestamp != '':
-                        response_paginated = self.client.conversations_history(channel=channel_id, cursor=next_cursor,
-                                                                               latest=latest_timestamp,
-                                                                               oldest=oldest_timestamp, limit=100,
-                                                                               timeout=300)
-                    else:
-                        response_paginated = self.client.conversations_history(channel=channel_id, cursor=next_cursor,
-                                                                               latest=latest_timestamp, limit=100,
-                                                                               timeout=300)
-                except IncompleteRead as e:
-                    logger.error(
-                        f"IncompleteRead occurred while fetching conversation history for channel_id: {channel_id} "
-                        f"with error: {e}")
-                    continue
-                except Exception as e:
-                    logger.error(
-                        f"Exception occurred while fetching conversation history for channel_id: {channel_id} with error: {e}")
-                    continue
+            for response_paginated in paginator:
                 if not response_paginated:
                     break
                 if 'messages' in response_paginated:
@@ -73,32 +127,42 @@ class SlackApiProcessor:
                         break
                     if oldest_timestamp and float(new_timestamp) <= float(oldest_timestamp):
                         break
-                    for message in response_paginated["messages"]:
-                        temp = pd.DataFrame([{"full_message": message, "uuid": message.get('ts')}])
-                        raw_data = pd.concat([temp, raw_data])
-                        message_counter = message_counter + 1
+                    with start_span('transform', rows=len(messages)):
+                        for message in response_paginated["messages"]:
+                            raw_rows.append({"full_message": message, "uuid": message.get('ts')})
+                            message_counter = message_counter + 1
+                        if message_store_writer:
+                            message_store_writer.write(to_slack_message_rows(team_id, channel_id, messages))
+                    # Pages walk back from latest_timestamp, the oldest message tells how much of the range is done
+                    fraction_done = None
+                    if oldest_timestamp and float(latest_timestamp) > float(oldest_timestamp):
+                        fraction_done = (float(latest_timestamp) - float(messages[-1]['ts'])) / \
+                                        (float(latest_timestamp) - float(oldest_timestamp))
+                    self.progress_tracker.record_page(len(messages), get_response_size(response_paginated),
+                                                      fraction_done)
                     logger.info(f'{str(message_counter)}, messages published')
                     logger.info(f'Extracted Data till {datetime.fromtimestamp(float(new_timestamp))}')
-                if 'response_metadata' in response_paginated and \
-                        'next_cursor' in response_paginated['response_metadata']:
-                    next_cursor = response_paginated['response_metadata']['next_cursor']
-                    time.sleep(0.5)
-                else:
-                    visit_next_cursor = False
-                    break
+            if paginator.failed:
+                return False
         except Exception as e:
             logger.error(
                 f"Exception occurred while fetching conversation history for channel_id: {channel_id} with error: {e}")
             return False
+        finally:
+            if message_store_writer:
+                message_store_writer.close()
 
+        # Newest message last, as the rows used to be prepended one by one
+        raw_data = pd.DataFrame(list(reversed(raw_rows)), columns=["uuid", "full_message"])
         if raw_data.shape[0] > 0:
-            raw_data = raw_data.reset_index(drop=True)
-            raw_data = raw_data.sort_values(by=['uuid'])
-            raw_data = raw_data.reset_index(drop=True)
-            duplicates = raw_data[raw_data.duplicated(subset='uuid', keep=False)]
-            if duplicates.shape[0] > 0:
-                logger.info(f"Handling {duplicates.shape[0]} duplicate messages for channel_id: {channel_id}")
-                raw_data = raw_data.drop_duplicates(subset='uuid', keep='last')
+            with start_span('transform', rows=raw_data.shape[0]):
+                raw_data = raw_data.reset_index(drop=True)
+                raw_data = raw_data.sort_values(by=['uuid'])
+                raw_data = raw_data.reset_index(drop=True)
+                duplicates = raw_data[raw_data.duplicated(subset='uuid', keep=False)]
+                if duplicates.shape[0] > 0:
+                    logger.info(f"Handling {duplicates.shape[0]} duplicate messages for channel_id: {channel_id}")
+                    raw_data = raw_data.drop_duplicates(subset='uuid', keep='last')
 
             base_dir = os.path.dirname(os.path.abspath(__file__))
             latest_datetime = datetime.fromtimestamp(float(latest_timestamp))
@@ -110,7 +174,8 @@ class SlackApiProcessor:
                 csv_file_name = f"{channel_id}-{latest_datetime}-raw_data.csv"
             file_path = os.path.join(base_dir, csv_file_name)
 
-            raw_data.to_csv(file_path, index=False)
+            with start_span('serialize', rows=raw_data.shape[0]):
+                raw_data.to_csv(file_path, index=False)
             if PUSH_TO_S3:
                 publish_object_file_to_s3(file_path, RAW_DATA_S3_BUCKET_NAME, csv_file_name)
                 logger.info(f"Successfully extracted {message_counter} messages for channel_id: {channel_id}")
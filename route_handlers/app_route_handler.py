@@ -1,7 +1,7 @@
 import logging
 from enum import Enum
 
-from persistance.db_utils import create_token_config
+from persistance.db_utils import create_token_config, register_google_chat_token_config
 from utils.utils import clean_string
 
 logger = logging.getLogger(__name__)
@@ -11,6 +11,7 @@ class TokenSources(Enum):
     UNKNOWN = 0
     SENTRY = 1
     NEW_RELIC = 2
+    GOOGLE_CHAT = 3
 
 
 def get_token_source(token_source):
@@ -18,6 +19,8 @@ def get_token_source(token_source):
         return TokenSources.SENTRY
     elif token_source == 'new_relic':
         return TokenSources.NEW_RELIC
+    elif token_source == 'google_chat':
+        return TokenSources.GOOGLE_CHAT
     else:
         return TokenSources.UNKNOWN
 
@@ -46,4 +49,12 @@ def handler_source_token_registration(user_email, source, token_config):
             return None
         token_config = create_token_config(user_email, token_source.name, token_config)
         return token_config
+    if token_source == TokenSources.GOOGLE_CHAT:
+        # refresh_token is checked on registration, a re-authorization keeps the stored one when it sends none
+        for key in ('token_uri', 'client_id', 'client_secret'):
+            if not token_config.get(key):
+                logger.error(f"Invalid google chat token config: {token_config}: {key} not found")
+                return None
+        token_config = register_google_chat_token_config(user_email, token_config)
+        return token_config
     return None
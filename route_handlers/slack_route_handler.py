@@ -3,10 +3,9 @@ import logging
 from typing import Dict
 
 from env_vars import PUSH_TO_S3, METADATA_S3_BUCKET_NAME, PUSH_TO_SLACK, SLACK_APP_ID
-from jobs.tasks import data_fetch_job
 from persistance.db_utils import get_slack_workspace_config_by, create_slack_bot_config, create_slack_workspace_config, \
-    get_slack_bot_configs_by, update_slack_bot_config, update_slack_workspace_config
-from processors.slack_webclient_apis import SlackApiProcessor
+    get_slack_bot_configs_by, update_slack_bot_config, update_slack_workspace_config, \
+    get_active_slack_workspaces_cached, get_slack_workspace_config_by_id
 from utils.publishsing_client import publish_json_blob_to_s3, publish_message_to_slack
 from utils.time_utils import get_current_datetime
 
@@ -54,7 +53,7 @@ def handle_event_callback(data: Dict):
         return False
     team_id = data['team_id']
     event = data['event']
-    active_slack_workspaces = get_slack_workspace_config_by(team_id=team_id, is_active=True)
+    active_slack_workspaces = get_active_slack_workspaces_cached(team_id)
     if not active_slack_workspaces:
         logger.error(f"Error handling slack event callback api for {team_id}: active slack workspace not found")
         return False
@@ -82,12 +81,21 @@ def handle_event_callback(data: Dict):
             return False
         if event_type == 'member_joined_channel' or event_type == 'app_mention':
             try:
+                from jobs.tasks import data_fetch_job
+                from processors.slack_webclient_apis import SlackApiProcessor
+
                 slack_workspace = active_slack_workspaces[0]
                 for bot_user_id in bot_user_ids:
                     if bot_user_id == user:
                         slack_workspace = active_slack_workspaces[bot_user_ids.index(bot_user_id)]
                         break
-                bot_auth_token = slack_workspace.bot_auth_token
+                # The cached snapshot carries no token, it is only read from the database when a fetch is scheduled
+                slack_workspace_config = get_slack_workspace_config_by_id(slack_workspace.id)
+                if not slack_workspace_config:
+                    logger.error(f"Error handling {event_type} event type for workspace {team_id}: slack workspace "
+                                 f"config {slack_workspace.id} not found")
+                    return False
+                bot_auth_token = slack_workspace_config.bot_auth_token
                 slack_api_processor = SlackApiProcessor(bot_auth_token)
                 channel_name = None
                 channel_info = slack_api_processor.fetch_channel_info(channel_id)
@@ -117,7 +125,7 @@ def handle_event_callback(data: Dict):
                                            + " " + "channel: " + "*" + channel_header + " and channel id: " + "*" + \
                                            channel_id + "*" + " at " + "event_ts: " + event_ts
                             publish_message_to_slack(message_text)
-                            data_fetch_job.delay(bot_auth_token, channel_id, str(event_ts), '')
+                            data_fetch_job.delay(bot_auth_token, channel_id, str(event_ts), '', slack_workspace.id)
                     return True
                 else:
                     logger.error(f"Error while saving SlackBotConfig for workspace: {team_id}:{channel_id}:{event_ts}")
@@ -175,7 +183,7 @@ def handle_event_callback(data: Dict):
                                 publish_message_to_slack(message_text)
         elif event_type == 'app_uninstalled':
             try:
-                for slack_workspace in active_slack_workspaces:
+                for slack_workspace in get_slack_workspace_config_by(team_id=team_id, is_active=True):
                     updated_slack_workspace = update_slack_workspace_config(slack_workspace, is_active=False)
                     if updated_slack_workspace:
                         workspace_header = updated_slack_workspace.team_id
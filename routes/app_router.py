@@ -1,15 +1,14 @@
 import json
-from datetime import datetime
 
-from flask import request
+from flask import request, url_for, Response
 from flask import jsonify, Blueprint
 
-from persistance.db_utils import create_slack_channel_scrap_schedule, get_slack_bot_configs_by, \
-    get_source_token_config_by
-from processors.new_relic_rest_client import NewRelicRestApiProcessor
-from processors.sentry_client_apis import SentryApiProcessor
-from processors.slack_webclient_apis import SlackApiProcessor
+from persistance.db_utils import get_slack_bot_configs_by, get_source_token_config_by
 from route_handlers.app_route_handler import handler_source_token_registration
+from utils.circuit_breaker import CircuitState, get_source_token_circuit_breaker
+from utils.job_progress import JOB_PROGRESS_STATE
+from utils.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+from utils.profiling import profile_run
 from utils.time_utils import get_current_time
 
 app_blueprint = Blueprint('app_router', __name__)
@@ -21,6 +20,11 @@ def app_health_check():
     return jsonify({'success': True})
 
 
+@app_blueprint.route('/metrics', methods=['GET'])
+def app_metrics():
+    return Response(REGISTRY.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app_blueprint.route('/register_source_token', methods=['POST'])
 def app_register_source_token():
     request_data = request.data.decode('utf-8')
@@ -58,15 +62,10 @@ def slack_start_data_fetch():
     if not oldest_timestamp:
         oldest_timestamp = ''
 
-    slack_api_processor = SlackApiProcessor(bot_auth_token)
-    slack_api_processor.fetch_conversation_history(channel_id, latest_timestamp, oldest_timestamp)
-
-    data_extraction_to = datetime.fromtimestamp(float(latest_timestamp))
-    data_extraction_from = None
-    if oldest_timestamp:
-        data_extraction_from = datetime.fromtimestamp(float(oldest_timestamp))
-    create_slack_channel_scrap_schedule(slack_bot_config.id, data_extraction_from, data_extraction_to)
-    return jsonify({'success': True})
+    from jobs.tasks import slack_start_data_fetch_job
+    job = slack_start_data_fetch_job.delay(bot_auth_token, channel_id, latest_timestamp, oldest_timestamp,
+                                           slack_bot_config.id, profile=is_profiling_requested())
+    return get_job_submitted_response(job)
 
 
 @app_blueprint.route('/slack/get_channel_info', methods=['GET'])
@@ -80,6 +79,7 @@ def slack_get_channel_info():
     if not slack_bot_configs:
         return jsonify({'success': False, 'message': 'No active slack bot configs found for channel_id: {channel_id}'})
 
+    from processors.slack_webclient_apis import SlackApiProcessor
     slack_api_processor = SlackApiProcessor(bot_auth_token)
     channel_info = slack_api_processor.fetch_channel_info(channel_id)
     if channel_info:
@@ -98,7 +98,15 @@ def sentry_start_data_fetch():
         return jsonify(
             {'success': False, 'message': f'No active source token configs found for user_email: {user_email}'})
 
-    source_token = source_tokens[0]
+    source_token = None
+    for active_source_token in source_tokens:
+        if get_source_token_circuit_breaker(active_source_token.id).get_state() != CircuitState.OPEN:
+            source_token = active_source_token
+            break
+    if not source_token:
+        return jsonify(
+            {'success': False, 'message': f'Circuit open for all source token configs of user_email: {user_email}'})
+
     latest_timestamp = request.args.get('latest_timestamp')
     if not latest_timestamp:
         latest_timestamp = str(get_current_time())
@@ -107,12 +115,38 @@ def sentry_start_data_fetch():
     if not oldest_timestamp:
         oldest_timestamp = ''
 
-    sentry_api_processor = SentryApiProcessor(source_token.token_config['bearer_token'],
-                                              source_token.token_config['organization_slug'], project_slug)
-    data_fetch_success = sentry_api_processor.fetch_events(latest_timestamp, oldest_timestamp)
-    if data_fetch_success:
-        return jsonify({'success': True})
-    return jsonify({'success': False, 'message': 'Failed to fetch events'})
+    from jobs.tasks import sentry_start_data_fetch_job
+    job = sentry_start_data_fetch_job.delay(source_token.id, project_slug, latest_timestamp, oldest_timestamp,
+                                            request.args.get('mode'), request.args.get('stats_period'),
+                                            request.args.get('events_sample_size', 0, type=int),
+                                            profile=is_profiling_requested())
+    return get_job_submitted_response(job)
+
+
+@app_blueprint.route('/google_chat/start_data_fetch', methods=['GET'])
+def google_chat_start_data_fetch():
+    user_email = request.args.get('user_email')
+    if not user_email:
+        return jsonify({'success': False, 'message': 'Invalid arguments provided'})
+    source_tokens = get_source_token_config_by(user_email, 'GOOGLE_CHAT', is_active=True)
+    if not source_tokens:
+        return jsonify(
+            {'success': False, 'message': f'No active source token configs found for user_email: {user_email}'})
+
+    source_token = None
+    for active_source_token in source_tokens:
+        if get_source_token_circuit_breaker(active_source_token.id).get_state() != CircuitState.OPEN:
+            source_token = active_source_token
+            break
+    if not source_token:
+        return jsonify(
+            {'success': False, 'message': f'Circuit open for all source token configs of user_email: {user_email}'})
+
+    from jobs.tasks import google_chat_fetch_spaces_job
+    job = google_chat_fetch_spaces_job.delay(source_token.id, request.args.getlist('space_name') or None,
+                                             request.args.get('max_workers', type=int),
+                                             profile=is_profiling_requested())
+    return get_job_submitted_response(job)
 
 
 @app_blueprint.route('/new_relic/fetch_alert_policies_nrql_conditions', methods=['GET'])
@@ -121,18 +155,18 @@ def new_relic_fetch_alert_policies_nrql_conditions():
     nr_account_id = request.args.get('nr_account_id')
     nr_query_key = request.args.get('nr_query_key')
     nr_policy_id = request.args.get('nr_policy_id')
+    max_workers = request.args.get('max_workers', type=int)
     if not nr_api_key or not nr_account_id:
         return jsonify({'success': False, 'message': 'Invalid arguments provided'})
 
-    new_relic_rest_api_processor = NewRelicRestApiProcessor(nr_api_key, nr_account_id, nr_query_key)
     policy_id = []
     if nr_policy_id:
         policy_id.append(nr_policy_id)
-    all_policies_nrql_conditions = new_relic_rest_api_processor.fetch_alert_policies_nrql_conditions(policy_id)
-    if not all_policies_nrql_conditions:
-        return jsonify({'success': False, 'message': 'Failed to fetch alert policies nrql conditions'})
-
-    return jsonify({'success': True})
+    from jobs.tasks import new_relic_fetch_alert_policies_nrql_conditions_job
+    job = new_relic_fetch_alert_policies_nrql_conditions_job.delay(nr_api_key, nr_account_id, nr_query_key, policy_id,
+                                                                   max_workers, request.args.get('backend'),
+                                                                   profile=is_profiling_requested())
+    return get_job_submitted_response(job)
 
 
 @app_blueprint.route('/new_relic/fetch_alert_violations', methods=['GET'])
@@ -142,11 +176,63 @@ def new_relic_fetch_alert_violations():
     nr_query_key = request.args.get('nr_query_key')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    max_workers = request.args.get('max_workers', type=int)
     if not nr_api_key or not nr_account_id:
         return jsonify({'success': False, 'message': 'Invalid arguments provided'})
 
+    from jobs.tasks import new_relic_fetch_alert_violations_job
+    job = new_relic_fetch_alert_violations_job.delay(nr_api_key, nr_account_id, nr_query_key, start_date, end_date,
+                                                     max_workers, profile=is_profiling_requested())
+    return get_job_submitted_response(job)
+
+
+@app_blueprint.route('/new_relic/fetch_incident_rollups', methods=['GET'])
+def new_relic_fetch_incident_rollups():
+    nr_api_key = request.args.get('nr_api_key')
+    nr_account_id = request.args.get('nr_account_id')
+    nr_query_key = request.args.get('nr_query_key')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    facet = request.args.get('facet', 'policyName')
+    bucket = request.args.get('bucket', '1 hour')
+    # Rollups only go through the Insights query API, the REST api key is optional here
+    if not nr_account_id or not nr_query_key:
+        return jsonify({'success': False, 'message': 'Invalid arguments provided'})
+    if not facet.isidentifier():
+        return jsonify({'success': False, 'message': f'Invalid facet: {facet}'})
+
+    from env_vars import NEW_RELIC_RAW_DATA_S3_BUCKET_NAME
+    from processors.new_relic_rest_client import NewRelicRestApiProcessor
     new_relic_rest_api_processor = NewRelicRestApiProcessor(nr_api_key, nr_account_id, nr_query_key)
-    data_fetch_success = new_relic_rest_api_processor.fetch_alert_violations(start_date, end_date)
+    with profile_run(f'new_relic_fetch_incident_rollups-{nr_account_id}', is_profiling_requested(),
+                     NEW_RELIC_RAW_DATA_S3_BUCKET_NAME):
+        data_fetch_success = new_relic_rest_api_processor.fetch_incident_rollups(start_date, end_date, facet, bucket)
     if data_fetch_success:
         return jsonify({'success': True})
-    return jsonify({'success': False, 'message': 'Failed to fetch alert violations'})
+    return jsonify({'success': False, 'message': 'Failed to fetch incident rollups'})
+
+
+@app_blueprint.route('/jobs/<job_id>', methods=['GET'])
+def app_get_job_status(job_id):
+    from celery.result import AsyncResult
+    from celery_app import celery
+    job = AsyncResult(job_id, app=celery)
+    response = {'success': True, 'job_id': job_id, 'state': job.state}
+    if job.state == JOB_PROGRESS_STATE:
+        response['progress'] = job.info
+    elif job.state == 'SUCCESS':
+        result = job.result or {}
+        response['result'] = {'success': result.get('success', False)}
+        response['progress'] = result.get('progress')
+    elif job.state == 'FAILURE':
+        response['result'] = {'success': False, 'message': str(job.result)}
+    return jsonify(response)
+
+
+def is_profiling_requested():
+    return request.args.get('profile', '').lower() in ('true', '1')
+
+
+def get_job_submitted_response(job):
+    return jsonify({'success': True, 'job_id': job.id,
+                    'status_url': url_for('app_router.app_get_job_status', job_id=job.id)}), 202
@@ -1,19 +1,16 @@
-import json
 import os
 import logging
-import pandas as pd
 
 import flask
 from flask import Blueprint, request
 
-import google.oauth2.credentials
-import google_auth_oauthlib.flow
-import googleapiclient.discovery
-
-from env_vars import GOOGLE_OAUTH_REDIRECT_URI, GOOGLE_CLIENT_SECRETS_FILE, PUSH_TO_SLACK, PUSH_TO_S3, \
-    RAW_DATA_S3_BUCKET_NAME
-from utils.publishsing_client import publish_message_to_slack, publish_object_file_to_s3
-from utils.time_utils import get_current_datetime
+from env_vars import GOOGLE_OAUTH_REDIRECT_URI, GOOGLE_CLIENT_SECRETS_FILE, PUSH_TO_SLACK
+from persistance.db_utils import get_source_token_config_by, get_source_token_config_by_id, \
+    update_source_token_config
+from route_handlers.app_route_handler import handler_source_token_registration
+from utils.circuit_breaker import CircuitState, get_source_token_circuit_breaker, record_source_token_auth_failure
+from utils.publishsing_client import publish_message_to_slack
+from utils.tracing import traced
 
 google_blueprint = Blueprint('google_router', __name__)
 
@@ -26,97 +23,87 @@ logger = logging.getLogger(__name__)
 # authenticated user's account and requires requests to use an SSL connection.
 SCOPES = ['https://www.googleapis.com/auth/chat.messages.readonly',
           'https://www.googleapis.com/auth/chat.spaces.readonly']
-API_SERVICE_NAME = 'chat'
-API_VERSION = 'v1'
 
 secrets_file_path = os.path.join(os.getcwd() + '/secrets', GOOGLE_CLIENT_SECRETS_FILE)
 
 
-def credentials_to_dict(credentials):
-    return {'token': credentials.token,
-            'refresh_token': credentials.refresh_token,
-            'token_uri': credentials.token_uri,
-            'client_id': credentials.client_id,
-            'client_secret': credentials.client_secret,
-            'scopes': credentials.scopes}
+def get_google_chat_source_token():
+    """
+    The GOOGLE_CHAT source token of the user_email argument, the one registered by the last oauth callback of the
+    session otherwise.
+    """
+    user_email = request.args.get('user_email')
+    if user_email:
+        for source_token in get_source_token_config_by(user_email, 'GOOGLE_CHAT', is_active=True):
+            if get_source_token_circuit_breaker(source_token.id).get_state() != CircuitState.OPEN:
+                return source_token
+        return None
+    if 'google_chat_source_token_id' in flask.session:
+        return get_source_token_config_by_id(flask.session['google_chat_source_token_id'])
+    return None
+
+
+def save_refreshed_credentials(source_token, google_chat_api_processor):
+    refreshed_token_config = google_chat_api_processor.get_refreshed_credentials_config()
+    if refreshed_token_config:
+        update_source_token_config(source_token, token_config=refreshed_token_config)
 
 
 @google_blueprint.route('/get_chats')
+@traced('google_chat.get_chats')
 def get_chats_request():
     space_name = request.args.get('space_name')
-    credentials_str = request.args.get('credentials')
     if not space_name:
         return 'Missing space_name', 400
-    all_messages = []
-    cred_dict = json.loads(credentials_str)
-
-    # Load credentials from the session.
-    credentials = google.oauth2.credentials.Credentials(**cred_dict)
-
-    chat_service = googleapiclient.discovery.build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
-
-    should_continue = True
-    page_token = ''
-    while should_continue:
-        response = chat_service.spaces().messages().list(parent=space_name, pageSize=1000,
-                                                         pageToken=page_token).execute()
-        all_messages.extend(response['messages'])
-        if 'nextPageToken' in response and response['nextPageToken']:
-            page_token = response['nextPageToken']
-        else:
-            should_continue = False
-            break
-
-    df = pd.DataFrame(all_messages)
-    current_time = get_current_datetime()
-    csv_file_name = f"{space_name.split('/')[1]}-{current_time}-raw_data.csv"
-    downloads_dir = os.path.join(os.getcwd(), 'downloads')
-    downloads_data_dir = os.path.join(downloads_dir, 'data')
-    csv_file_path = os.path.join(downloads_data_dir, csv_file_name)
-    df.to_csv(csv_file_path, index=False)
-    if PUSH_TO_S3:
-        publish_object_file_to_s3(csv_file_path, RAW_DATA_S3_BUCKET_NAME, csv_file_name)
-        try:
-            os.remove(csv_file_path)
-            logger.error(f"File '{csv_file_path}' deleted successfully.")
-        except FileNotFoundError:
-            logger.error(f"File '{csv_file_path}' not found.")
-        except PermissionError:
-            logger.error(f"Permission error. You may not have the necessary permissions to delete the file.")
-        except Exception as e:
-            logger.error(f"An error occurred: {e}")
-    # Save credentials back to session in case access token was refreshed.
-    # ACTION ITEM: In a production app, you likely want to save these
-    #              credentials in a persistent database instead.
-    # flask.session['credentials'] = credentials_to_dict(credentials)
-
-    return {}
+    source_token = get_google_chat_source_token()
+    if not source_token:
+        return 'No active google chat source token found', 404
+
+    from processors.google_chat_apis import GoogleChatApiProcessor
+
+    google_chat_api_processor = GoogleChatApiProcessor(source_token.token_config)
+    if not google_chat_api_processor.refresh_credentials():
+        if google_chat_api_processor.auth_error:
+            record_source_token_auth_failure(source_token.id)
+            return 'Failed to refresh google chat credentials', 401
+        return 'Failed to reach google to refresh the credentials', 503
+    # Pages are streamed to the CSV as they arrive, see google_chat_fetch_spaces_job for incremental scrapes
+    result = google_chat_api_processor.fetch_space_messages(space_name)
+    save_refreshed_credentials(source_token, google_chat_api_processor)
+    if not result['success']:
+        return 'Failed to fetch messages', 500
+    return {'messages': result['messages'], 'last_message_create_time': result['last_message_create_time']}
 
 
 @google_blueprint.route('/get_spaces')
 def get_spaces_request():
-    if 'credentials' not in flask.session:
+    source_token = get_google_chat_source_token()
+    if not source_token:
         return flask.redirect('/google/authorize')
 
-    # Load credentials from the session.
-    credentials = google.oauth2.credentials.Credentials(
-        **flask.session['credentials'])
-
-    chat_service = googleapiclient.discovery.build(
-        API_SERVICE_NAME, API_VERSION, credentials=credentials)
-
-    response = chat_service.spaces().list().execute()
+    from processors.google_chat_apis import GoogleChatApiProcessor
 
-    # Save credentials back to session in case access token was refreshed.
-    # ACTION ITEM: In a production app, you likely want to save these
-    #              credentials in a persistent database instead.
-    flask.session['credentials'] = credentials_to_dict(credentials)
-    print(response)
-    return flask.jsonify(**response)
+    google_chat_api_processor = GoogleChatApiProcessor(source_token.token_config)
+    if not google_chat_api_processor.refresh_credentials():
+        if google_chat_api_processor.auth_error:
+            record_source_token_auth_failure(source_token.id)
+            return 'Failed to refresh google chat credentials', 401
+        return 'Failed to reach google to refresh the credentials', 503
+    space_names = google_chat_api_processor.fetch_spaces()
+    save_refreshed_credentials(source_token, google_chat_api_processor)
+    if space_names is None:
+        return 'Failed to fetch spaces', 500
+    return flask.jsonify(spaces=space_names)
 
 
 @google_blueprint.route('/authorize')
 def authorize():
+    user_email = request.args.get('user_email')
+    if not user_email:
+        return 'Missing user_email', 400
+
+    import google_auth_oauthlib.flow
+
     # Create flow instance to manage the OAuth 2.0 Authorization Grant Flow steps.
     flow = google_auth_oauthlib.flow.Flow.from_client_secrets_file(secrets_file_path, scopes=SCOPES)
 
@@ -135,15 +122,21 @@ def authorize():
 
     # Store the state so the callback can verify the auth server response.
     flask.session['state'] = state
+    flask.session['user_email'] = user_email
 
     return flask.redirect(authorization_url)
 
 
 @google_blueprint.route('/oauth2callback')
 def oauth2callback():
+    import google_auth_oauthlib.flow
+
     # Specify the state when creating the flow in the callback so that it can
     # verified in the authorization server response.
-    state = flask.session['state']
+    state = flask.session.get('state')
+    user_email = flask.session.get('user_email')
+    if not state or not user_email:
+        return 'Missing authorization session, start from /google/authorize', 400
 
     flow = google_auth_oauthlib.flow.Flow.from_client_secrets_file(secrets_file_path, scopes=SCOPES, state=state)
     flow.redirect_uri = GOOGLE_OAUTH_REDIRECT_URI
@@ -155,23 +148,18 @@ def oauth2callback():
         authorization_response = flask.request.url
     flow.fetch_token(authorization_response=authorization_response)
 
-    # Store credentials in the session.
-    # ACTION ITEM: In a production app, you likely want to save these
-    #              credentials in a persistent database instead.
-    credentials = flow.credentials
-    credentials_dict = credentials_to_dict(credentials)
-    credentials_json_str = json.dumps(credentials_dict)
+    from processors.google_chat_apis import credentials_to_dict
+
+    saved_token_config = handler_source_token_registration(user_email, 'google_chat',
+                                                           credentials_to_dict(flow.credentials))
+    if not saved_token_config or not saved_token_config[0]:
+        return 'Failed to register google chat credentials', 500
+    source_token = saved_token_config[0]
     if PUSH_TO_SLACK:
-        message_text = "Registered g-chat workspace: " + "*" + credentials_json_str + "*"
+        message_text = f"Registered g-chat source token: *{source_token.id}* for user_email: *{user_email}*"
         publish_message_to_slack(message_text)
-    print('credentials_dict', credentials_dict)
-    df = pd.DataFrame([credentials_dict])
-    current_time = get_current_datetime()
-    csv_file_name = f"{current_time}-credentials.csv"
-    downloads_dir = os.path.join(os.getcwd(), 'downloads')
-    downloads_credentials_dir = os.path.join(downloads_dir, 'credentials')
-    csv_file_path = os.path.join(downloads_credentials_dir, csv_file_name)
-    df.to_csv(csv_file_path, index=False)
-    flask.session['credentials'] = credentials_dict
+    # New credentials, a circuit opened on the previous refresh token no longer applies
+    get_source_token_circuit_breaker(source_token.id).record_success()
+    flask.session['google_chat_source_token_id'] = source_token.id
 
     return flask.redirect(flask.url_for('google_router.get_spaces_request'))
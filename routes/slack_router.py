@@ -1,18 +1,34 @@
 import json
 import logging
+import threading
 
-import requests
 from flask import request, redirect
 
-from env_vars import SLACK_CLIENT_ID, SLACK_REDIRECT_URI, SLACK_CLIENT_SECRET
+from env_vars import SLACK_CLIENT_ID, SLACK_REDIRECT_URI, SLACK_CLIENT_SECRET, SLACK_SIGNING_SECRET
 from flask import jsonify, Blueprint
 
-from route_handlers.slack_route_handler import handle_oauth_callback, handle_event_callback
+from route_handlers.slack_route_handler import handle_oauth_callback
+from utils.http_client import get_http_session
+from utils.idempotency_store import get_slack_event_idempotency_store
 
 slack_blueprint = Blueprint('slack_router', __name__)
 
 logger = logging.getLogger(__name__)
 
+SLACK_OAUTH_ACCESS_URL = 'https://slack.com/api/oauth.v2.access'
+
+_slack_signature_verifier = None
+_slack_signature_verifier_lock = threading.Lock()
+
+
+def get_slack_signature_verifier():
+    global _slack_signature_verifier
+    with _slack_signature_verifier_lock:
+        if _slack_signature_verifier is None:
+            from slack_sdk.signature import SignatureVerifier
+            _slack_signature_verifier = SignatureVerifier(SLACK_SIGNING_SECRET)
+        return _slack_signature_verifier
+
 
 @slack_blueprint.route('/install', methods=['GET'])
 def install():
@@ -30,7 +46,7 @@ def oauth_redirect():
         logger.error(f"Error while fetching bot OAuth token with error: No code found")
         return jsonify({'success': False, 'message': 'Alert Summary Bot Installation failed with error: No code found'})
     # Exchange the authorization code for an OAuth token
-    response = requests.post('https://slack.com/api/oauth.v2.access', {
+    response = get_http_session(SLACK_OAUTH_ACCESS_URL).post(SLACK_OAUTH_ACCESS_URL, {
         'client_id': SLACK_CLIENT_ID,
         'client_secret': SLACK_CLIENT_SECRET,
         'code': code,
@@ -54,17 +70,35 @@ def oauth_redirect():
 
 @slack_blueprint.route('/events', methods=['POST'])
 def handle_slack_events():
-    request_data = request.data.decode('utf-8')
+    # Slack expects an answer within 3 seconds, events are only verified and queued here, handle_slack_event_job
+    # does the actual handling on a worker
+    request_data = request.get_data()
+    if not get_slack_signature_verifier().is_valid_request(request_data, request.headers):
+        logger.error(f"Error handling slack event: invalid request signature")
+        return jsonify({'success': False, 'message': 'Alert Summary Bot Event Handling failed'}), 401
+    request_data = request_data.decode('utf-8')
     if request_data:
         data = json.loads(request_data)
         if data['type'] == 'url_verification':
             return jsonify({'challenge': data['challenge']})
         elif data['type'] == 'event_callback':
-            response = handle_event_callback(data)
-            if response:
-                return jsonify({'success': True, 'message': 'Alert Summary Bot Event Handling Successful'})
-            else:
-                return jsonify({'success': False, 'message': 'Alert Summary Bot Event Handling failed'})
+            event_id = data.get('event_id', None)
+            idempotency_store = get_slack_event_idempotency_store()
+            if event_id and not idempotency_store.claim(event_id):
+                logger.info(f"Skipping redelivered slack event: {event_id}, "
+                            f"retry: {request.headers.get('X-Slack-Retry-Num')}, "
+                            f"reason: {request.headers.get('X-Slack-Retry-Reason')}")
+                return jsonify({'success': True, 'message': 'Alert Summary Bot Event Already Handled'})
+            try:
+                from jobs.tasks import handle_slack_event_job
+                handle_slack_event_job.delay(data)
+            except Exception as e:
+                # Slack retries events that were not acknowledged with a 2xx, the retry must not be skipped
+                logger.error(f"Error while queueing slack event: {event_id} with error: {e}")
+                if event_id:
+                    idempotency_store.release(event_id)
+                return jsonify({'success': False, 'message': 'Alert Summary Bot Event Handling failed'}), 500
+            return jsonify({'success': True, 'message': 'Alert Summary Bot Event Handling Successful'})
         else:
             logger.error(f"Error while fetching bot OAuth token with response: {data}")
             return jsonify({'success': False, 'message': 'Alert Summary Bot Event Handling failed'})
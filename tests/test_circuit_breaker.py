@@ -0,0 +1,159 @@
+import pytest
+
+pytest.importorskip('redis')
+
+import utils.circuit_breaker as circuit_breaker
+from utils.circuit_breaker import CircuitState, CredentialCircuitBreaker, CIRCUIT_BREAKER_COOLDOWN_SECONDS, \
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the redis commands the circuit breaker uses, values are kept as strings like a redis
+    client with decode_responses=True returns them.
+    """
+
+    def __init__(self):
+        self.hashes = {}
+        self.values = {}
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hincrby(self, key, field, amount):
+        circuit = self.hashes.setdefault(key, {})
+        circuit[field] = str(int(circuit.get(field, 0)) + amount)
+        return int(circuit[field])
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = str(value)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+            self.values.pop(key, None)
+
+
+class BrokenRedis:
+    def __getattr__(self, name):
+        raise ConnectionError('redis is down')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(circuit_breaker, 'get_current_time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis_client = FakeRedis()
+    monkeypatch.setattr(circuit_breaker, 'get_redis_client', lambda: redis_client)
+    return redis_client
+
+
+def open_circuit(breaker):
+    for _ in range(CIRCUIT_BREAKER_FAILURE_THRESHOLD):
+        breaker.record_auth_failure()
+
+
+def test_closed_below_failure_threshold(fake_redis, clock):
+    breaker = CredentialCircuitBreaker('slack_workspace', 1)
+    for failures in range(1, CIRCUIT_BREAKER_FAILURE_THRESHOLD):
+        assert breaker.record_auth_failure() == failures
+        assert breaker.get_state() == CircuitState.CLOSED
+
+
+def test_opens_at_failure_threshold(fake_redis, clock):
+    breaker = CredentialCircuitBreaker('slack_workspace', 1)
+    open_circuit(breaker)
+
+    assert breaker.get_state() == CircuitState.OPEN
+
+
+def test_single_probe_after_cooldown(fake_redis, clock):
+    breaker = CredentialCircuitBreaker('slack_workspace', 1)
+    open_circuit(breaker)
+    clock[0] += CIRCUIT_BREAKER_COOLDOWN_SECONDS
+
+    assert breaker.get_state() == CircuitState.HALF_OPEN
+    # Every other dispatcher keeps skipping the credential while the probe runs
+    assert breaker.get_state() == CircuitState.OPEN
+
+
+def test_successful_probe_closes(fake_redis, clock):
+    breaker = CredentialCircuitBreaker('slack_workspace', 1)
+    open_circuit(breaker)
+    clock[0] += CIRCUIT_BREAKER_COOLDOWN_SECONDS
+    assert breaker.get_state() == CircuitState.HALF_OPEN
+
+    breaker.record_success()
+
+    assert breaker.get_state() == CircuitState.CLOSED
+    assert breaker.record_auth_failure() == 1
+
+
+def test_failed_probe_restarts_cooldown(fake_redis, clock):
+    breaker = CredentialCircuitBreaker('slack_workspace', 1)
+    open_circuit(breaker)
+    clock[0] += CIRCUIT_BREAKER_COOLDOWN_SECONDS
+    assert breaker.get_state() == CircuitState.HALF_OPEN
+
+    assert breaker.record_auth_failure() == CIRCUIT_BREAKER_FAILURE_THRESHOLD + 1
+
+    assert breaker.get_state() == CircuitState.OPEN
+    clock[0] += CIRCUIT_BREAKER_COOLDOWN_SECONDS
+    assert breaker.get_state() == CircuitState.HALF_OPEN
+
+
+def test_released_probe_is_handed_out_again(fake_redis, clock):
+    breaker = CredentialCircuitBreaker('slack_workspace', 1)
+    open_circuit(breaker)
+    clock[0] += CIRCUIT_BREAKER_COOLDOWN_SECONDS
+    assert breaker.get_state() == CircuitState.HALF_OPEN
+
+    breaker.release_probe()
+
+    assert breaker.get_state() == CircuitState.HALF_OPEN
+    assert breaker.record_auth_failure() == CIRCUIT_BREAKER_FAILURE_THRESHOLD + 1
+
+
+def test_credentials_are_isolated(fake_redis, clock):
+    breaker = CredentialCircuitBreaker('slack_workspace', 1)
+    open_circuit(breaker)
+
+    assert CredentialCircuitBreaker('slack_workspace', 2).get_state() == CircuitState.CLOSED
+    assert CredentialCircuitBreaker('source_token', 1).get_state() == CircuitState.CLOSED
+
+
+def test_redis_errors_fail_closed(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, 'get_redis_client', lambda: BrokenRedis())
+    breaker = CredentialCircuitBreaker('slack_workspace', 1)
+
+    assert breaker.get_state() == CircuitState.CLOSED
+    assert breaker.record_auth_failure() == 0
+    breaker.record_success()
+    breaker.release_probe()
+
+
+def test_deactivates_after_deactivation_threshold(fake_redis, clock, monkeypatch):
+    db_utils = pytest.importorskip('persistance.db_utils')
+    slack_workspace_config = type('SlackWorkspaceConfig', (), {'is_active': True})()
+    deactivated = []
+    monkeypatch.setattr(db_utils, 'get_slack_workspace_config_by_id', lambda slack_workspace_id: slack_workspace_config)
+    monkeypatch.setattr(db_utils, 'update_slack_workspace_config',
+                        lambda config, **kwargs: deactivated.append(kwargs))
+
+    for _ in range(circuit_breaker.CIRCUIT_BREAKER_DEACTIVATION_THRESHOLD - 1):
+        circuit_breaker.record_slack_workspace_auth_failure(1)
+    assert deactivated == []
+
+    circuit_breaker.record_slack_workspace_auth_failure(1)
+    assert deactivated == [{'is_active': False}]
@@ -0,0 +1,111 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from sqlalchemy.dialects import postgresql
+
+import persistance.db_utils as db_utils
+from persistance.db_utils import dedupe_rows, get_token_config_md5
+
+
+@pytest.fixture
+def upserts(monkeypatch):
+    """
+    Captures the statements handed to execute_upsert, compiled for PostgreSQL, instead of running them.
+    """
+    compiled_statements = []
+
+    def capture(statement):
+        compiled_statements.append(statement.compile(dialect=postgresql.dialect()))
+        return []
+
+    monkeypatch.setattr(db_utils, 'execute_upsert', capture)
+    monkeypatch.setattr(db_utils, 'invalidate_active_slack_workspaces_cache', lambda team_ids: None)
+    return compiled_statements
+
+
+def get_rows(compiled_statement, columns: tuple):
+    rows = []
+    while f'{columns[0]}_m{len(rows)}' in compiled_statement.params:
+        rows.append({column: compiled_statement.params[f'{column}_m{len(rows)}'] for column in columns})
+    return rows
+
+
+def test_dedupe_rows_keeps_last_row_of_each_key():
+    rows = [{'team_id': 'T1', 'channel_id': 'C1', 'name': 'a'},
+            {'team_id': 'T1', 'channel_id': 'C2', 'name': 'b'},
+            {'team_id': 'T1', 'channel_id': 'C1', 'name': 'c'}]
+
+    assert dedupe_rows(rows, ('team_id', 'channel_id')) == [{'team_id': 'T1', 'channel_id': 'C1', 'name': 'c'},
+                                                            {'team_id': 'T1', 'channel_id': 'C2', 'name': 'b'}]
+    # The given rows are copied, setting defaults on the result leaves the caller's dicts untouched
+    assert rows[0] == {'team_id': 'T1', 'channel_id': 'C1', 'name': 'a'}
+
+
+def test_token_config_md5_is_stable():
+    token_config = {'client_id': 'id', 'refresh_token': 'token'}
+
+    assert get_token_config_md5(token_config) == get_token_config_md5(dict(token_config))
+    assert get_token_config_md5(token_config) != get_token_config_md5({**token_config, 'refresh_token': 'other'})
+
+
+def test_empty_upserts_do_not_hit_the_database(upserts):
+    assert db_utils.upsert_slack_workspace_configs([]) == []
+    assert db_utils.upsert_slack_bot_configs([]) == []
+    assert db_utils.upsert_token_configs([]) == []
+    assert db_utils.upsert_google_chat_space_watermarks(1, {}) == []
+    assert upserts == []
+
+
+def test_slack_workspace_configs_upsert(upserts):
+    db_utils.upsert_slack_workspace_configs([
+        {'team_id': 'T1', 'bot_user_id': 'U1', 'bot_auth_token': 'xoxb-1', 'team_name': 'old'},
+        {'team_id': 'T1', 'bot_user_id': 'U1', 'bot_auth_token': 'xoxb-1', 'team_name': 'new'},
+    ])
+
+    statement = upserts[0]
+    assert 'ON CONFLICT (team_id, bot_user_id, bot_auth_token) DO UPDATE SET ' \
+           'team_name = coalesce(excluded.team_name, slack_workspace_config.team_name)' in str(statement)
+    assert 'RETURNING slack_workspace_config.id' in str(statement)
+    assert get_rows(statement, ('team_id', 'team_name', 'is_active')) == [
+        {'team_id': 'T1', 'team_name': 'new', 'is_active': True}]
+
+
+def test_slack_workspace_configs_insert_only(upserts):
+    db_utils.upsert_slack_workspace_configs([{'team_id': 'T1', 'bot_user_id': 'U1', 'bot_auth_token': 'xoxb-1'}],
+                                            should_update=False)
+
+    assert 'ON CONFLICT (team_id, bot_user_id, bot_auth_token) DO NOTHING' in str(upserts[0])
+
+
+def test_slack_bot_configs_only_reactivate_inactive_rows(upserts):
+    db_utils.upsert_slack_bot_configs([{'slack_workspace_id': 1, 'channel_id': 'C1', 'event_ts': '1.0'},
+                                       {'slack_workspace_id': 1, 'channel_id': 'C2', 'event_ts': '2.0'}])
+
+    statement = upserts[0]
+    assert 'ON CONFLICT (slack_workspace_id, channel_id) DO UPDATE SET is_active' in str(statement)
+    assert 'WHERE slack_bot_config.is_active IS NOT true' in str(statement)
+    assert len(get_rows(statement, ('channel_id',))) == 2
+
+
+def test_token_configs_are_keyed_on_md5(upserts):
+    token_config = {'client_id': 'id', 'refresh_token': 'token'}
+    db_utils.upsert_token_configs([{'user_email': 'a@b.c', 'source': 'SENTRY', 'token_config': token_config},
+                                   {'user_email': 'a@b.c', 'source': 'SENTRY', 'token_config': dict(token_config)}])
+
+    statement = upserts[0]
+    assert 'ON CONFLICT (user_email, source, token_config_md5) DO UPDATE' in str(statement)
+    assert get_rows(statement, ('user_email', 'token_config_md5')) == [
+        {'user_email': 'a@b.c', 'token_config_md5': get_token_config_md5(token_config)}]
+
+
+def test_google_chat_watermarks_keep_stored_value_without_new_message(upserts):
+    db_utils.upsert_google_chat_space_watermarks(1, {'spaces/A': '2024-01-01T00:00:00Z', 'spaces/B': None})
+
+    statement = upserts[0]
+    assert 'ON CONFLICT (source_token_id, space_name) DO UPDATE SET last_message_create_time = ' \
+           'coalesce(excluded.last_message_create_time, ' \
+           'google_chat_space_watermark.last_message_create_time)' in str(statement)
+    assert get_rows(statement, ('space_name', 'last_message_create_time')) == [
+        {'space_name': 'spaces/A', 'last_message_create_time': '2024-01-01T00:00:00Z'},
+        {'space_name': 'spaces/B', 'last_message_create_time': None}]
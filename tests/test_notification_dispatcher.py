@@ -0,0 +1,73 @@
+import threading
+
+from utils.notification_dispatcher import NotificationDispatcher
+
+
+class RecordingSender:
+    """
+    send_digest stand-in failing its first `failures` calls, recording every digest it was called with.
+    """
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.digests = []
+        self.lock = threading.Lock()
+
+    def __call__(self, digest):
+        with self.lock:
+            self.digests.append(digest)
+            if self.failures:
+                self.failures -= 1
+                return False
+            return True
+
+
+def build_dispatcher(sender, **kwargs):
+    kwargs.setdefault('coalesce_window_seconds', 0.05)
+    kwargs.setdefault('min_send_interval_seconds', 0)
+    return NotificationDispatcher(sender, **kwargs)
+
+
+def test_notifications_of_a_window_are_sent_as_one_digest():
+    sender = RecordingSender()
+    dispatcher = build_dispatcher(sender, coalesce_window_seconds=1)
+    for message_text in ['a', 'b', 'c']:
+        dispatcher.publish(message_text)
+    dispatcher.close()
+
+    assert sender.digests == ['a\nb\nc']
+
+
+def test_digests_are_split_at_max_digest_chars():
+    dispatcher = build_dispatcher(RecordingSender(), max_digest_chars=8)
+    dispatcher.close()
+
+    assert dispatcher.build_digests(['aaa', 'bbb', 'ccc', 'ddddddddddd']) == ['aaa\nbbb', 'ccc', 'ddddddddddd']
+
+
+def test_failed_digest_is_retried():
+    sender = RecordingSender(failures=1)
+    dispatcher = build_dispatcher(sender)
+    dispatcher.publish('a')
+    dispatcher.close()
+
+    assert sender.digests == ['a', 'a']
+
+
+def test_digest_is_dropped_after_max_send_attempts():
+    sender = RecordingSender(failures=10)
+    dispatcher = build_dispatcher(sender, max_send_attempts=2)
+    dispatcher.publish('a')
+    dispatcher.publish('b')
+    dispatcher.close()
+
+    assert sender.digests == ['a\nb', 'a\nb']
+
+
+def test_close_flushes_queued_notifications():
+    sender = RecordingSender()
+    dispatcher = build_dispatcher(sender, coalesce_window_seconds=60)
+    dispatcher.publish('a')
+    dispatcher.close(timeout=5)
+
+    assert sender.digests == ['a']
@@ -0,0 +1,137 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.paginator import Paginator, CursorStrategy, LinkHeaderStrategy, PageNumberStrategy, PageTokenStrategy
+
+
+class RecordingFetcher:
+    """
+    fetch_page stand-in serving `pages`, request to page, recording every request it was called with.
+    """
+
+    def __init__(self, pages: dict, delay_seconds: float = 0):
+        self.pages = pages
+        self.delay_seconds = delay_seconds
+        self.requests = []
+        self.finished_requests = []
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        with self.lock:
+            self.requests.append(request)
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+        with self.lock:
+            self.finished_requests.append(request)
+        return self.pages.get(request)
+
+
+@pytest.fixture(params=[True, False], ids=['prefetch', 'serial'])
+def prefetch(request):
+    return request.param
+
+
+def test_cursor_strategy_stops_on_empty_cursor(prefetch):
+    fetcher = RecordingFetcher({None: {'rows': [1], 'next': 'a'}, 'a': {'rows': [2], 'next': 'b'},
+                                'b': {'rows': [3], 'next': ''}})
+    paginator = Paginator(fetcher, CursorStrategy(lambda page: page['next']), prefetch=prefetch)
+
+    assert [page['rows'] for page in paginator] == [[1], [2], [3]]
+    assert fetcher.requests == [None, 'a', 'b']
+    assert not paginator.failed
+
+
+def test_link_header_strategy_stops_on_results_false(prefetch):
+    def response(next_url, results):
+        return SimpleNamespace(links={'next': {'url': next_url, 'results': results}})
+
+    fetcher = RecordingFetcher({'/p1': response('/p2', 'true'), '/p2': response('/p3', 'false')})
+    paginator = Paginator(fetcher, LinkHeaderStrategy('/p1'), prefetch=prefetch)
+
+    assert len(list(paginator)) == 2
+    assert fetcher.requests == ['/p1', '/p2']
+    assert not paginator.failed
+
+
+def test_link_header_strategy_stops_without_next_link(prefetch):
+    fetcher = RecordingFetcher({'/p1': SimpleNamespace(links={})})
+    paginator = Paginator(fetcher, LinkHeaderStrategy('/p1'), prefetch=prefetch)
+
+    assert len(list(paginator)) == 1
+    assert not paginator.failed
+
+
+def test_page_number_strategy_stops_on_empty_page(prefetch):
+    fetcher = RecordingFetcher({0: [1, 2], 1: [3], 2: []})
+    paginator = Paginator(fetcher, PageNumberStrategy(lambda page: page, max_pages=10, start_page=0),
+                          prefetch=prefetch)
+
+    assert list(paginator) == [[1, 2], [3], []]
+    assert fetcher.requests == [0, 1, 2]
+    assert not paginator.failed
+
+
+def test_page_number_strategy_stops_at_max_pages(prefetch):
+    fetcher = RecordingFetcher({page: [page] for page in range(1, 100)})
+    paginator = Paginator(fetcher, PageNumberStrategy(lambda page: page, max_pages=3), prefetch=prefetch)
+
+    assert list(paginator) == [[1], [2], [3]]
+    assert fetcher.requests == [1, 2, 3]
+
+
+def test_page_token_strategy_stops_without_next_page_token(prefetch):
+    fetcher = RecordingFetcher({'': {'nextPageToken': 't1'}, 't1': {'nextPageToken': 't2'}, 't2': {}})
+    paginator = Paginator(fetcher, PageTokenStrategy(), prefetch=prefetch)
+
+    assert len(list(paginator)) == 3
+    assert fetcher.requests == ['', 't1', 't2']
+    assert not paginator.failed
+
+
+def test_failed_page_sets_failed(prefetch):
+    # Page 2 is missing, fetch_page gave up on it
+    fetcher = RecordingFetcher({1: [1], 3: [3]})
+    paginator = Paginator(fetcher, PageNumberStrategy(lambda page: page, max_pages=10), prefetch=prefetch)
+
+    assert list(paginator) == [[1]]
+    assert paginator.failed
+
+
+def test_last_page_does_not_set_failed(prefetch):
+    fetcher = RecordingFetcher({1: [1], 2: []})
+    paginator = Paginator(fetcher, PageNumberStrategy(lambda page: page, max_pages=10), prefetch=prefetch)
+
+    assert list(paginator) == [[1], []]
+    assert not paginator.failed
+
+
+def test_prefetch_requests_next_page_before_current_is_consumed():
+    fetcher = RecordingFetcher({1: [1], 2: [2], 3: []}, delay_seconds=0.05)
+    paginator = Paginator(fetcher, PageNumberStrategy(lambda page: page, max_pages=10))
+
+    iterator = iter(paginator)
+    assert next(iterator) == [1]
+    time.sleep(0.1)
+    assert fetcher.finished_requests == [1, 2]
+    iterator.close()
+
+
+def test_break_drains_in_flight_page():
+    fetcher = RecordingFetcher({page: [page] for page in range(1, 100)}, delay_seconds=0.05)
+    paginator = Paginator(fetcher, PageNumberStrategy(lambda page: page, max_pages=100))
+
+    for page in paginator:
+        if page == [2]:
+            # Lets the prefetch of page 3 start before breaking out
+            time.sleep(0.01)
+            break
+
+    # The page in flight when the loop broke has completed, and nothing was requested after it
+    assert fetcher.requests == [1, 2, 3]
+    assert fetcher.finished_requests == [1, 2, 3]
+    assert not paginator.failed
+    time.sleep(0.1)
+    assert fetcher.requests == [1, 2, 3]
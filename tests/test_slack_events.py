@@ -0,0 +1,155 @@
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('slack_sdk')
+pytest.importorskip('celery')
+
+from flask import Flask
+
+import utils.idempotency_store as idempotency_store
+from env_vars import SLACK_SIGNING_SECRET
+from routes.slack_router import slack_blueprint
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the SET NX and DELETE commands the idempotency store uses.
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class FakeJob:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.queued = []
+
+    def delay(self, data):
+        if self.fail:
+            raise ConnectionError('broker is down')
+        self.queued.append(data)
+
+
+@pytest.fixture
+def client():
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(slack_blueprint, url_prefix='/slack')
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis_client = FakeRedis()
+    monkeypatch.setattr(idempotency_store, 'get_redis_client', lambda: redis_client)
+    return redis_client
+
+
+@pytest.fixture
+def job(monkeypatch):
+    import jobs.tasks
+    fake_job = FakeJob()
+    monkeypatch.setattr(jobs.tasks, 'handle_slack_event_job', fake_job)
+    return fake_job
+
+
+def post_event(client, payload: dict, signing_secret: str = SLACK_SIGNING_SECRET, timestamp: int = None,
+               headers: dict = None):
+    body = json.dumps(payload).encode()
+    timestamp = timestamp or int(time.time())
+    base_string = f'v0:{timestamp}:'.encode() + body
+    signature = 'v0=' + hmac.new(signing_secret.encode(), base_string, hashlib.sha256).hexdigest()
+    return client.post('/slack/events', data=body, content_type='application/json', headers={
+        'X-Slack-Request-Timestamp': str(timestamp),
+        'X-Slack-Signature': signature,
+        **(headers or {}),
+    })
+
+
+def event_callback(event_id: str = 'Ev01'):
+    return {'type': 'event_callback', 'event_id': event_id, 'team_id': 'T01',
+            'event': {'type': 'message', 'channel': 'C01', 'event_ts': '1700000000.000100'}}
+
+
+def test_url_verification_is_answered(client):
+    response = post_event(client, {'type': 'url_verification', 'challenge': 'abc'})
+
+    assert response.status_code == 200
+    assert response.get_json() == {'challenge': 'abc'}
+
+
+def test_rejects_wrong_signing_secret(client, fake_redis, job):
+    response = post_event(client, event_callback(), signing_secret='not-the-secret')
+
+    assert response.status_code == 401
+    assert job.queued == []
+    assert fake_redis.values == {}
+
+
+def test_rejects_stale_timestamp(client, fake_redis, job):
+    response = post_event(client, event_callback(), timestamp=int(time.time()) - 10 * 60)
+
+    assert response.status_code == 401
+    assert job.queued == []
+
+
+def test_rejects_unsigned_request(client, fake_redis, job):
+    response = client.post('/slack/events', data=json.dumps(event_callback()), content_type='application/json')
+
+    assert response.status_code == 401
+    assert job.queued == []
+
+
+def test_event_callback_is_queued(client, fake_redis, job):
+    response = post_event(client, event_callback())
+
+    assert response.status_code == 200
+    assert response.get_json()['success']
+    assert job.queued == [event_callback()]
+
+
+def test_redelivered_event_is_skipped(client, fake_redis, job):
+    post_event(client, event_callback())
+    response = post_event(client, event_callback(), headers={'X-Slack-Retry-Num': '1',
+                                                             'X-Slack-Retry-Reason': 'http_timeout'})
+
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'Alert Summary Bot Event Already Handled'
+    assert job.queued == [event_callback()]
+
+
+def test_distinct_events_are_queued(client, fake_redis, job):
+    post_event(client, event_callback('Ev01'))
+    post_event(client, event_callback('Ev02'))
+
+    assert [data['event_id'] for data in job.queued] == ['Ev01', 'Ev02']
+
+
+def test_queueing_failure_releases_claim(client, fake_redis, job):
+    job.fail = True
+    response = post_event(client, event_callback())
+
+    assert response.status_code == 500
+    assert fake_redis.values == {}
+
+    # Slack's retry of the event is accepted once the broker is back
+    job.fail = False
+    response = post_event(client, event_callback(), headers={'X-Slack-Retry-Num': '1'})
+
+    assert response.status_code == 200
+    assert job.queued == [event_callback()]
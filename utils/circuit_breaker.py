@@ -0,0 +1,118 @@
+import logging
+from enum import Enum
+
+from utils.redis_client import get_redis_client
+from utils.time_utils import get_current_time
+
+logger = logging.getLogger(__name__)
+
+# Consecutive auth failures after which a credential is no longer scheduled
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 3
+# Consecutive auth failures after which the credential row is marked inactive
+CIRCUIT_BREAKER_DEACTIVATION_THRESHOLD = 5
+# An open circuit lets a single probe through per cooldown period
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = 6 * 60 * 60
+
+SLACK_WORKSPACE_CREDENTIAL = 'slack_workspace'
+SOURCE_TOKEN_CREDENTIAL = 'source_token'
+
+
+class CircuitState(Enum):
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CredentialCircuitBreaker:
+    """
+    Circuit breaker on the auth failures of one credential row, kept in redis so that the dispatchers and every
+    worker see the same state. Redis errors fail closed, a broken redis never stops a scrape.
+    """
+
+    def __init__(self, credential_type: str, credential_id):
+        self.key = f'circuit_breaker:{credential_type}:{credential_id}'
+        self.probe_key = f'{self.key}:probe'
+
+    def get_state(self):
+        """
+        CLOSED when the credential can be used, HALF_OPEN when the caller got the single probe of this cooldown
+        period and OPEN when the credential must be skipped.
+        """
+        try:
+            redis_client = get_redis_client()
+            circuit = redis_client.hgetall(self.key)
+            failures = int(circuit.get('failures', 0))
+            if failures < CIRCUIT_BREAKER_FAILURE_THRESHOLD:
+                return CircuitState.CLOSED
+            if get_current_time() - float(circuit.get('opened_at', 0)) < CIRCUIT_BREAKER_COOLDOWN_SECONDS:
+                return CircuitState.OPEN
+            if redis_client.set(self.probe_key, 1, nx=True, ex=CIRCUIT_BREAKER_COOLDOWN_SECONDS):
+                return CircuitState.HALF_OPEN
+            return CircuitState.OPEN
+        except Exception as e:
+            logger.error(f"Error while reading circuit breaker {self.key} with error: {e}")
+            return CircuitState.CLOSED
+
+    def record_success(self):
+        try:
+            get_redis_client().delete(self.key, self.probe_key)
+        except Exception as e:
+            logger.error(f"Error while closing circuit breaker {self.key} with error: {e}")
+
+    def release_probe(self):
+        """
+        Gives back the probe of this cooldown period when it failed for another reason than the credential, a
+        timeout or an outage of the source, so that the next dispatch probes again without counting a failure.
+        """
+        try:
+            get_redis_client().delete(self.probe_key)
+        except Exception as e:
+            logger.error(f"Error while releasing probe of circuit breaker {self.key} with error: {e}")
+
+    def record_auth_failure(self):
+        """
+        Returns the number of consecutive auth failures of the credential, including this one.
+        """
+        try:
+            redis_client = get_redis_client()
+            failures = redis_client.hincrby(self.key, 'failures', 1)
+            if failures >= CIRCUIT_BREAKER_FAILURE_THRESHOLD:
+                # Every failure past the threshold, probes included, restarts the cooldown
+                redis_client.hset(self.key, 'opened_at', get_current_time())
+                redis_client.delete(self.probe_key)
+            return failures
+        except Exception as e:
+            logger.error(f"Error while recording failure on circuit breaker {self.key} with error: {e}")
+            return 0
+
+
+def get_slack_workspace_circuit_breaker(slack_workspace_id):
+    return CredentialCircuitBreaker(SLACK_WORKSPACE_CREDENTIAL, slack_workspace_id)
+
+
+def get_source_token_circuit_breaker(source_token_id):
+    return CredentialCircuitBreaker(SOURCE_TOKEN_CREDENTIAL, source_token_id)
+
+
+def record_slack_workspace_auth_failure(slack_workspace_id):
+    failures = get_slack_workspace_circuit_breaker(slack_workspace_id).record_auth_failure()
+    logger.error(f"Auth failure {failures} for slack workspace: {slack_workspace_id}")
+    if failures >= CIRCUIT_BREAKER_DEACTIVATION_THRESHOLD:
+        from persistance.db_utils import get_slack_workspace_config_by_id, update_slack_workspace_config
+        slack_workspace_config = get_slack_workspace_config_by_id(slack_workspace_id)
+        if slack_workspace_config and slack_workspace_config.is_active:
+            logger.error(f"Deactivating slack workspace: {slack_workspace_id} after {failures} auth failures")
+            update_slack_workspace_config(slack_workspace_config, is_active=False)
+    return failures
+
+
+def record_source_token_auth_failure(source_token_id):
+    failures = get_source_token_circuit_breaker(source_token_id).record_auth_failure()
+    logger.error(f"Auth failure {failures} for source token: {source_token_id}")
+    if failures >= CIRCUIT_BREAKER_DEACTIVATION_THRESHOLD:
+        from persistance.db_utils import get_source_token_config_by_id, update_source_token_config
+        source_token_config = get_source_token_config_by_id(source_token_id)
+        if source_token_config and source_token_config.is_active:
+            logger.error(f"Deactivating source token: {source_token_id} after {failures} auth failures")
+            update_source_token_config(source_token_config, is_active=False)
+    return failures
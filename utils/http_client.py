@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import os
+import threading
+from urllib.parse import urlparse
+
+import requests
+from cachetools import LRUCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 32
+# (connect, read) timeout applied to every request that does not pass its own
+HTTP_TIMEOUT_SECONDS = (10, 300)
+# Only connection level failures are retried by the transport, HTTP errors are left to utils.retry_utils.RetryPolicy.
+# Read errors are only retried for idempotent methods, a POST that reached the server (a one time oauth code
+# exchange, a webhook notification) must not be sent twice
+HTTP_TRANSPORT_RETRIES = 3
+HTTP_TRANSPORT_BACKOFF_FACTOR = 0.5
+# Upper bound on the clients kept per process, the least recently used one is dropped beyond it so rotated or
+# removed credentials do not keep their pools open for the life of the worker
+HTTP_MAX_SESSIONS = 256
+SLACK_MAX_WEB_CLIENTS = 256
+
+
+class ClosingLRUCache(LRUCache):
+    """
+    LRUCache closing the sessions it evicts, so their pooled connections are released with them.
+    """
+
+    def popitem(self):
+        key, session = super().popitem()
+        try:
+            session.close()
+        except Exception as e:
+            logger.error(f"Error closing evicted session: {e}")
+        return key, session
+
+
+_sessions = ClosingLRUCache(maxsize=HTTP_MAX_SESSIONS)
+# slack_sdk's WebClient opens a connection per call and has nothing to close, evicted clients are just dropped
+_slack_web_clients = LRUCache(maxsize=SLACK_MAX_WEB_CLIENTS)
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session with a default timeout, so a hung connection never blocks a worker forever.
+    """
+
+    def __init__(self, timeout=HTTP_TIMEOUT_SECONDS):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def get_credential_key(credential: str = None):
+    if not credential:
+        return None
+    return hashlib.md5(credential.encode('utf-8')).hexdigest()
+
+
+def _reset_clients_after_fork():
+    # Sockets must not be shared between a parent and its prefork children, each process builds its own pool
+    # The inherited sessions are replaced rather than cleared, clearing would close sockets the parent still uses
+    global _clients_pid, _sessions, _slack_web_clients
+    if _clients_pid != os.getpid():
+        _sessions = ClosingLRUCache(maxsize=HTTP_MAX_SESSIONS)
+        _slack_web_clients = LRUCache(maxsize=SLACK_MAX_WEB_CLIENTS)
+        _clients_pid = os.getpid()
+
+
+def build_session(pool_maxsize: int = HTTP_POOL_MAXSIZE, timeout=HTTP_TIMEOUT_SECONDS):
+    session = PooledSession(timeout)
+    retry = Retry(total=HTTP_TRANSPORT_RETRIES, connect=HTTP_TRANSPORT_RETRIES, read=HTTP_TRANSPORT_RETRIES,
+                  status=0, backoff_factor=HTTP_TRANSPORT_BACKOFF_FACTOR,
+                  allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return session
+
+
+def get_http_session(url: str, credential: str = None, headers: dict = None):
+    """
+    Returns the keep-alive session of this process for the host of `url` and `credential`, creating it on first use.
+    `headers` are only applied when the session is created, they should carry the credential the session is keyed on.
+    """
+    key = (urlparse(url).netloc, get_credential_key(credential))
+    with _clients_lock:
+        _reset_clients_after_fork()
+        session = _sessions.get(key)
+        if session is None:
+            session = build_session()
+            if headers:
+                session.headers.update(headers)
+            _sessions[key] = session
+        return session
+
+
+def get_slack_web_client(bot_auth_token: str, base_url: str = None):
+    """
+    Returns the WebClient of this process for `bot_auth_token`, with the shared timeout and connection retries.
+    `base_url` points the client at another Slack API host, the benchmarks' fake server for instance.
+    """
+    from slack_sdk import WebClient
+    from slack_sdk.http_retry import ConnectionErrorRetryHandler
+
+    base_url = base_url or WebClient.BASE_URL
+    key = (get_credential_key(bot_auth_token), base_url)
+    with _clients_lock:
+        _reset_clients_after_fork()
+        client = _slack_web_clients.get(key)
+        if client is None:
+            client = WebClient(token=bot_auth_token, base_url=base_url, timeout=HTTP_TIMEOUT_SECONDS[1],
+                               retry_handlers=[ConnectionErrorRetryHandler(max_retry_count=HTTP_TRANSPORT_RETRIES)])
+            _slack_web_clients[key] = client
+        return client
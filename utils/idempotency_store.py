@@ -0,0 +1,45 @@
+import logging
+
+from utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Slack gives up redelivering an event after about an hour of retries
+SLACK_EVENT_IDEMPOTENCY_TTL_SECONDS = 2 * 60 * 60
+
+
+class IdempotencyStore:
+    """
+    Remembers, in redis and for `ttl_seconds`, the keys of the deliveries already accepted so that redeliveries can
+    be dropped. Redis errors fail open, a broken redis never drops a delivery.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: int):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+
+    def get_key(self, key: str):
+        return f'idempotency:{self.namespace}:{key}'
+
+    def claim(self, key: str):
+        """
+        True when `key` is seen for the first time, False when it was already claimed.
+        """
+        try:
+            return bool(get_redis_client().set(self.get_key(key), 1, nx=True, ex=self.ttl_seconds))
+        except Exception as e:
+            logger.error(f"Error while claiming idempotency key {self.get_key(key)} with error: {e}")
+            return True
+
+    def release(self, key: str):
+        """
+        Forgets `key`, for deliveries that were claimed but could not be processed and should be accepted again.
+        """
+        try:
+            get_redis_client().delete(self.get_key(key))
+        except Exception as e:
+            logger.error(f"Error while releasing idempotency key {self.get_key(key)} with error: {e}")
+
+
+def get_slack_event_idempotency_store():
+    return IdempotencyStore('slack_event', SLACK_EVENT_IDEMPOTENCY_TTL_SECONDS)
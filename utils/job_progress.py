@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+
+from utils.metrics import SCRAPE_PAGES_TOTAL, SCRAPE_ROWS_TOTAL, SCRAPE_BYTES_TOTAL, SCRAPE_RUN_PAGES, \
+    SCRAPE_RUN_ROWS, SCRAPE_RUN_BYTES, SCRAPE_RUN_DURATION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+JOB_PROGRESS_STATE = 'PROGRESS'
+# Progress is published to the result backend at most this often, every page is still counted
+JOB_PROGRESS_PUBLISH_INTERVAL_SECONDS = 2.0
+
+
+def get_response_size(response):
+    """
+    Size in bytes of a requests.Response or SlackResponse body, 0 when it is not known.
+    """
+    content = getattr(response, 'content', None)
+    if isinstance(content, bytes):
+        return len(content)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return int(headers.get('Content-Length') or headers.get('content-length') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class JobProgressTracker:
+    """
+    Counts the pages, rows and bytes a processor fetches, into the `source` metrics and, when bound to a celery task,
+    publishes them with an ETA as the PROGRESS meta of the task in the result backend. Thread safe, the concurrent
+    fetchers share one tracker.
+    """
+
+    def __init__(self, source: str = 'unknown', task=None,
+                 publish_interval_seconds: float = JOB_PROGRESS_PUBLISH_INTERVAL_SECONDS):
+        self.source = source
+        self.task = task
+        self.publish_interval_seconds = publish_interval_seconds
+        self.pages = 0
+        self.rows = 0
+        self.bytes = 0
+        self.total_pages = None
+        self.fraction_done = None
+        self.started_at = time.time()
+        self.__published_at = 0
+        self.__lock = threading.Lock()
+
+    def bind(self, task):
+        self.task = task
+        return self
+
+    def set_total_pages(self, total_pages: int):
+        with self.__lock:
+            self.total_pages = total_pages
+        self.publish()
+
+    def set_fraction_done(self, fraction_done: float):
+        with self.__lock:
+            self.fraction_done = min(max(fraction_done, 0.0), 1.0)
+        self.publish()
+
+    def record_page(self, rows: int, size_bytes: int = 0, fraction_done: float = None):
+        """
+        Counts one fetched page. `fraction_done` is the share of the requested range covered so far, when the
+        fetcher can tell, the ETA is otherwise based on the pages left out of `total_pages`.
+        """
+        with self.__lock:
+            self.pages += 1
+            self.rows += rows
+            self.bytes += size_bytes
+            if fraction_done is not None:
+                self.fraction_done = min(max(fraction_done, 0.0), 1.0)
+        SCRAPE_PAGES_TOTAL.inc(source=self.source)
+        SCRAPE_ROWS_TOTAL.inc(rows, source=self.source)
+        SCRAPE_BYTES_TOTAL.inc(size_bytes, source=self.source)
+        self.publish()
+
+    def finish(self):
+        """
+        Records the totals of the run in the per run metrics and returns them.
+        """
+        progress = self.to_dict()
+        SCRAPE_RUN_PAGES.observe(progress['pages'], source=self.source)
+        SCRAPE_RUN_ROWS.observe(progress['rows'], source=self.source)
+        SCRAPE_RUN_BYTES.observe(progress['bytes'], source=self.source)
+        SCRAPE_RUN_DURATION_SECONDS.observe(progress['elapsed_seconds'], source=self.source)
+        return progress
+
+    def get_eta_seconds(self):
+        fraction_done = self.fraction_done
+        if fraction_done is None and self.total_pages:
+            fraction_done = min(self.pages / self.total_pages, 1.0)
+        if not fraction_done:
+            return None
+        elapsed = time.time() - self.started_at
+        return round(elapsed * (1 - fraction_done) / fraction_done, 1)
+
+    def to_dict(self):
+        with self.__lock:
+            return {
+                'pages': self.pages,
+                'rows': self.rows,
+                'bytes': self.bytes,
+                'total_pages': self.total_pages,
+                'fraction_done': self.fraction_done,
+                'elapsed_seconds': round(time.time() - self.started_at, 1),
+                'eta_seconds': self.get_eta_seconds(),
+            }
+
+    def publish(self, force: bool = False):
+        if self.task is None:
+            return
+        now = time.time()
+        with self.__lock:
+            if not force and now - self.__published_at < self.publish_interval_seconds:
+                return
+            self.__published_at = now
+        try:
+            self.task.update_state(state=JOB_PROGRESS_STATE, meta=self.to_dict())
+        except Exception as e:
+            logger.error(f"Error while publishing progress of job {self.task.request.id} with error: {e}")
@@ -0,0 +1,273 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = 'metrics'
+# Samples are summed in process and pushed to redis at most this often, and after every celery task
+METRICS_FLUSH_INTERVAL_SECONDS = 5.0
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DEFAULT_SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsRegistry:
+    """
+    Metrics shared by the web workers and every celery prefork child. Each process sums its samples in memory and
+    a background thread adds them to redis hashes with HINCRBYFLOAT, so the values exposed by any process are the
+    totals across all of them. Redis errors drop the pending samples, they never fail the caller.
+    """
+
+    def __init__(self, flush_interval_seconds: float = METRICS_FLUSH_INTERVAL_SECONDS):
+        self.flush_interval_seconds = flush_interval_seconds
+        self.metrics = {}
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        self.__pid = None
+        self.__flush_thread = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def increment(self, key: str, field: str, amount: float):
+        with self.__lock:
+            if self.__pid != os.getpid():
+                # Samples copied from the parent on fork are the parent's to flush
+                self.__pending = {}
+                self.__pid = os.getpid()
+                self.__flush_thread = threading.Thread(target=self.__run, name='metrics-flush', daemon=True)
+                self.__flush_thread.start()
+            self.__pending[(key, field)] = self.__pending.get((key, field), 0) + amount
+
+    def flush(self):
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+        if not pending:
+            return
+        try:
+            pipeline = get_redis_client().pipeline(transaction=False)
+            for (key, field), amount in pending.items():
+                pipeline.hincrbyfloat(key, field, amount)
+            pipeline.execute()
+        except Exception as e:
+            logger.error(f"Error while flushing {len(pending)} metric samples with error: {e}")
+
+    def __run(self):
+        while True:
+            time.sleep(self.flush_interval_seconds)
+            self.flush()
+
+    def render(self):
+        """
+        All registered metrics in the prometheus text exposition format.
+        """
+        self.flush()
+        redis_client = get_redis_client()
+        pipeline = redis_client.pipeline(transaction=False)
+        metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            pipeline.hgetall(metric.get_key())
+        lines = []
+        for metric, samples in zip(metrics, pipeline.execute()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render(samples))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+atexit.register(REGISTRY.flush)
+
+
+def format_labels(labels: dict):
+    if not labels:
+        return ''
+    rendered = ','.join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items())
+    return '{' + rendered + '}'
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value: float):
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry: MetricsRegistry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def get_key(self):
+        return f'{METRICS_KEY_PREFIX}:{self.name}'
+
+    def get_label_values(self, labels: dict):
+        return [str(labels.get(name, '')) for name in self.labelnames]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        self.registry.increment(self.get_key(), json.dumps(self.get_label_values(labels)), amount)
+
+    def render(self, samples: dict):
+        lines = []
+        for field, value in sorted(samples.items()):
+            labels = dict(zip(self.labelnames, json.loads(field)))
+            lines.append(f'{self.name}{format_labels(labels)} {format_value(float(value))}')
+        return lines
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_LATENCY_BUCKETS,
+                 registry: MetricsRegistry = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        label_values = self.get_label_values(labels)
+        bucket_index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                bucket_index = i
+                break
+        key = self.get_key()
+        self.registry.increment(key, json.dumps([label_values, 'bucket', bucket_index]), 1)
+        self.registry.increment(key, json.dumps([label_values, 'sum']), value)
+        self.registry.increment(key, json.dumps([label_values, 'count']), 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def render(self, samples: dict):
+        series = {}
+        for field, value in samples.items():
+            label_values, sample_type, *bucket_index = json.loads(field)
+            entry = series.setdefault(tuple(label_values), {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0,
+                                                            'count': 0})
+            if sample_type == 'bucket':
+                entry['buckets'][bucket_index[0]] += float(value)
+            else:
+                entry[sample_type] = float(value)
+        lines = []
+        for label_values, entry in sorted(series.items()):
+            labels = dict(zip(self.labelnames, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), entry['buckets']):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else format_value(bound)
+                lines.append(f'{self.name}_bucket{format_labels({**labels, "le": le})} {format_value(cumulative)}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {format_value(entry["sum"])}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {format_value(entry["count"])}')
+        return lines
+
+
+# Outbound API calls
+API_REQUESTS_TOTAL = Counter('scraper_api_requests_total', 'Requests made to source APIs.', ('source', 'status'))
+API_REQUEST_DURATION_SECONDS = Histogram('scraper_api_request_duration_seconds',
+                                         'Latency of requests made to source APIs.', ('source',))
+API_RATE_LIMITED_TOTAL = Counter('scraper_api_rate_limited_total', 'Requests answered with HTTP 429.', ('source',))
+API_BACKOFFS_TOTAL = Counter('scraper_api_backoffs_total', 'Retries taken after a retryable error.', ('source',))
+API_BACKOFF_SECONDS_TOTAL = Counter('scraper_api_backoff_seconds_total', 'Time spent backing off before retries.',
+                                    ('source',))
+
+# Scrape runs
+SCRAPE_PAGES_TOTAL = Counter('scraper_pages_total', 'Pages fetched from source APIs.', ('source',))
+SCRAPE_ROWS_TOTAL = Counter('scraper_rows_total', 'Rows fetched from source APIs.', ('source',))
+SCRAPE_BYTES_TOTAL = Counter('scraper_bytes_total', 'Response bytes fetched from source APIs.', ('source',))
+SCRAPE_RUN_PAGES = Histogram('scraper_run_pages', 'Pages fetched per scrape run.', ('source',),
+                             buckets=DEFAULT_SIZE_BUCKETS)
+SCRAPE_RUN_ROWS = Histogram('scraper_run_rows', 'Rows fetched per scrape run.', ('source',),
+                            buckets=DEFAULT_SIZE_BUCKETS)
+SCRAPE_RUN_BYTES = Histogram('scraper_run_bytes', 'Response bytes fetched per scrape run.', ('source',),
+                             buckets=(10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8, 10 ** 9))
+SCRAPE_RUN_DURATION_SECONDS = Histogram('scraper_run_duration_seconds', 'Duration of scrape runs.', ('source',),
+                                        buckets=(1, 5, 15, 30, 60, 300, 900, 1800, 3600))
+
+# Uploads
+S3_UPLOAD_DURATION_SECONDS = Histogram('scraper_s3_upload_duration_seconds', 'Duration of S3 uploads.',
+                                       ('operation', 'status'))
+
+# Celery
+CELERY_TASK_QUEUE_WAIT_SECONDS = Histogram('scraper_celery_task_queue_wait_seconds',
+                                           'Time tasks spent queued before a worker started them.', ('task',),
+                                           buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600))
+CELERY_TASK_DURATION_SECONDS = Histogram('scraper_celery_task_duration_seconds', 'Run time of celery tasks.',
+                                         ('task',), buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600))
+CELERY_TASKS_TOTAL = Counter('scraper_celery_tasks_total', 'Celery tasks run, by final state.', ('task', 'state'))
+
+# Flask
+HTTP_SERVER_REQUESTS_TOTAL = Counter('scraper_http_server_requests_total', 'Requests served by the Flask app.',
+                                     ('endpoint', 'method', 'status'))
+HTTP_SERVER_REQUEST_DURATION_SECONDS = Histogram('scraper_http_server_request_duration_seconds',
+                                                 'Latency of requests served by the Flask app.', ('endpoint',))
+
+
+def record_api_request(source: str, status, duration_seconds: float):
+    API_REQUESTS_TOTAL.inc(source=source, status=status)
+    API_REQUEST_DURATION_SECONDS.observe(duration_seconds, source=source)
+    if status == 429:
+        API_RATE_LIMITED_TOTAL.inc(source=source)
+
+
+def instrument_flask_app(flask_app):
+    from flask import g, request
+
+    @flask_app.before_request
+    def start_request_timer():
+        g.metrics_started_at = time.perf_counter()
+
+    @flask_app.after_request
+    def record_request_metrics(response):
+        started_at = g.pop('metrics_started_at', None)
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_SERVER_REQUESTS_TOTAL.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        if started_at is not None:
+            HTTP_SERVER_REQUEST_DURATION_SECONDS.observe(time.perf_counter() - started_at, endpoint=endpoint)
+        return response
+
+
+def instrument_celery():
+    from celery.signals import before_task_publish, task_prerun, task_postrun
+
+    @before_task_publish.connect(weak=False)
+    def stamp_enqueued_at(headers=None, **kwargs):
+        if headers is not None:
+            headers['enqueued_at'] = time.time()
+
+    @task_prerun.connect(weak=False)
+    def record_queue_wait(task=None, **kwargs):
+        task.request.metrics_started_at = time.perf_counter()
+        enqueued_at = getattr(task.request, 'enqueued_at', None)
+        if enqueued_at:
+            CELERY_TASK_QUEUE_WAIT_SECONDS.observe(max(time.time() - float(enqueued_at), 0), task=task.name)
+
+    @task_postrun.connect(weak=False)
+    def record_task_run(task=None, state=None, **kwargs):
+        started_at = getattr(task.request, 'metrics_started_at', None)
+        if started_at is not None:
+            CELERY_TASK_DURATION_SECONDS.observe(time.perf_counter() - started_at, task=task.name)
+        CELERY_TASKS_TOTAL.inc(task=task.name, state=state)
+        # Prefork children may be recycled without running atexit hooks
+        REGISTRY.flush()
@@ -0,0 +1,114 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Notifications arriving within this window of the first one are sent as a single digest
+NOTIFICATION_COALESCE_WINDOW_SECONDS = 2.0
+# Slack incoming webhooks allow about one message per second
+NOTIFICATION_MIN_SEND_INTERVAL_SECONDS = 1.0
+# Slack truncates message text past 40k characters and renders long messages poorly, digests are split well before
+NOTIFICATION_MAX_DIGEST_CHARS = 3500
+NOTIFICATION_MAX_SEND_ATTEMPTS = 3
+NOTIFICATION_QUEUE_MAXSIZE = 10000
+NOTIFICATION_SHUTDOWN_TIMEOUT_SECONDS = 10.0
+
+
+class NotificationDispatcher:
+    """
+    Queues notifications and sends them from a background thread, so callers never wait on the network. The
+    notifications of a coalesce window are merged into digests of at most `max_digest_chars`, digests are sent no
+    faster than one per `min_send_interval_seconds` and a failed digest is retried `max_send_attempts` times
+    before it is dropped. `send_digest(text)` returns True once the digest is delivered.
+    """
+
+    def __init__(self, send_digest, coalesce_window_seconds: float = NOTIFICATION_COALESCE_WINDOW_SECONDS,
+                 min_send_interval_seconds: float = NOTIFICATION_MIN_SEND_INTERVAL_SECONDS,
+                 max_digest_chars: int = NOTIFICATION_MAX_DIGEST_CHARS,
+                 max_send_attempts: int = NOTIFICATION_MAX_SEND_ATTEMPTS):
+        self.send_digest = send_digest
+        self.coalesce_window_seconds = coalesce_window_seconds
+        self.min_send_interval_seconds = min_send_interval_seconds
+        self.max_digest_chars = max_digest_chars
+        self.max_send_attempts = max_send_attempts
+        self.__queue = queue.Queue(maxsize=NOTIFICATION_QUEUE_MAXSIZE)
+        self.__last_sent_at = 0
+        self.__thread = threading.Thread(target=self.__run, name='notification-dispatcher', daemon=True)
+        self.__thread.start()
+        atexit.register(self.close)
+
+    def publish(self, message_text: str):
+        try:
+            self.__queue.put_nowait(message_text)
+        except queue.Full:
+            logger.error(f"Notification queue full, dropping notification: {message_text}")
+
+    def close(self, timeout: float = NOTIFICATION_SHUTDOWN_TIMEOUT_SECONDS):
+        """
+        Sends what is still queued, waiting at most `timeout` seconds.
+        """
+        if not self.__thread.is_alive():
+            return
+        try:
+            self.__queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error(f"Notification queue full, {self.__queue.qsize()} notifications may not be sent")
+            return
+        self.__thread.join(timeout)
+
+    def __run(self):
+        closed = False
+        while not closed:
+            message_text = self.__queue.get()
+            if message_text is None:
+                break
+            messages = [message_text]
+            deadline = time.monotonic() + self.coalesce_window_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    message_text = self.__queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if message_text is None:
+                    closed = True
+                    break
+                messages.append(message_text)
+            for digest in self.build_digests(messages):
+                self.__send(digest)
+
+    def build_digests(self, messages: list):
+        digests = []
+        digest_lines = []
+        digest_length = 0
+        for message_text in messages:
+            if digest_lines and digest_length + len(message_text) + 1 > self.max_digest_chars:
+                digests.append('\n'.join(digest_lines))
+                digest_lines = []
+                digest_length = 0
+            digest_lines.append(message_text)
+            digest_length += len(message_text) + 1
+        if digest_lines:
+            digests.append('\n'.join(digest_lines))
+        return digests
+
+    def __send(self, digest: str):
+        for attempt in range(self.max_send_attempts):
+            wait = self.__last_sent_at + self.min_send_interval_seconds - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.__last_sent_at = time.monotonic()
+            try:
+                if self.send_digest(digest):
+                    return True
+            except Exception as e:
+                logger.error(f"Exception occurred while sending notification digest with error: {e}")
+            # Back off a little more on every failed attempt, on top of the send interval
+            time.sleep(self.min_send_interval_seconds * (2 ** attempt))
+        logger.error(f"Dropping notification digest after {self.max_send_attempts} attempts: {digest}")
+        return False
@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.tracing import bind_current_span
+
+
+class PaginationStrategy:
+    """
+    Tells a Paginator which page to request first and, from a page, which one comes next. Requests are whatever the
+    fetch function of the paginator takes: a cursor, a url, a page number or a page token.
+    """
+
+    def get_first_request(self):
+        raise NotImplementedError
+
+    def get_next_request(self, request, page):
+        """
+        The request of the page after `page`, fetched with `request`. None when `page` is the last one.
+        """
+        raise NotImplementedError
+
+
+class CursorStrategy(PaginationStrategy):
+    """
+    Slack style cursors, `get_cursor` reads the cursor of the next page off a page, empty on the last one.
+    """
+
+    def __init__(self, get_cursor):
+        self.get_cursor = get_cursor
+
+    def get_first_request(self):
+        return None
+
+    def get_next_request(self, request, page):
+        return self.get_cursor(page) or None
+
+
+class LinkHeaderStrategy(PaginationStrategy):
+    """
+    RFC 5988 `Link` headers of requests responses, Sentry style: the next link is always sent and carries
+    results="false" on the last page.
+    """
+
+    def __init__(self, first_url: str):
+        self.first_url = first_url
+
+    def get_first_request(self):
+        return self.first_url
+
+    def get_next_request(self, request, page):
+        next_link = page.links.get('next') if page.links else None
+        if not next_link or next_link.get('results', 'true') == 'false':
+            return None
+        return next_link.get('url')
+
+
+class PageNumberStrategy(PaginationStrategy):
+    """
+    Numbered pages, New Relic style: pages start_page, start_page + 1, ... until an empty page or max_pages pages.
+    `get_items` reads the rows off a page.
+    """
+
+    def __init__(self, get_items, max_pages: int, start_page: int = 1):
+        self.get_items = get_items
+        self.max_pages = max_pages
+        self.start_page = start_page
+
+    def get_first_request(self):
+        return self.start_page
+
+    def get_next_request(self, request, page):
+        if not self.get_items(page) or request + 1 >= self.start_page + self.max_pages:
+            return None
+        return request + 1
+
+
+class PageTokenStrategy(PaginationStrategy):
+    """
+    Google API style `nextPageToken` in the response body, absent on the last page.
+    """
+
+    def get_first_request(self):
+        return ''
+
+    def get_next_request(self, request, page):
+        return page.get('nextPageToken') or None
+
+
+class Paginator:
+    """
+    Iterates over the pages of a paginated API. `fetch_page(request)` returns a page, or None to stop, typically
+    once request_with_retry gave up. With `prefetch`, page N + 1 is requested on a background thread as soon as
+    page N arrived, so the network time of the next page overlaps the processing of the current one. At most one
+    page is fetched ahead, a consumer breaking out of the loop only waits for that page to arrive.
+    """
+
+    def __init__(self, fetch_page, strategy: PaginationStrategy, prefetch: bool = True):
+        self.fetch_page = fetch_page
+        self.strategy = strategy
+        self.prefetch = prefetch
+        # True once fetch_page gave up on a page, as opposed to the last page being reached or the consumer stopping
+        self.failed = False
+
+    def __iter__(self):
+        if not self.prefetch:
+            yield from self.__iter_serially()
+            return
+        # Spans of the prefetched fetches belong to the span the pages are iterated in
+        fetch_page = bind_current_span(self.fetch_page)
+        request = self.strategy.get_first_request()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='paginator')
+        future = executor.submit(fetch_page, request)
+        try:
+            while future is not None:
+                page = future.result()
+                future = None
+                if page is None:
+                    self.failed = True
+                    return
+                request = self.strategy.get_next_request(request, page)
+                if request is not None:
+                    future = executor.submit(fetch_page, request)
+                yield page
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def __iter_serially(self):
+        request = self.strategy.get_first_request()
+        while True:
+            page = self.fetch_page(request)
+            if page is None:
+                self.failed = True
+                return
+            yield page
+            request = self.strategy.get_next_request(request, page)
+            if request is None:
+                return
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from env_vars import PROFILING_ENABLED, PROFILE_EXPORT_DIR, PUSH_TO_S3
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.01
+PROFILE_TRACEMALLOC_FRAMES = 25
+PROFILE_TOP_ALLOCATIONS = 25
+PROFILE_MAX_STACK_DEPTH = 128
+
+
+def get_current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_peak_rss_bytes():
+    # ru_maxrss is in kilobytes on linux and bytes on macOS, it covers the whole life of the process
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread of the process, except its own, every `interval_seconds` and counts them in
+    the folded format read by flamegraph.pl and speedscope. The current RSS is sampled alongside to get the peak
+    of the run rather than of the whole process.
+    """
+
+    def __init__(self, interval_seconds: float = PROFILE_SAMPLE_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self.peak_rss_bytes = get_current_rss_bytes()
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__stopped.set()
+        self.__thread.join()
+
+    def __run(self):
+        own_thread_id = threading.get_ident()
+        while not self.__stopped.wait(self.interval_seconds):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            rss_bytes = get_current_rss_bytes()
+            if rss_bytes and (self.peak_rss_bytes is None or rss_bytes > self.peak_rss_bytes):
+                self.peak_rss_bytes = rss_bytes
+
+    def to_folded(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+
+class ProfileRun:
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self.profiler = SamplingProfiler()
+        self.summary = None
+        self.file_paths = []
+
+
+def get_top_allocations(snapshot, limit: int = PROFILE_TOP_ALLOCATIONS):
+    top_allocations = []
+    for statistic in snapshot.statistics('traceback')[:limit]:
+        top_allocations.append({
+            'size_bytes': statistic.size,
+            'count': statistic.count,
+            'traceback': [f'{frame.filename}:{frame.lineno}' for frame in statistic.traceback],
+        })
+    return top_allocations
+
+
+def export_profile_run(run: ProfileRun, s3_bucket_name: str = None):
+    file_prefix = f"{run.name}-{datetime.utcfromtimestamp(run.started_at):%Y%m%dT%H%M%S}-{os.getpid()}"
+    os.makedirs(PROFILE_EXPORT_DIR, exist_ok=True)
+    folded_file_path = os.path.join(PROFILE_EXPORT_DIR, f'{file_prefix}.folded')
+    summary_file_path = os.path.join(PROFILE_EXPORT_DIR, f'{file_prefix}-summary.json')
+    with open(folded_file_path, 'w') as f:
+        f.write(run.profiler.to_folded())
+    with open(summary_file_path, 'w') as f:
+        json.dump(run.summary, f, indent=2, default=str)
+    run.file_paths = [folded_file_path, summary_file_path]
+    if PUSH_TO_S3 and s3_bucket_name:
+        from utils.publishsing_client import publish_object_file_to_s3
+        for file_path in run.file_paths:
+            publish_object_file_to_s3(file_path, s3_bucket_name, f'profiles/{os.path.basename(file_path)}')
+
+
+@contextmanager
+def profile_run(name: str, enabled: bool = False, s3_bucket_name: str = None):
+    """
+    Profiles the block when `enabled` or PROFILING_ENABLED: a sampling CPU profile in folded format and a summary
+    with the duration, peak RSS, tracemalloc peak and top allocation sites, written to PROFILE_EXPORT_DIR and, when
+    pushing to S3, to `profiles/` in `s3_bucket_name` next to the exported data. Yields the ProfileRun, or None
+    when profiling is off.
+    """
+    if not (enabled or PROFILING_ENABLED):
+        yield None
+        return
+    run = ProfileRun(name)
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    run.profiler.start()
+    try:
+        yield run
+    finally:
+        run.profiler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        _, traced_peak_bytes = tracemalloc.get_traced_memory()
+        if started_tracemalloc:
+            tracemalloc.stop()
+        run.summary = {
+            'name': name,
+            'pid': os.getpid(),
+            'started_at': datetime.utcfromtimestamp(run.started_at).isoformat(),
+            'duration_seconds': round(time.time() - run.started_at, 3),
+            'cpu_samples': run.profiler.samples,
+            'sample_interval_seconds': run.profiler.interval_seconds,
+            'run_peak_rss_bytes': run.profiler.peak_rss_bytes,
+            'process_peak_rss_bytes': get_peak_rss_bytes(),
+            'tracemalloc_peak_bytes': traced_peak_bytes,
+            'top_allocations': get_top_allocations(snapshot),
+        }
+        try:
+            export_profile_run(run, s3_bucket_name)
+            logger.info(f"Profile of {name} written to {run.file_paths}")
+        except Exception as e:
+            logger.error(f"Error while exporting profile of {name} with error: {e}")
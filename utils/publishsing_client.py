@@ -1,17 +1,54 @@
 import json
 import logging
-
-import boto3
-import requests
+import os
+import threading
+import time
 
 from env_vars import SLACK_URL, AWS_ACCESS_KEY, AWS_SECRET_KEY
+from utils.http_client import get_http_session
+from utils.metrics import S3_UPLOAD_DURATION_SECONDS
+from utils.notification_dispatcher import NotificationDispatcher
+from utils.tracing import start_span
 
 logger = logging.getLogger(__name__)
 
-s3 = boto3.client('s3', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_KEY)
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    # boto3 takes a long time to import and to build a client, both are deferred to the first upload
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            import boto3
+            _s3_client = boto3.client('s3', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_KEY)
+        return _s3_client
+
+
+_slack_notification_dispatcher = None
+_slack_notification_dispatcher_lock = threading.Lock()
+_slack_notification_dispatcher_pid = None
+
+
+def get_slack_notification_dispatcher():
+    # The dispatcher thread does not survive a fork, every process starts its own on first use
+    global _slack_notification_dispatcher, _slack_notification_dispatcher_pid
+    with _slack_notification_dispatcher_lock:
+        if _slack_notification_dispatcher is None or _slack_notification_dispatcher_pid != os.getpid():
+            _slack_notification_dispatcher = NotificationDispatcher(send_message_to_slack)
+            _slack_notification_dispatcher_pid = os.getpid()
+        return _slack_notification_dispatcher
 
 
 def publish_message_to_slack(message_text):
+    """
+    Queues message_text for the ops slack webhook and returns immediately, see NotificationDispatcher.
+    """
+    get_slack_notification_dispatcher().publish(message_text)
+
+
+def send_message_to_slack(message_text):
     url = SLACK_URL
     payload = json.dumps({
         "text": message_text,
@@ -20,21 +57,31 @@ def publish_message_to_slack(message_text):
         'Content-type': 'application/json'
     }
     try:
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = get_http_session(url).post(url, headers=headers, data=payload)
         logger.info(f"Response from slack: {response.status_code}:{response.text}")
+        return response.status_code < 400
     except Exception as e:
         print(f"Exception occurred while publishing message to slack with error: {e}")
+    return False
 
 
 def publish_json_blob_to_s3(key: str, bucket_name, json_blob: str):
+    started_at = time.perf_counter()
     try:
-        s3.put_object(Body=json_blob, Bucket=bucket_name, Key=key)
+        with start_span('upload', operation='put_object', key=key):
+            get_s3_client().put_object(Body=json_blob, Bucket=bucket_name, Key=key)
+        S3_UPLOAD_DURATION_SECONDS.observe(time.perf_counter() - started_at, operation='put_object', status='success')
     except Exception as e:
+        S3_UPLOAD_DURATION_SECONDS.observe(time.perf_counter() - started_at, operation='put_object', status='error')
         print(f"Exception occurred while publishing json blob: {json_blob} to s3 with error: {e}")
 
 
 def publish_object_file_to_s3(file_path: str, bucket_name, object_key: str):
+    started_at = time.perf_counter()
     try:
-        s3.upload_file(file_path, bucket_name, object_key)
+        with start_span('upload', operation='upload_file', key=object_key):
+            get_s3_client().upload_file(file_path, bucket_name, object_key)
+        S3_UPLOAD_DURATION_SECONDS.observe(time.perf_counter() - started_at, operation='upload_file', status='success')
     except Exception as e:
+        S3_UPLOAD_DURATION_SECONDS.observe(time.perf_counter() - started_at, operation='upload_file', status='error')
         print(f"Exception occurred while publishing file: {file_path} to s3 with error: {e}")
@@ -0,0 +1,15 @@
+import redis
+
+from env_vars import REDIS_URL
+
+_redis_client = None
+
+
+def get_redis_client():
+    """
+    Returns the redis client of this process. The underlying connection pool is fork safe.
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis_client
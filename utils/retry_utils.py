@@ -0,0 +1,159 @@
+import logging
+import random
+import threading
+import time
+from enum import Enum
+from http.client import IncompleteRead
+
+import requests
+from slack_sdk.errors import SlackApiError
+
+from utils.metrics import record_api_request, API_BACKOFFS_TOTAL, API_BACKOFF_SECONDS_TOTAL
+from utils.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONSECUTIVE_RETRIES = 5
+DEFAULT_RETRY_BUDGET = 30
+DEFAULT_BASE_DELAY_SECONDS = 1.0
+DEFAULT_MAX_DELAY_SECONDS = 60.0
+
+SLACK_FATAL_ERRORS = ('invalid_auth', 'not_authed', 'account_inactive', 'token_revoked', 'token_expired',
+                      'no_permission', 'missing_scope', 'channel_not_found', 'not_in_channel',
+                      'team_access_not_granted')
+SLACK_AUTH_ERRORS = ('invalid_auth', 'not_authed', 'account_inactive', 'token_revoked', 'token_expired')
+AUTH_HTTP_STATUSES = (401, 403)
+
+
+class ErrorClass(Enum):
+    RETRYABLE = 0
+    FATAL = 1
+
+
+def classify_http_status(status_code: int):
+    if status_code == 429 or status_code >= 500:
+        return ErrorClass.RETRYABLE
+    # 401, 403, 404 and every other client error fail the same way on every retry
+    return ErrorClass.FATAL
+
+
+def classify_exception(e: Exception):
+    if isinstance(e, SlackApiError):
+        error = e.response.get('error') if e.response is not None else None
+        if error in SLACK_FATAL_ERRORS:
+            return ErrorClass.FATAL
+        if e.response is not None and e.response.status_code:
+            return classify_http_status(e.response.status_code)
+        return ErrorClass.RETRYABLE
+    if isinstance(e, (IncompleteRead, requests.exceptions.ConnectionError, requests.exceptions.Timeout, OSError)):
+        return ErrorClass.RETRYABLE
+    return ErrorClass.FATAL
+
+
+def is_auth_error(error):
+    """
+    True when the fatal error of a run means the credential itself is no longer valid.
+    """
+    if isinstance(error, SlackApiError):
+        return error.response is not None and error.response.get('error') in SLACK_AUTH_ERRORS
+    if isinstance(error, requests.Response):
+        return error.status_code in AUTH_HTTP_STATUSES
+    return False
+
+
+def get_retry_after(headers):
+    if not headers:
+        return None
+    retry_after = headers.get('Retry-After') or headers.get('retry-after')
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Retry state of a single scrape run. Retryable errors back off exponentially with full jitter, bounded by
+    `max_consecutive_retries` per call and `retry_budget` across the run. A fatal error aborts the run, every
+    worker sharing the policy stops at its next call. `source` labels the metrics of the calls made under the policy.
+    """
+
+    def __init__(self, max_consecutive_retries: int = DEFAULT_MAX_CONSECUTIVE_RETRIES,
+                 retry_budget: int = DEFAULT_RETRY_BUDGET, base_delay_seconds: float = DEFAULT_BASE_DELAY_SECONDS,
+                 max_delay_seconds: float = DEFAULT_MAX_DELAY_SECONDS, source: str = 'unknown'):
+        self.source = source
+        self.max_consecutive_retries = max_consecutive_retries
+        self.retry_budget = retry_budget
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.retries_used = 0
+        self.fatal_error = None
+        self.__lock = threading.Lock()
+
+    @property
+    def aborted(self):
+        return self.fatal_error is not None
+
+    def abort(self, error):
+        with self.__lock:
+            if self.fatal_error is None:
+                self.fatal_error = error
+
+    def get_delay(self, attempt: int, retry_after: float = None):
+        delay = random.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def backoff(self, attempt: int, retry_after: float = None):
+        """
+        Sleeps before retry number `attempt` (0 based) of a call. Returns False, without sleeping, when the call or
+        the run is out of retries or the run has been aborted.
+        """
+        with self.__lock:
+            if self.aborted or attempt >= self.max_consecutive_retries or self.retries_used >= self.retry_budget:
+                return False
+            self.retries_used += 1
+        delay = self.get_delay(attempt, retry_after)
+        API_BACKOFFS_TOTAL.inc(source=self.source)
+        API_BACKOFF_SECONDS_TOTAL.inc(delay, source=self.source)
+        logger.info(f"Backing off for {delay:.2f}s, retry {self.retries_used}/{self.retry_budget} of this run")
+        with start_span('backoff', source=self.source, attempt=attempt, delay_seconds=round(delay, 3)):
+            time.sleep(delay)
+        return True
+
+
+def request_with_retry(session: requests.Session, method: str, url: str, retry_policy: RetryPolicy, **kwargs):
+    """
+    Makes a request under `retry_policy`. Returns the response once it is successful, None when the error is fatal,
+    the retries are exhausted or the run was aborted.
+    """
+    attempt = 0
+    while not retry_policy.aborted:
+        started_at = time.perf_counter()
+        try:
+            with start_span('page_fetch', source=retry_policy.source, method=method, url=url.split('?')[0],
+                            attempt=attempt) as span:
+                response = session.request(method, url, **kwargs)
+                span.set_attribute('status_code', response.status_code)
+        except Exception as e:
+            record_api_request(retry_policy.source, 'error', time.perf_counter() - started_at)
+            if classify_exception(e) == ErrorClass.FATAL:
+                retry_policy.abort(e)
+                return None
+            logger.error(f"Retryable error while requesting {url}: {e}")
+            if not retry_policy.backoff(attempt):
+                return None
+            attempt += 1
+            continue
+        record_api_request(retry_policy.source, response.status_code, time.perf_counter() - started_at)
+        if response.status_code < 400:
+            return response
+        print(f"Error: {response.status_code}, {response.text}")
+        if classify_http_status(response.status_code) == ErrorClass.FATAL:
+            retry_policy.abort(response)
+            return None
+        if not retry_policy.backoff(attempt, get_retry_after(response.headers)):
+            return None
+        attempt += 1
+    return None
@@ -0,0 +1,166 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from env_vars import TRACING_ENABLED, TRACE_EXPORT_DIR
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.start_time = time.time()
+        self.duration_seconds = None
+        self.__started_at = time.perf_counter()
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, error: Exception):
+        self.status = 'error'
+        self.attributes['error'] = f'{type(error).__name__}: {error}'
+
+    def end(self):
+        self.duration_seconds = time.perf_counter() - self.__started_at
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'duration_ms': round(self.duration_seconds * 1000, 3) if self.duration_seconds is not None else None,
+            'status': self.status,
+            'attributes': self.attributes,
+            'pid': os.getpid(),
+        }
+
+
+class NoopSpan:
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_error(self, error: Exception):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class JsonlSpanExporter:
+    """
+    Appends every finished span as one JSON line to `<export_dir>/spans-<date>-<pid>.jsonl`. One file per process,
+    so prefork children never interleave their writes. Export errors are logged and never fail the traced code.
+    """
+
+    def __init__(self, export_dir: str):
+        self.export_dir = export_dir
+        self.__lock = threading.Lock()
+
+    def get_file_path(self):
+        return os.path.join(self.export_dir, f'spans-{datetime.utcnow():%Y-%m-%d}-{os.getpid()}.jsonl')
+
+    def export(self, span: Span):
+        try:
+            line = json.dumps(span.to_dict(), default=str)
+            with self.__lock:
+                os.makedirs(self.export_dir, exist_ok=True)
+                with open(self.get_file_path(), 'a') as f:
+                    f.write(line + '\n')
+        except Exception as e:
+            logger.error(f"Error while exporting span {span.name} with error: {e}")
+
+
+_exporter = JsonlSpanExporter(TRACE_EXPORT_DIR)
+
+
+def set_exporter(exporter):
+    global _exporter
+    _exporter = exporter
+
+
+@contextmanager
+def start_span(name: str, trace_context: dict = None, **attributes):
+    """
+    Runs the block in a span, child of the current span or of the span described by `trace_context`, as returned
+    by get_trace_context in another process. The span is exported when the block exits.
+    """
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    if trace_context and trace_context.get('trace_id'):
+        trace_id, parent_id = trace_context['trace_id'], trace_context.get('span_id')
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    span = Span(name, trace_id, parent_id, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        _exporter.export(span)
+
+
+def traced(name: str):
+    """
+    Decorator running every call of the function in a span called `name`.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with start_span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_trace_context():
+    """
+    The ids of the current span, to continue its trace in another process, None outside of a span.
+    """
+    span = _current_span.get()
+    if span is None:
+        return None
+    return {'trace_id': span.trace_id, 'span_id': span.span_id}
+
+
+def bind_current_span(function):
+    """
+    Wraps function so that it runs under the span current at wrap time, for work handed to a thread pool.
+    """
+    span = _current_span.get()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current_span.set(span)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return wrapper